@@ -406,6 +406,8 @@ int QuicToyClient::SendRequestsAndPrintResponses(
     std::cerr << "Failed to initialize client." << std::endl;
     return 1;
   }
+  // Start the timer of the connection phases.
+  auto connect_start = std::chrono::high_resolution_clock::now();
   if (!client->Connect()) {
     quic::QuicErrorCode error = client->session()->error();
     if (error == quic::QUIC_INVALID_VERSION) {
@@ -422,6 +424,10 @@ int QuicToyClient::SendRequestsAndPrintResponses(
     return 1;
   }
 
+  // The QUIC handshake also establishes the connection.
+  std::chrono::duration<double> handshake_s =
+      std::chrono::high_resolution_clock::now() - connect_start;
+
   std::cout << "Connected to " << host << ":" << port;
   if (quiche::GetQuicheCommandLineFlag(FLAGS_output_resolved_server_address)) {
     std::cout << ", resolved IP " << client->server_address().host().ToString();
@@ -544,6 +550,13 @@ int QuicToyClient::SendRequestsAndPrintResponses(
     // Log the result for the mininet benchmarks.
     std::cerr << "[QUIC_CLIENT] status_code=" << response_code
               << " time_s=" << time_s << std::endl;
+    std::chrono::duration<double> request_s = start - connect_start;
+    std::chrono::duration<double> last_byte_s = end - connect_start;
+    std::cerr << "[TIMING] connect_s=" << handshake_s.count()
+              << " handshake_s=" << handshake_s.count() << " first_byte_s="
+              << request_s.count() +
+                     client->latest_ttfb().ToMicroseconds() / 1e6
+              << " last_byte_s=" << last_byte_s.count() << std::endl;
 
     if (i + 1 < num_requests) {  // There are more requests to perform.
       if (quiche::GetQuicheCommandLineFlag(FLAGS_one_connection_per_request)) {
@@ -1,17 +1,94 @@
+import os
+import shutil
+import tempfile
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
 import mininet
 
-from network import EmulatedNetwork
+from network import EmulatedNetwork, ProgressSampler
+from benchmark.agent import ClientAgent
+from progress import ProgressMonitor, parse_progress
+from qlog import summarize_qlog
 from result import BenchmarkResult
 from common import *
 
 
+@dataclass
+class TrialOptions:
+    """
+    Options of how each trial of a benchmark is run and measured, which are
+    the same for all trials of a run.
+
+    Attributes:
+    - timeout: If provided, the number of seconds to wait for each client
+      to complete its request.
+    - network_statistics: Whether to collect network statistics, i.e., the
+      number of bytes and packets that were sent and received at each
+      interface, of the most recent trial.
+    - telemetry_interval: If provided, samples the interface counters and
+      queue statistics of the network emulation nodes every this many ms
+      during each trial, and adds them to the additional data of the trial.
+    - tcp_info_interval: If provided, samples the TCP_INFO of the
+      connections on the hosts in tcp_info_hosts() every this many ms
+      during each trial, and adds them and the overhead of sampling to the
+      additional data of the trial.
+    - capture_snaplen: If provided, captures this many bytes of every
+      packet on the primary interfaces during each trial, and adds the
+      per-flow goodput, retransmissions, and RTT samples, and the one-way
+      delays across the network emulation nodes, to the additional data
+      of the trial.
+    - keep_pcap: Whether to also keep the raw captures of each trial in
+      the pcap directory in the log directory, instead of discarding them.
+    - min_trials: With <ci_target>, the minimum number of trials (default:
+      MIN_ADAPTIVE_TRIALS).
+    - ci_target: If provided, stops running trials once the half-width of
+      the 95% confidence interval of the median throughput is at most this
+      fraction of the median, e.g., 0.05. The stopping decision is
+      recorded in the inputs of the result.
+    - early_abort: With <timeout>, whether to abort each trial as soon as
+      the byte progress of the client shows it is certain to miss the
+      timeout. The trial is recorded as a timeout with its progress,
+      including its partial throughput.
+    - steady_state: Whether to record the receive progress of the client
+      during each trial, and derive the goodput in steady state, i.e.,
+      excluding the startup phase, and when steady state starts.
+    - steady_state_duration: If provided, ends each transfer once it has
+      been in steady state for this many seconds, and records the trial as
+      a success with the throughput of the bytes received. Implies
+      <steady_state>.
+    - client_agent: Whether to run the requests of all trials in one
+      long-lived client process, if supported, instead of a new process
+      per trial, so that trials do not include the process startup.
+    """
+    timeout: Optional[int] = None
+    network_statistics: bool = False
+    telemetry_interval: Optional[float] = None
+    tcp_info_interval: Optional[float] = None
+    capture_snaplen: Optional[int] = None
+    keep_pcap: bool = False
+    min_trials: Optional[int] = None
+    ci_target: Optional[float] = None
+    early_abort: bool = False
+    steady_state: bool = False
+    steady_state_duration: Optional[float] = None
+    client_agent: bool = False
+
+
 class Benchmark(ABC):
+    # Whether the implementation can write qlog files
+    QLOG_SUPPORTED = False
+    # Whether the client can report its byte progress in PROGRESS_PREFIX lines,
+    # otherwise the progress is sampled from the bytes received by the client
+    PROGRESS_SUPPORTED = False
+    # Whether the implementation can offload TLS to the kernel
+    KTLS_SUPPORTED = False
+
     def __init__(
         self, net: EmulatedNetwork, protocol: Protocol, label: str,
         logdir: str, n: str, cca: str, certfile: str, keyfile: str, pep: bool,
+        qlog: bool=False, ktls: bool=False,
     ):
         """
         File download benchmark where the HTTP client on the h1 host requests
@@ -34,6 +111,13 @@ class Benchmark(ABC):
         - certfile: Path to the TLS/SSL certificate file.
         - keyfile: Path to the TLS/SSL key file.
         - pep: Whether to start a TCP connection-splitting PEP on p1.
+        - qlog: Whether the client and server write qlog files to the qlog
+          directory in the log directory, if the implementation supports it.
+          The congestion control time series of the files written during each
+          trial are added to the additional data of the trial.
+        - ktls: Whether the client and server offload TLS record encryption
+          to the kernel, if the implementation and host support it. Whether
+          the offload was active is recorded in the result inputs.
         """
         self.net = net
         self.protocol = protocol
@@ -44,6 +128,79 @@ class Benchmark(ABC):
         self.certfile = certfile
         self.keyfile = keyfile
         self.pep = pep
+        self.server_process = None
+        self.num_captures = 0
+        self.progress = None
+        self.phases = None
+        self.client_io = None
+        self.agent = None
+        self._sink_dir = None
+
+        if qlog and not self.QLOG_SUPPORTED:
+            WARN(f'{protocol.name} does not support qlog')
+            qlog = False
+        self.qlog = qlog
+
+        if ktls and not self.KTLS_SUPPORTED:
+            WARN(f'{protocol.name} does not support kTLS')
+            ktls = False
+        self.ktls = ktls
+        self.ktls_state = {}
+        self.qlog_files = set()
+        if qlog:
+            shutil.rmtree(self.qlog_dir, ignore_errors=True)
+            os.makedirs(self.qlog_dir)
+
+    @property
+    def qlog_dir(self) -> str:
+        return os.path.abspath(f'{self.logdir}/qlog')
+
+    def collect_qlogs(self) -> List[dict]:
+        """Summarize the qlog files written since the last call, e.g., by the
+        client and server during a trial.
+        """
+        summaries = []
+        for filename in sorted(os.listdir(self.qlog_dir)):
+            if filename in self.qlog_files:
+                continue
+            self.qlog_files.add(filename)
+            summary = summarize_qlog(f'{self.qlog_dir}/{filename}')
+            if summary is not None:
+                summaries.append(summary)
+        return summaries
+
+    @property
+    def sink_dir(self) -> str:
+        """A directory on tmpfs for the client to save its downloads to, so
+        that its receive path never writes to disk.
+        """
+        if self._sink_dir is None:
+            tmpfs = TMPFS_DIR
+            if not os.path.isdir(tmpfs):
+                WARN(f'{tmpfs} does not exist, the client may write to disk')
+                tmpfs = None
+            self._sink_dir = tempfile.mkdtemp(prefix='client-', dir=tmpfs)
+        return self._sink_dir
+
+    def clear_sink_dir(self) -> int:
+        """Remove the downloads in the sink directory, e.g., after a trial.
+        Returns their total size in bytes.
+        """
+        if self._sink_dir is None:
+            return 0
+        num_bytes = 0
+        for dirpath, _, filenames in os.walk(self._sink_dir, topdown=False):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                num_bytes += os.path.getsize(path)
+                os.remove(path)
+            if dirpath != self._sink_dir:
+                os.rmdir(dirpath)
+        return num_bytes
+
+    @property
+    def pcap_dir(self) -> str:
+        return f'{self.logdir}/pcap'
 
     def logfile(self, host: mininet.node.Host) -> Optional[str]:
         """Path to the logfile for this host. The logs are written to the
@@ -54,7 +211,7 @@ class Benchmark(ABC):
             return f'{self.logdir}/{SERVER_LOGFILE}'
         elif host == self.client:
             return f'{self.logdir}/{CLIENT_LOGFILE}'
-        elif host == self.proxy and self.proxy is not None:
+        elif self.proxy is not None and host == self.proxy:
             return f'{self.logdir}/{ROUTER_LOGFILE}'
 
     @property
@@ -65,6 +222,27 @@ class Benchmark(ABC):
     def client(self):
         return self.net.h1
 
+    @property
+    def proxy(self):
+        """The router running the TCP PEP, if enabled."""
+        return self.net.r1 if self.pep else None
+
+    def parse_ktls(self, line: str, role: str):
+        """Record the kTLS state in a '[KTLS] tx=<0|1> rx=<0|1>' line of the
+        client or server output, e.g., {'server_tx': True, 'server_rx': False}.
+        """
+        if not line.startswith('[KTLS]'):
+            return
+        for kv in line.split()[1:]:
+            key, value = kv.split('=')
+            self.ktls_state[f'{role}_{key}'] = value == '1'
+
+    def tcp_info_hosts(self) -> list:
+        """The hosts whose TCP connections of the benchmark can be traced. No
+        hosts by default, e.g., for QUIC.
+        """
+        return []
+
     @abstractmethod
     def start_server(self, timeout: int=SETUP_TIMEOUT):
         """Start the HTTP server on the h2 host and write output to a logfile.
@@ -77,6 +255,93 @@ class Benchmark(ABC):
         """
         pass
 
+    def stop_server(self):
+        """Stop the HTTP server on the h2 host, if it has been started, e.g.,
+        to start a server with a different configuration on the same network.
+        """
+        if self.server_process is None:
+            return
+        p, thread = self.server_process
+        p.terminate()
+        p.wait()
+        thread.join()
+        self.server_process = None
+
+    def agent_cmd(self) -> Optional[str]:
+        """The command that starts a ClientAgent for the client on the h1
+        host, or None if the client cannot run as an agent.
+        """
+        return None
+
+    def stop_agent(self):
+        """Stop the client agent, if it is running."""
+        if self.agent is not None:
+            self.agent.stop()
+            self.agent = None
+
+    def popen_client(self, cmd: str, func, timeout: Optional[int]=None,
+                     request: Optional[str]=None, **kwargs) -> bool:
+        """
+        Run the client command synchronously on the h1 host, logging to its
+        logfile and calling <func> on every line of output other than progress
+        lines. Takes the same keyword arguments as EmulatedNetwork.popen().
+
+        The phases of the download, if the client reports them in a
+        TIMING_PREFIX line, are stored in <phases>, and the I/O counters of
+        the client process are added to <client_io>.
+
+        If the client agent is running, sends it the <request> arguments
+        instead of running <cmd> in a new process.
+
+        If the trial has a progress monitor, feeds it the byte progress of the
+        client and terminates the client once it is certain to miss the
+        timeout, which counts as a timeout.
+
+        Returns:
+        - True if there was a timeout and False otherwise.
+        """
+        monitor = self.progress
+        sampler = None
+        if monitor is not None and not self.PROGRESS_SUPPORTED:
+            sampler = ProgressSampler(self.client, monitor)
+            sampler.start()
+
+        def parse_line(line):
+            phases = parse_phases(line)
+            if phases is not None:
+                self.phases = phases
+            progress = parse_progress(line)
+            if progress is None:
+                func(line)
+            elif monitor is not None:
+                monitor.update(*progress)
+
+        io = {}
+        try:
+            if self.agent is not None and request is not None:
+                return self.agent.request(request, parse_line, timeout=timeout,
+                    abort=None if monitor is None else monitor.abort, io=io)
+            return self.net.popen(self.client, cmd, background=False,
+                console_logger=DEBUG, logfile=self.logfile(self.client),
+                func=parse_line, timeout=timeout,
+                abort=None if monitor is None else monitor.abort, io=io,
+                **kwargs)
+        finally:
+            if sampler is not None:
+                sampler.stop()
+            self.add_client_io(io)
+
+    def add_client_io(self, io: Optional[dict]):
+        """Add the I/O counters of a client process in /proc/<pid>/io, if
+        available, to those of the trial.
+        """
+        if not io:
+            return
+        if self.client_io is None:
+            self.client_io = {}
+        for key, value in io.items():
+            self.client_io[key] = self.client_io.get(key, 0) + value
+
     @abstractmethod
     def run_client(
         self, timeout: Optional[int]=None,
@@ -88,6 +353,8 @@ class Benchmark(ABC):
         - timeout: If provided, the number of seconds to wait for the client
           to complete its request.
 
+        Runs the client with popen_client() to support early aborts.
+
         Returns:
         - If there is an error that is not a timeout, returns None.
         - The HTTP status code and the total runtime, in seconds, of the GET
@@ -96,9 +363,14 @@ class Benchmark(ABC):
         """
         pass
 
+    def record_trial(self, result: BenchmarkResult):
+        """Record any benchmark-specific outputs of the most recent trial in
+        <result>, after its status and time have been set.
+        """
+        pass
+
     def run_benchmark(
-        self, num_trials: int, timeout: Optional[int]=None,
-        network_statistics: bool=False,
+        self, num_trials: int, options: Optional[TrialOptions]=None,
     ) -> BenchmarkResult:
         """
         Running the benchmark will start the HTTP server on the h2 host and
@@ -106,17 +378,27 @@ class Benchmark(ABC):
         of trials.
 
         Parameters:
-        - num_trials: Number of trials.
-        - timeout: If provided, the number of seconds to wait for each client
-          to complete its request.
-        - network_statistics: Whether to collect network statistics, i.e., the
-          number of bytes and packets that were sent and received at each
-          interface, of the most recent trial.
+        - num_trials: Number of trials, or the maximum number of trials if
+          <options.ci_target> is provided.
+        - options: How each trial is run and measured (see TrialOptions).
 
         Returns:
         - A BenchmarkResult corresponding to the result of this benchmark.
         """
         self.start_server()
+        return self.run_trials(num_trials, options=options)
+
+    def run_trials(
+        self, num_trials: int, options: Optional[TrialOptions]=None,
+    ) -> BenchmarkResult:
+        """
+        Runs the HTTP client on the h1 host as many times as the number of
+        trials, assuming the HTTP server has already been started. Takes the
+        same parameters as run_benchmark().
+        """
+        if options is None:
+            options = TrialOptions()
+        timeout = options.timeout
 
         # Initialize the benchmark result
         result = BenchmarkResult(
@@ -126,33 +408,144 @@ class Benchmark(ABC):
             cca=self.cca,
             pep=self.pep,
         )
+        if self.net.cpu_layout:
+            result.set_cpu_layout(self.net.cpu_layout)
+        if self.net.setup_time_s is not None:
+            result.set_setup_time(self.net.setup_time_s)
+        if self.ktls:
+            self.ktls_state = {}
+        self.stop_agent()
+        if options.client_agent and self.agent_cmd() is None:
+            WARN(f'{self.protocol.name} does not support a client agent')
 
         # Run the client
-        for _ in range(num_trials):
-            result.append_new_output()
-            self.net.reset_statistics()
-            output = self.run_client(timeout=timeout)
-            if network_statistics:
-                statistics = self.net.snapshot_statistics()
-                result.set_network_statistics(statistics)
-
-            # Handle an error in the client
-            if output is None:
-                result.set_success(False)
-                result.set_timeout(False)
-                continue
+        tcp_info_hosts = []
+        if options.tcp_info_interval is not None:
+            tcp_info_hosts = self.tcp_info_hosts()
+        if options.capture_snaplen is not None and options.keep_pcap:
+            os.makedirs(self.pcap_dir, exist_ok=True)
+        min_trials = options.min_trials
+        if options.ci_target is not None and min_trials is None:
+            min_trials = min(MIN_ADAPTIVE_TRIALS, num_trials)
+        try:
+            if options.client_agent and self.agent_cmd() is not None:
+                self.agent = ClientAgent(self.net, self.client,
+                    self.agent_cmd(), logfile=self.logfile(self.client))
+                self.agent.start()
+                result.set_client_agent()
+            for trial in range(num_trials):
+                result.append_new_output()
+                self.net.reset_statistics()
+                if options.telemetry_interval is not None:
+                    self.net.start_telemetry(options.telemetry_interval,
+                                             duration_s=timeout)
+                if len(tcp_info_hosts) > 0:
+                    self.net.start_tcp_tracer(tcp_info_hosts, TCP_SERVER_PORT,
+                                              options.tcp_info_interval)
+                if options.capture_snaplen is not None:
+                    pcap_prefix = None
+                    if options.keep_pcap:
+                        pcap_prefix = f'{self.pcap_dir}/{self.num_captures}-'
+                    self.num_captures += 1
+                    self.net.start_capture(options.capture_snaplen,
+                                           pcap_prefix=pcap_prefix)
+                if options.early_abort and timeout is not None or \
+                        options.steady_state or \
+                        options.steady_state_duration is not None:
+                    self.progress = ProgressMonitor(self.n,
+                        timeout=timeout if options.early_abort else None,
+                        steady_state_duration=options.steady_state_duration)
+                self.phases = None
+                self.client_io = None
+                system_disk_write_bytes = read_disk_write_bytes()
+                try:
+                    output = self.run_client(timeout=timeout)
+                finally:
+                    progress, self.progress = self.progress, None
+                    telemetry = self.net.stop_telemetry()
+                    tcp_info = self.net.stop_tcp_tracer()
+                    capture = self.net.stop_capture()
+                    sink_bytes = self.clear_sink_dir()
+                # Check that the receive path of the client did not write to
+                # disk. The writes to all disks also count any other process.
+                if system_disk_write_bytes is not None:
+                    system_disk_write_bytes = \
+                        read_disk_write_bytes() - system_disk_write_bytes
+                result.set_disk_writes(self.client_io, sink_bytes,
+                                       system_disk_write_bytes)
+                disk_write_bytes = result.outputs[-1]['disk_write_bytes']
+                if disk_write_bytes is not None and disk_write_bytes >= self.n:
+                    WARN(f'{disk_write_bytes} bytes written to disk by the '
+                         f'client in a trial of {self.n} bytes')
+                if options.network_statistics:
+                    statistics = self.net.snapshot_statistics()
+                    result.set_network_statistics(statistics)
+                if telemetry is not None:
+                    result.set_additional_data({ 'telemetry': telemetry })
+                if tcp_info is not None:
+                    result.set_additional_data({ 'tcp_info': tcp_info })
+                if capture is not None:
+                    result.set_additional_data({ 'capture': capture })
+                if self.qlog:
+                    qlogs = self.collect_qlogs()
+                    result.set_additional_data({ 'qlog': qlogs })
+                    if self.phases is None:
+                        # Otherwise time the phases from the client's qlog file
+                        for summary in qlogs:
+                            if 'phases' in summary:
+                                self.phases = summary['phases']
+                if progress is not None and progress.aborted:
+                    INFO(f'aborted trial {progress.summary()}')
+                    result.set_aborted()
+                    output = (HTTP_TIMEOUT_STATUSCODE, timeout)
+
+                if progress is not None and progress.steady_state_ended:
+                    # Handle a transfer ended early in steady state
+                    result.set_success(True)
+                    result.set_timeout(False)
+                    result.set_partial_transfer(progress.time_s, progress.bytes)
+                elif output is None:
+                    # Handle an error in the client
+                    result.set_success(False)
+                    result.set_timeout(False)
+                else:
+                    # Handle a successful trial
+                    status_code, time_s = output
+                    result.set_success(status_code == HTTP_OK_STATUSCODE)
+                    result.set_timeout(status_code == HTTP_TIMEOUT_STATUSCODE)
+                    result.set_time_s(time_s, phases=self.phases)
+                if progress is not None:
+                    result.set_progress(progress.summary(), progress.times,
+                                        progress.num_bytes)
+                self.record_trial(result)
+
+                # Stop early once the median throughput is precise enough
+                if options.ci_target is None:
+                    continue
+                median, halfwidth = result.throughput_ci()
+                converged = trial + 1 >= min_trials and median is not None \
+                    and halfwidth <= options.ci_target * median
+                if converged or trial + 1 == num_trials:
+                    result.set_stopping(min_trials, num_trials,
+                                        options.ci_target, converged)
+                    break
+        finally:
+            # Stop the agent and free the tmpfs used by the downloads, even if
+            # a trial failed
+            self.stop_agent()
+            if self._sink_dir is not None:
+                shutil.rmtree(self._sink_dir, ignore_errors=True)
+                self._sink_dir = None
 
-            # Handle a successful trial
-            status_code, time_s = output
-            result.set_success(status_code == HTTP_OK_STATUSCODE)
-            result.set_timeout(status_code == HTTP_TIMEOUT_STATUSCODE)
-            result.set_time_s(time_s)
+        if self.ktls:
+            result.set_ktls(self.ktls_state)
 
         # Return the result
         return result
 
 
 from .cloudflare import CloudflareQUICBenchmark
+from .competition import CompetitionBenchmark
 from .google import GoogleQUICBenchmark
 from .picoquic import PicoQUICBenchmark
 from .tcp import LinuxTCPBenchmark
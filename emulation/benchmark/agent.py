@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Optional
+
+from common import *
+
+
+class ClientAgent:
+    """
+    A long-lived client process on a host that runs a request for each line
+    of arguments written to its stdin, so that trials do not include the
+    interpreter startup, imports, and TLS context creation of a new client
+    process. The agent prints '[AGENT] ready' once it accepts requests and
+    '[AGENT] done' after each request, e.g., `http_client.py --agent`.
+
+    If a request times out or is aborted, the agent is terminated, and
+    restarted on the next request.
+    """
+    def __init__(self, net, host, cmd: str, logfile: Optional[str]=None):
+        self.net = net
+        self.host = host
+        self.cmd = cmd
+        self.logfile = logfile
+        self.process = None
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.func = None
+
+    def _handle_line(self, line: str):
+        if line.startswith('[AGENT] ready'):
+            self.ready.set()
+        elif line.startswith('[AGENT] done'):
+            self.done.set()
+        elif self.func is not None:
+            self.func(line)
+
+    def start(self, timeout: int=SETUP_TIMEOUT):
+        """Start the agent and block until it accepts requests."""
+        self.ready.clear()
+        self.process = self.net.popen(self.host, self.cmd, background=True,
+            console_logger=DEBUG, logfile=self.logfile,
+            func=self._handle_line, stdin=True)
+        if not self.ready.wait(timeout):
+            self.stop()
+            raise TimeoutError(f'client agent timeout {timeout}s')
+
+    def request(self, args: str, func, timeout: Optional[int]=None,
+                abort: Optional[threading.Event]=None,
+                io: Optional[dict]=None) -> bool:
+        """Run a request with the command-line arguments <args>, calling
+        <func> on every line of its output. If <io> is a dict, it is updated
+        with the increase in the agent's I/O counters in /proc/<pid>/io over
+        the request, if available.
+
+        Returns:
+        - True if the request timed out after <timeout> seconds or was aborted
+          with <abort>, and False if it completed.
+        """
+        if self.process is None:
+            self.start()
+        p, _ = self.process
+        io_before = read_process_io(p.pid)
+        DEBUG(f'{self.host.name} [AGENT] {args}')
+        self.func = func
+        self.done.clear()
+        p.stdin.write(f'{args}\n')
+        p.stdin.flush()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.done.is_set():
+            wait_s = 0.1
+            if deadline is not None:
+                wait_s = min(wait_s, deadline - time.monotonic())
+            if wait_s <= 0 or abort is not None and abort.is_set() or \
+                    p.poll() is not None:
+                break
+            self.done.wait(wait_s)
+        completed = self.done.is_set()
+        io_after = read_process_io(p.pid)
+        if io is not None and io_before is not None and io_after is not None:
+            io.update((key, value - io_before.get(key, 0))
+                      for key, value in io_after.items())
+        if not completed:
+            # Abandon the request, and the connection, with the agent
+            self.stop()
+        self.func = None
+        return not completed and (abort is not None and abort.is_set() or
+                                  deadline is not None and
+                                  time.monotonic() >= deadline)
+
+    def stop(self):
+        if self.process is None:
+            return
+        p, thread = self.process
+        p.terminate()
+        p.wait()
+        thread.join()
+        self.net.background_processes.remove(p)
+        self.net.background_threads.remove(thread)
+        self.process = None
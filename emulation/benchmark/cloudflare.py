@@ -1,17 +1,25 @@
 import re
-import threading
 from typing import Optional, Tuple
 
 from benchmark import Benchmark
-from network import EmulatedNetwork
+from network import EmulatedNetwork, wait_until_listening
 from common import *
 
 
 class CloudflareQUICBenchmark(Benchmark):
+    QLOG_SUPPORTED = True
+
     def __init__(self, net: EmulatedNetwork, label: str, logdir: str, n: str,
-                 cca: str, certfile: str, keyfile: str, pep: bool=False):
+                 cca: str, certfile: str, keyfile: str, pep: bool=False,
+                 qlog: bool=False, ktls: bool=False):
         super().__init__(net, Protocol.CLOUDFLARE_QUIC, label, logdir, n, cca,
-                         certfile, keyfile, pep)
+                         certfile, keyfile, pep, qlog, ktls)
+
+    def qlog_env(self) -> Optional[dict]:
+        # The quiche apps write a JSON-SEQ qlog file per connection to QLOGDIR
+        if self.qlog:
+            return { 'QLOGDIR': self.qlog_dir }
+        return None
 
     def start_server(self, timeout: int=SETUP_TIMEOUT):
         base = 'deps/quiche/target/release'
@@ -19,24 +27,16 @@ class CloudflareQUICBenchmark(Benchmark):
               f'--cert={self.certfile} '\
               f'--key={self.keyfile} '\
               f'--cc-algorithm {self.cca} ' \
-              f'--listen {self.server.IP()}:4433'
-
-        condition = threading.Condition()
-        def notify_when_ready(line):
-            if 'listening' in line.lower():
-                with condition:
-                    condition.notify()
+              f'--listen {self.server.IP()}:{QUIC_SERVER_PORT}'
 
         # The start_server() function blocks until the server is ready to
-        # accept client requests. That is, when we observe the 'Serving'
-        # string in the server output.
+        # accept client requests. That is, when it is bound to its UDP port.
         logfile = self.logfile(self.server)
-        self.net.popen(self.server, cmd, background=True,
-            console_logger=DEBUG, logfile=logfile, func=notify_when_ready)
-        with condition:
-            notified = condition.wait(timeout=timeout)
-            if not notified:
-                raise TimeoutError(f'start_server timeout {timeout}s')
+        self.server_process = self.net.popen(self.server, cmd, background=True,
+            console_logger=DEBUG, logfile=logfile, env=self.qlog_env())
+        wait_until_listening(self.server, QUIC_SERVER_PORT, 'udp',
+            timeout=timeout, process=self.server_process[0],
+            name='start_server')
 
     def run_client(self, timeout: Optional[int]=None) -> Optional[Tuple[int, float]]:
         """Returns the status code and runtime (seconds) of the GET request.
@@ -45,8 +45,9 @@ class CloudflareQUICBenchmark(Benchmark):
         cmd = f'./{base}/quiche-client '\
               f'--no-verify '\
               f'--method GET '\
+              f'--dump-responses {self.sink_dir} '\
               f'--cc-algorithm {self.cca} ' \
-              f'-- https://{self.server.IP()}:4433/{self.n}'
+              f'-- https://{self.server.IP()}:{QUIC_SERVER_PORT}/{self.n}'
 
         result = []
         timed_out = False
@@ -64,10 +65,8 @@ class CloudflareQUICBenchmark(Benchmark):
             except:
                 pass
 
-        logfile = self.logfile(self.client)
-        timeout_flag = self.net.popen(self.client, cmd, background=False,
-            console_logger=DEBUG, logfile=logfile, func=parse_result,
-            timeout=timeout, raise_error=False)
+        timeout_flag = self.popen_client(cmd, parse_result, timeout=timeout,
+            raise_error=False, env=self.qlog_env())
 
         if timed_out:
             # Max idle timeout reached when there have been no packets received for
@@ -0,0 +1,201 @@
+import time
+from typing import List, Optional, Tuple
+
+from benchmark.tcp import LinuxTCPBenchmark
+from network import EmulatedNetwork
+from progress import bytes_at, parse_progress
+from result import BenchmarkResult
+from common import *
+
+
+def parse_flows(spec: str) -> List[Tuple[str, float]]:
+    """Parse a comma-separated list of flows, each CCA[:START_OFFSET_S],
+    e.g., 'bbr,cubic:5' into [('bbr', 0.0), ('cubic', 5.0)].
+    """
+    flows = []
+    for flow in spec.split(','):
+        cca, _, offset = flow.strip().partition(':')
+        flows.append((cca, float(offset) if offset else 0.))
+    if len(flows) == 0:
+        raise ValueError(f'no flows in {spec}')
+    return flows
+
+
+class CompetitionBenchmark(LinuxTCPBenchmark):
+    def __init__(self, net: EmulatedNetwork, label: str, logdir: str, n: str,
+                 cca: str, certfile: str, keyfile: str, pep: bool=False,
+                 qlog: bool=False, ktls: bool=False):
+        """
+        Competing HTTPS downloads of <n> bytes each from the server on the h2
+        host to clients on the h1 host, sharing the same bottleneck. Reports
+        the throughput of each flow, Jain's fairness index, and the
+        utilization of the bottleneck link.
+
+        Parameters:
+        - cca: The flows as CCA[:START_OFFSET_S], comma-separated, e.g.,
+          'bbr,cubic:5' starts a BBR flow and a CUBIC flow 5 seconds later.
+          The server sends each flow with its own CCA. With the TCP PEP,
+          that is the CCA of the segment from the server to the PEP, and
+          the PEP sends with the system default, CUBIC.
+        - Other parameters are as in Benchmark.
+        """
+        self.flows = parse_flows(cca)
+        super().__init__(net, label, logdir, n, 'cubic', certfile, keyfile,
+                         pep, qlog, ktls)
+        self.cca = cca
+        self.flow_outputs = []
+        self._warned_progress = False
+
+    def agent_cmd(self) -> Optional[str]:
+        # Each flow runs in its own client process
+        return None
+
+    def start_server(self, timeout: int=SETUP_TIMEOUT):
+        super().start_server(timeout, concurrent=True)
+
+    def run_client(self, timeout: Optional[int]=None) -> Optional[Tuple[int, float]]:
+        """Runs a client for each flow at its start offset. Returns the status
+        code and the time (seconds) from the start of the first flow to the
+        end of the last flow. The status code is HTTP_TIMEOUT_STATUSCODE if
+        any flow timed out, and the result is None if any other flow failed.
+        """
+        if self.progress is not None and not self._warned_progress:
+            # The progress monitor follows the download of a single client
+            WARN('competition ignores early abort and steady state duration')
+            self._warned_progress = True
+        logfile = self.logfile(self.client)
+        start_time = time.monotonic()
+        start_wall = time.time()
+        clients = []
+        for i, (cca, offset_s) in sorted(enumerate(self.flows),
+                                         key=lambda flow: flow[1][1]):
+            cmd = f'python3 webserver/http_client.py '\
+                  f'--server-ip {self.server.IP()} -n {self.n} --cca {cca} '\
+                  f'--progress-interval {PROGRESS_INTERVAL_MS}'
+            if self.ktls:
+                cmd += ' --ktls'
+            output = {
+                'cca': cca,
+                'offset_s': offset_s,
+                'times': [],
+                'num_bytes': [],
+                'result': None,
+            }
+
+            def parse_line(line, output=output):
+                progress = parse_progress(line)
+                if progress is not None:
+                    output['times'].append(progress[0])
+                    output['num_bytes'].append(progress[1])
+                elif line.startswith('[TCP_CLIENT]'):
+                    try:
+                        kvs = dict(kv.split('=') for kv in line.split()[1:])
+                        output['result'] = (int(kvs['status_code']),
+                                            float(kvs['time_s']))
+                        output['start_wall'] = float(kvs['start_s'])
+                    except (KeyError, ValueError):
+                        pass
+
+            time.sleep(max(0, start_time + offset_s - time.monotonic()))
+            output['start_s'] = time.monotonic() - start_time
+            p, thread = self.net.popen(self.client, cmd, background=True,
+                console_logger=DEBUG, logfile=logfile, func=parse_line)
+            clients.append((i, output, p, thread))
+
+        # Wait for each flow to complete, or time out
+        timed_out = False
+        for _, output, p, thread in clients:
+            if timeout is not None:
+                deadline = start_time + output['start_s'] + timeout
+                thread.join(max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                p.terminate()
+                timed_out = True
+                output['timeout'] = True
+            thread.join()
+            self.add_client_io(wait_process_io(p))
+            p.wait()
+            self.net.background_processes.remove(p)
+            self.net.background_threads.remove(thread)
+
+            # The progress times of the client are from its own start, after
+            # the interpreter starts up, which it reports in wall-clock time.
+            # Flows that did not report it keep the time they were started.
+            if 'start_wall' in output:
+                output['start_s'] = output.pop('start_wall') - start_wall
+
+        self.flow_outputs = [output for _, output, _, _ in sorted(clients)]
+        if timed_out:
+            return (HTTP_TIMEOUT_STATUSCODE, timeout)
+        results = [output['result'] for output in self.flow_outputs]
+        if any(result is None for result in results):
+            WARN(f'TCP client failed to return result {results}')
+            return None
+        status_code = max(status_code for status_code, _ in results)
+        end_s = max(output['start_s'] + output['result'][1]
+                    for output in self.flow_outputs)
+        return (status_code, end_s)
+
+    def record_trial(self, result: BenchmarkResult):
+        """Record the throughput of each flow over its whole download and
+        while all flows were active, Jain's fairness index of the latter, or
+        the former if the flows did not overlap, and the utilization of the
+        bottleneck by the aggregate goodput of the flows.
+        """
+        if len(self.flow_outputs) == 0:
+            return
+        flows = []
+        start_s = max(output['start_s'] for output in self.flow_outputs)
+        end_s = float('inf')
+        for output in self.flow_outputs:
+            times, num_bytes = output['times'], output['num_bytes']
+            flow = {
+                'cca': output['cca'],
+                'offset_s': output['offset_s'],
+                'success': False,
+                'timeout': output.get('timeout', False),
+                'bytes': num_bytes[-1] if num_bytes else 0,
+            }
+            if output['result'] is not None:
+                status_code, time_s = output['result']
+                flow['success'] = status_code == HTTP_OK_STATUSCODE
+                flow['time_s'] = time_s
+                if flow['success']:
+                    flow['bytes'] = self.n
+                    times.append(time_s)
+                    num_bytes.append(self.n)
+            if times:
+                duration_s = times[-1]
+                flow['throughput_mbps'] = 8 * flow['bytes'] / 1000000 / duration_s
+                end_s = min(end_s, output['start_s'] + duration_s)
+            else:
+                end_s = start_s
+            flows.append(flow)
+
+        # Throughput while all flows were active
+        if end_s > start_s:
+            for flow, output in zip(flows, self.flow_outputs):
+                times, num_bytes = output['times'], output['num_bytes']
+                shared_bytes = \
+                    bytes_at(times, num_bytes, end_s - output['start_s']) - \
+                    bytes_at(times, num_bytes, start_s - output['start_s'])
+                flow['shared_throughput_mbps'] = \
+                    8 * shared_bytes / 1000000 / (end_s - start_s)
+            fairness = jain_fairness_index(
+                [flow['shared_throughput_mbps'] for flow in flows])
+        else:
+            fairness = jain_fairness_index(
+                [flow.get('throughput_mbps', 0) for flow in flows])
+
+        # Aggregate goodput from the start of the first flow to the end of the
+        # last flow
+        aggregate_mbps = None
+        first_s = min(output['start_s'] for output in self.flow_outputs)
+        last_s = max(output['start_s'] + output['times'][-1]
+                     for output in self.flow_outputs if output['times']) \
+            if any(output['times'] for output in self.flow_outputs) else None
+        if last_s is not None and last_s > first_s:
+            total_bytes = sum(flow['bytes'] for flow in flows)
+            aggregate_mbps = 8 * total_bytes / 1000000 / (last_s - first_s)
+        result.set_competition(flows, fairness, aggregate_mbps,
+                               self.net.bottleneck_mbps)
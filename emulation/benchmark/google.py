@@ -1,40 +1,33 @@
-import threading
 from typing import Optional, Tuple
 
 from benchmark import Benchmark
-from network import EmulatedNetwork
+from network import EmulatedNetwork, wait_until_listening
 from common import *
 
 
 class GoogleQUICBenchmark(Benchmark):
     def __init__(self, net: EmulatedNetwork, label: str, logdir: str, n: str,
-                 cca: str, certfile: str, keyfile: str, pep: bool=False):
+                 cca: str, certfile: str, keyfile: str, pep: bool=False,
+                 qlog: bool=False, ktls: bool=False):
         super().__init__(net, Protocol.GOOGLE_QUIC, label, logdir, n, cca,
-                         certfile, keyfile, pep)
+                         certfile, keyfile, pep, qlog, ktls)
 
     def start_server(self, timeout: int=SETUP_TIMEOUT):
         base = 'deps/chromium/src'
         cmd = f'./{base}/out/Default/quic_server '\
               f'--certificate_file={self.certfile} '\
               f'--key_file={self.keyfile} '\
-              f'--num_cached_bytes={self.n}'
-
-        condition = threading.Condition()
-        def notify_when_ready(line):
-            if 'Serving' in line:
-                with condition:
-                    condition.notify()
+              f'--num_cached_bytes={self.n} '\
+              f'--port={GOOGLE_QUIC_SERVER_PORT}'
 
         # The start_server() function blocks until the server is ready to
-        # accept client requests. That is, when we observe the 'Serving'
-        # string in the server output.
+        # accept client requests. That is, when it is bound to its UDP port.
         logfile = self.logfile(self.server)
-        self.net.popen(self.server, cmd, background=True,
-            console_logger=DEBUG, logfile=logfile, func=notify_when_ready)
-        with condition:
-            notified = condition.wait(timeout=timeout)
-            if not notified:
-                raise TimeoutError(f'start_server timeout {timeout}s')
+        self.server_process = self.net.popen(self.server, cmd, background=True,
+            console_logger=DEBUG, logfile=logfile)
+        wait_until_listening(self.server, GOOGLE_QUIC_SERVER_PORT, 'udp',
+            timeout=timeout, process=self.server_process[0],
+            name='start_server')
 
     def run_client(self, timeout: Optional[int]=None) -> Optional[Tuple[int, float]]:
         """Returns the status code and runtime (seconds) of the GET request.
@@ -42,7 +35,8 @@ class GoogleQUICBenchmark(Benchmark):
         base = 'deps/chromium/src'
         cmd = f'./{base}/out/Default/quic_client '\
               f'--allow_unknown_root_cert '\
-              f'--host={self.server.IP()} --port=6121 '\
+              f'--drop_response_body '\
+              f'--host={self.server.IP()} --port={GOOGLE_QUIC_SERVER_PORT} '\
               f'https://www.example.org/{self.n} '
 
         # Add the congestion control algorithm options
@@ -72,10 +66,7 @@ class GoogleQUICBenchmark(Benchmark):
             except:
                 pass
 
-        logfile = self.logfile(self.client)
-        timeout_flag = self.net.popen(self.client, cmd, background=False,
-            console_logger=DEBUG, logfile=logfile, func=parse_result,
-            timeout=timeout)
+        timeout_flag = self.popen_client(cmd, parse_result, timeout=timeout)
         if timeout_flag:
             return (HTTP_TIMEOUT_STATUSCODE, timeout)
         elif len(result) == 0:
@@ -1,57 +1,59 @@
+import os
 import re
-import threading
 from typing import Optional, Tuple
 
 from benchmark import Benchmark
-from network import EmulatedNetwork
+from network import EmulatedNetwork, wait_until_listening
 from common import *
 
 
 class PicoQUICBenchmark(Benchmark):
+    QLOG_SUPPORTED = True
+
     def __init__(
         self, net: EmulatedNetwork, label: str, logdir: str, n: str,
         cca: str, certfile: str, keyfile: str, pep: bool=False,
+        qlog: bool=False, ktls: bool=False,
     ):
         super().__init__(net, Protocol.PICOQUIC, label, logdir, n, cca,
-                         certfile, keyfile, pep)
+                         certfile, keyfile, pep, qlog, ktls)
+
+    def qlog_cwd(self) -> Optional[str]:
+        # The picoquic sample writes a qlog file per connection to its working
+        # directory, so the paths in its commands must be absolute
+        if self.qlog:
+            return self.qlog_dir
+        return None
 
     def start_server(self, timeout: int=SETUP_TIMEOUT):
-        base = 'deps/picoquic'
-        cmd = f'./{base}/picoquic_sample '\
+        base = os.path.abspath('deps/picoquic')
+        cmd = f'{base}/picoquic_sample '\
               f'server '\
-              f'4433 '\
-              f'{self.certfile} '\
-              f'{self.keyfile} '\
+              f'{QUIC_SERVER_PORT} '\
+              f'{os.path.abspath(self.certfile)} '\
+              f'{os.path.abspath(self.keyfile)} '\
               f'. '\
               f'{self.n} '\
               f'{self.cca}'
 
-        condition = threading.Condition()
-        def notify_when_ready(line):
-            if line.startswith('Serving'):
-                with condition:
-                    condition.notify()
-
         # The start_server() function blocks until the server is ready to
-        # accept client requests. That is, when we observe the 'Serving'
-        # string in the server output.
+        # accept client requests. That is, when it is bound to its UDP port.
         logfile = self.logfile(self.server)
-        self.net.popen(self.server, cmd, background=True,
-            console_logger=DEBUG, logfile=logfile, func=notify_when_ready)
-        with condition:
-            notified = condition.wait(timeout=timeout)
-            if not notified:
-                raise TimeoutError(f'start_server timeout {timeout}s')
+        self.server_process = self.net.popen(self.server, cmd, background=True,
+            console_logger=DEBUG, logfile=logfile, cwd=self.qlog_cwd())
+        wait_until_listening(self.server, QUIC_SERVER_PORT, 'udp',
+            timeout=timeout, process=self.server_process[0],
+            name='start_server')
 
     def run_client(self, timeout: Optional[int]=None) -> Optional[Tuple[int, float]]:
         """Returns the status code and runtime (seconds) of the GET request.
         """
-        base = 'deps/picoquic'
-        cmd = f'./{base}/picoquic_sample '\
+        base = os.path.abspath('deps/picoquic')
+        cmd = f'{base}/picoquic_sample '\
               f'client '\
               f'{self.server.IP()} '\
-              f'4433 '\
-              f'/tmp '\
+              f'{QUIC_SERVER_PORT} '\
+              f'{self.sink_dir} '\
               f'{self.cca} '\
               f'{self.n}.html '
 
@@ -64,10 +66,8 @@ class PicoQUICBenchmark(Benchmark):
             time_s = float(match.group(1))
             result.append(time_s)
 
-        logfile = self.logfile(self.client)
-        timeout_flag = self.net.popen(self.client, cmd, background=False,
-            console_logger=DEBUG, logfile=logfile, func=parse_result,
-            timeout=timeout, raise_error=False)
+        timeout_flag = self.popen_client(cmd, parse_result, timeout=timeout,
+            raise_error=False, cwd=self.qlog_cwd())
 
         if len(result) == 0:
             WARN('PicoQUIC client failed to return result')
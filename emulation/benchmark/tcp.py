@@ -1,48 +1,91 @@
-import threading
 from typing import Optional, Tuple
 
 from benchmark import Benchmark
-from network import EmulatedNetwork
+from network import EmulatedNetwork, wait_until_listening
 from common import *
 
 
 class LinuxTCPBenchmark(Benchmark):
+    PROGRESS_SUPPORTED = True
+    KTLS_SUPPORTED = True
+
     def __init__(self, net: EmulatedNetwork, label: str, logdir: str, n: str,
-                 cca: str, certfile: str, keyfile: str, pep: bool=False):
+                 cca: str, certfile: str, keyfile: str, pep: bool=False,
+                 qlog: bool=False, ktls: bool=False):
         super().__init__(net, Protocol.LINUX_TCP, label, logdir, n, cca,
-                         certfile, keyfile, pep)
+                         certfile, keyfile, pep, qlog, ktls)
+        self.server_connections = []
         net.set_tcp_congestion_control(cca)
 
-    def start_server(self, timeout: int=SETUP_TIMEOUT):
+    def tcp_info_hosts(self) -> list:
+        """The server, and the router if the TCP PEP splits the connection.
+        """
+        if self.pep:
+            return [self.server, self.proxy]
+        return [self.server]
+
+    def start_server(self, timeout: int=SETUP_TIMEOUT,
+                     concurrent: bool=False):
+        """Start the HTTP server. With <concurrent>, the server serves each
+        connection in its own thread, e.g., for multiple competing clients.
+        The send timestamps of each connection served are appended to
+        <server_connections>.
+        """
         cmd = f'python3 webserver/http_server.py --server-ip {self.server.IP()} '\
               f'--certfile {self.certfile} --keyfile {self.keyfile} '\
               f'-n {self.n}'
+        if self.ktls:
+            cmd += ' --ktls'
+        if concurrent:
+            cmd += ' --concurrent'
 
-        condition = threading.Condition()
-        def notify_when_ready(line):
-            if 'Serving' in line:
-                with condition:
-                    condition.notify()
+        self.server_connections = []
+        def parse_line(line):
+            self.parse_ktls(line, 'server')
+            self.parse_connection(line)
 
         # The start_server() function blocks until the server is ready to
-        # accept client requests. That is, when we observe the 'Serving'
-        # string in the server output.
+        # accept client requests. That is, when it listens on its TCP port.
         logfile = self.logfile(self.server)
-        self.net.popen(self.server, cmd, background=True,
-            console_logger=DEBUG, logfile=logfile, func=notify_when_ready)
-        with condition:
-            notified = condition.wait(timeout=timeout)
-            if not notified:
-                raise TimeoutError(f'start_server timeout {timeout}s')
+        self.server_process = self.net.popen(self.server, cmd, background=True,
+            console_logger=DEBUG, logfile=logfile, func=parse_line)
+        wait_until_listening(self.server, TCP_SERVER_PORT, 'tcp',
+            timeout=timeout, process=self.server_process[0],
+            name='start_server')
+
+    def parse_connection(self, line: str):
+        """Parse a '[CONNECTION] client=<ip>:<port> bytes=<int> accept_s=...'
+        line of the server output, with the send timestamps of a connection
+        in seconds since the epoch.
+        """
+        if not line.startswith('[CONNECTION]'):
+            return
+        try:
+            connection = dict(kv.split('=') for kv in line.split()[1:])
+            for key in connection:
+                if key.endswith('_s'):
+                    connection[key] = float(connection[key])
+            connection['bytes'] = int(connection['bytes'])
+            self.server_connections.append(connection)
+        except ValueError:
+            WARN(f'invalid server connection {line}')
+
+    def agent_cmd(self) -> Optional[str]:
+        return 'python3 webserver/http_client.py --agent'
 
     def run_client(self, timeout: Optional[int]=None) -> Optional[Tuple[int, float]]:
         """Returns the status code and runtime (seconds) of the GET request.
         """
-        cmd = f'python3 webserver/http_client.py --server-ip {self.server.IP()} '\
-              f'-n {self.n}'
+        args = f'--server-ip {self.server.IP()} -n {self.n}'
+        if self.progress is not None:
+            args += f' --progress-interval {PROGRESS_INTERVAL_MS}'
+        if self.ktls:
+            args += ' --ktls'
+        cmd = f'python3 webserver/http_client.py {args}'
 
         result = []
         def parse_result(line):
+            self.parse_ktls(line, 'client')
             if not line.startswith('[TCP_CLIENT]'):
                 return
             try:
@@ -56,10 +99,8 @@ class LinuxTCPBenchmark(Benchmark):
             except:
                 pass
 
-        logfile = self.logfile(self.client)
-        timeout_flag = self.net.popen(self.client, cmd, background=False,
-            console_logger=DEBUG, logfile=logfile, func=parse_result,
-            timeout=timeout)
+        timeout_flag = self.popen_client(cmd, parse_result, timeout=timeout,
+                                         request=args)
         if timeout_flag:
             return (HTTP_TIMEOUT_STATUSCODE, timeout)
         elif len(result) == 0:
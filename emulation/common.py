@@ -1,10 +1,16 @@
 import os
+import array
+import base64
+import json
 import select
 import sys
 import subprocess
 import re
+import zlib
 from enum import Enum
 
+from stats import MIN_ADAPTIVE_TRIALS, median_ci
+
 SERVER_LOGFILE = 'server.log'
 CLIENT_LOGFILE = 'client.log'
 ROUTER_LOGFILE = 'router.log'
@@ -13,7 +19,47 @@ DEFAULT_SSL_CERTFILE = f'deps/certs/out/leaf_cert.pem'
 DEFAULT_SSL_KEYFILE = f'deps/certs/out/leaf_cert.key'
 DEFAULT_SSL_KEYFILE_GOOGLE = f'deps/certs/out/leaf_cert.pkcs8'
 
+# The cores of the harnesses of all emulations when the hosts are pinned, which
+# are left out of the cores of the hosts of each instance
+DEFAULT_HARNESS_CPUS = [0]
+
+DEFAULT_NETWORK_SETTING = {
+    'delay1': 1,
+    'delay2': 25,
+    'loss1': '1',
+    'loss2': '0',
+    'bw1': 100,
+    'bw2': 10,
+    'qdisc': 'red',
+    'cross': None,
+    'cross_segment': 2,
+    'cross_mbps': 5,
+    'cross_flows': 1,
+}
+
+TCP_SERVER_PORT = 8443
+QUIC_SERVER_PORT = 4433
+GOOGLE_QUIC_SERVER_PORT = 6121
+TCP_PEP_PORT = 5000  # The default port of pepsal
+CROSS_TRAFFIC_PORT = 5201
 SETUP_TIMEOUT = 3
+READINESS_MIN_INTERVAL_S = 0.001
+READINESS_MAX_INTERVAL_S = 0.05
+TELEMETRY_MAX_SAMPLES = 10000
+CAPTURE_SNAPLEN = 128
+CAPTURE_BIN_MS = 100
+PROGRESS_PREFIX = '[PROGRESS]'
+PROGRESS_INTERVAL_MS = 100
+PROGRESS_MIN_EVENTS = 4
+PROGRESS_MIN_ELAPSED_FRACTION = 0.1
+PROGRESS_RATE_MARGIN = 1.5
+STEADY_STATE_WINDOW_MS = 500
+STEADY_STATE_WINDOWS = 4
+STEADY_STATE_TOLERANCE = 0.2
+TMPFS_DIR = '/dev/shm'
+DISKSTATS_SECTOR_SIZE = 512
+TIMING_PREFIX = '[TIMING]'
+PHASES = ['connect_s', 'handshake_s', 'first_byte_s', 'last_byte_s']
 LINUX_TIMEOUT_EXITCODE = 124
 HTTP_OK_STATUSCODE = 200
 HTTP_TIMEOUT_STATUSCODE = 408
@@ -47,6 +93,42 @@ def mac(digit):
     assert 0 <= digit < 10
     return f'00:00:00:00:00:0{int(digit)}'
 
+def subnet_ip(subnet, segment, host):
+    """The IP address of <host> on the /24 subnet of the <segment>-th path
+    segment, in the <subnet>-th emulated network on this machine.
+    """
+    assert 0 <= subnet < 127 and segment in [1, 2]
+    return f'172.16.{2 * subnet + segment}.{host}'
+
+def parse_cpu_list(cpus):
+    """Parse a CPU list in the format of taskset and cpusets, e.g., '2-5,8'
+    is parsed to [2, 3, 4, 5, 8].
+    """
+    result = []
+    try:
+        for part in cpus.split(','):
+            if '-' in part:
+                start, end = part.split('-')
+                result += list(range(int(start), int(end) + 1))
+            else:
+                result.append(int(part))
+    except Exception:
+        raise ValueError(f'invalid cpu list {cpus}')
+    return sorted(set(result))
+
+def cpu_mask(cpus):
+    """The hexadecimal CPU bitmask of a list of CPUs, in the comma-separated
+    32-bit words expected by /sys/class/net/<iface>/queues/rx-0/rps_cpus.
+    """
+    mask = sum(1 << cpu for cpu in cpus)
+    words = []
+    while True:
+        words.append(f'{mask & 0xffffffff:08x}')
+        mask >>= 32
+        if mask == 0:
+            break
+    return ','.join(reversed(words))
+
 def calculate_bdp(delay1, delay2, bw1, bw2):
     rtt_ms = 2 * (delay1 + delay2)
     bw_mbps = min(bw1, bw2)
@@ -67,6 +149,240 @@ def parse_data_size(n):
     except Exception:
         raise ValueError(f'invalid data size {n}')
 
+def read_json_file(path):
+    """Read a list of JSON objects from a file that is either a single JSON
+    list or JSONL, i.e., one JSON object per line. Ignores empty lines.
+    """
+    with open(path) as f:
+        contents = f.read()
+    if contents.lstrip().startswith('['):
+        return json.loads(contents)
+    return [json.loads(line) for line in contents.splitlines() if line.strip()]
+
+PROC_NET_DEV_FIELDS = [
+    'rx_bytes', 'rx_packets', 'rx_errors', 'rx_dropped', 'rx_fifo_errors',
+    'rx_frame_errors', 'rx_compressed', 'multicast',
+    'tx_bytes', 'tx_packets', 'tx_errors', 'tx_dropped', 'tx_fifo_errors',
+    'collisions', 'tx_carrier_errors', 'tx_compressed',
+]
+
+def parse_proc_net_dev(contents):
+    """Parse the interface counters in /proc/net/dev, named as in
+    /sys/class/net/<iface>/statistics/, e.g., {'h1-eth0': {'rx_bytes': 0, ...}}.
+    """
+    stats = {}
+    for line in contents.splitlines()[2:]:
+        if ':' not in line:
+            continue
+        iface, counters = line.split(':', 1)
+        values = [int(value) for value in counters.split()]
+        stats[iface.strip()] = dict(zip(PROC_NET_DEV_FIELDS, values))
+    return stats
+
+def parse_proc_net_sockets(contents, state):
+    """Parse the local ports of the sockets in the <state> in /proc/net/tcp,
+    tcp6, udp, or udp6, where the state is the hex code of the kernel's socket
+    state, e.g., '0A' for a listening TCP socket.
+    """
+    ports = set()
+    for line in contents.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 4 or fields[3] != state:
+            continue
+        ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+    return ports
+
+def parse_proc_diskstats(contents):
+    """Parse the number of bytes written to each block device in
+    /proc/diskstats, e.g., {'vda': 4096}, from its sectors written, which are
+    always DISKSTATS_SECTOR_SIZE bytes regardless of the device.
+    """
+    written = {}
+    for line in contents.splitlines():
+        fields = line.split()
+        if len(fields) < 10:
+            continue
+        written[fields[2]] = int(fields[9]) * DISKSTATS_SECTOR_SIZE
+    return written
+
+def read_disk_write_bytes():
+    """The number of bytes written to all disks since boot, or None if the
+    counters are unavailable. Partitions are already counted in their disk,
+    and loop and RAM devices are not disks.
+    """
+    try:
+        with open('/proc/diskstats') as f:
+            written = parse_proc_diskstats(f.read())
+        devices = os.listdir('/sys/block')
+    except OSError:
+        return None
+    return sum(written.get(device, 0) for device in devices
+               if not device.startswith(('loop', 'ram', 'zram')))
+
+def parse_proc_io(contents):
+    """Parse the I/O counters of a process in /proc/<pid>/io, e.g.,
+    {'wchar': 4096, 'write_bytes': 0, ...}.
+    """
+    counters = {}
+    for line in contents.splitlines():
+        key, _, value = line.partition(':')
+        if value.strip().isdigit():
+            counters[key.strip()] = int(value)
+    return counters
+
+def read_process_io(pid: int):
+    """The I/O counters of a process, or None if they are unavailable. The
+    counters include those of the children the process has reaped.
+    """
+    try:
+        with open(f'/proc/{pid}/io') as f:
+            return parse_proc_io(f.read())
+    except OSError:
+        return None
+
+def wait_process_io(p):
+    """Wait for the subprocess to exit without reaping it, and return its I/O
+    counters, which are gone once it is reaped, or None if unavailable.
+    """
+    try:
+        os.waitid(os.P_PID, p.pid, os.WEXITED | os.WNOWAIT)
+    except ChildProcessError:
+        # Already reaped
+        return None
+    return read_process_io(p.pid)
+
+def parse_qdisc_stats(qdiscs):
+    """Parse the output of `tc -s -j qdisc show` on a network emulation node
+    into the statistics of the queue on each interface, e.g., {'e1-eth0':
+    {'backlog': 0, ...}}. The HTB qdisc (handle 3:) accounts for the bytes
+    queued in and the packets dropped by its leaf qdisc and policer, the leaf
+    qdisc (handle 11:) for any ECN marks, and the netem qdisc (handle 2:) for
+    the stochastic losses.
+    """
+    stats = {}
+    for qdisc in qdiscs:
+        iface = stats.setdefault(qdisc['dev'], {
+            'backlog': 0,
+            'qlen': 0,
+            'drops': 0,
+            'overlimits': 0,
+            'marks': 0,
+            'loss_drops': 0,
+        })
+        handle = qdisc.get('handle')
+        if handle == '3:':
+            for key in ['backlog', 'qlen', 'drops', 'overlimits']:
+                iface[key] = qdisc.get(key, 0)
+        elif handle == '11:':
+            options = qdisc.get('options', {})
+            for key in ['marked', 'ecn_mark']:
+                iface['marks'] += qdisc.get(key, options.get(key, 0))
+        elif handle == '2:':
+            iface['loss_drops'] = qdisc.get('drops', 0)
+    return stats
+
+def parse_rate(rate):
+    """Parse a rate in `ss` output, e.g., 1.5Mbps or 1500000bps, in bps."""
+    match = re.fullmatch(r'([\d.]+)([KMG]?)bps', rate)
+    if match is None:
+        raise ValueError(f'invalid rate {rate}')
+    multiplier = { '': 1, 'K': 1000, 'M': 1000000, 'G': 1000000000 }
+    return round(float(match.group(1)) * multiplier[match.group(2)])
+
+def parse_ss_tcp_info(output):
+    """Parse the TCP_INFO of each connection in the output of `ss -tinH
+    state established`, e.g., [{'local': '172.16.2.10:8443', 'peer':
+    '172.16.1.10:33056', 'cwnd': 10, 'srtt_ms': 52.1, ...}]. Values that are
+    not reported for a connection are omitted, e.g., the BBR state for CUBIC.
+    """
+    connections = []
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        if not line[0].isspace():
+            addrs = [token for token in line.split() if ':' in token]
+            connections.append({ 'local': addrs[-2], 'peer': addrs[-1] })
+            continue
+        if len(connections) == 0:
+            continue
+        info = connections[-1]
+        tokens = line.split()
+        for i, token in enumerate(tokens):
+            if token.startswith('cwnd:'):
+                info['cwnd'] = int(token[5:])
+            elif token.startswith('rtt:'):
+                info['srtt_ms'] = float(token[4:].split('/')[0])
+            elif token.startswith('retrans:'):
+                info['retrans'] = int(token[8:].split('/')[-1])
+            elif token in ['pacing_rate', 'delivery_rate']:
+                info[f'{token}_bps'] = parse_rate(tokens[i+1])
+            elif token.startswith('bbr:('):
+                for kv in token[5:].rstrip(')').split(','):
+                    key, value = kv.split(':')
+                    if key == 'bw':
+                        info['bbr_bw_bps'] = parse_rate(value)
+                    elif key == 'mrtt':
+                        info['bbr_mrtt_ms'] = float(value)
+                    elif key in ['pacing_gain', 'cwnd_gain']:
+                        info[f'bbr_{key}'] = float(value)
+    return connections
+
+def encode_columns(columns):
+    """Compactly encode columns of integer samples of the same length, e.g.,
+    cumulative counters, as a string. Each column is delta encoded as 64-bit
+    little-endian integers, and the concatenated columns are compressed with
+    zlib and base64 encoded.
+    """
+    data = array.array('q')
+    for column in columns:
+        prev = 0
+        for value in column:
+            data.append(value - prev)
+            prev = value
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return base64.b64encode(zlib.compress(data.tobytes())).decode('ascii')
+
+def jain_fairness_index(values):
+    """Jain's fairness index (sum x)^2 / (n * sum x^2) of the values, from
+    1/n when one value gets everything to 1 when all are equal.
+    """
+    n = len(values)
+    squares = sum(x * x for x in values)
+    if n == 0 or squares == 0:
+        return None
+    return sum(values) ** 2 / (n * squares)
+
+def parse_phases(line):
+    """Parse a '[TIMING] connect_s=<float> handshake_s=<float> ...' line of
+    the client output into a dict of the PHASES it reports, in seconds since
+    the client started connecting, or None if the line is not a timing line.
+    """
+    if not line.startswith(TIMING_PREFIX):
+        return None
+    try:
+        kvs = dict(kv.split('=') for kv in line.split()[1:])
+        return { key: float(kvs[key]) for key in PHASES if key in kvs }
+    except ValueError:
+        return None
+
+def decode_columns(encoded, num_columns):
+    """Decode the <num_columns> columns from the output of encode_columns().
+    """
+    data = array.array('q', zlib.decompress(base64.b64decode(encoded)))
+    if sys.byteorder == 'big':
+        data.byteswap()
+    num_samples = len(data) // num_columns
+    columns = []
+    for i in range(num_columns):
+        column = []
+        value = 0
+        for delta in data[i*num_samples:(i+1)*num_samples]:
+            value += delta
+            column.append(value)
+        columns.append(column)
+    return columns
+
 def init_logdir(path):
     os.system(f'mkdir -p {path}')
     os.system(f'rm -f {path}/*')
@@ -0,0 +1,80 @@
+"""
+A long-running emulation daemon that accepts benchmark jobs over a Unix socket.
+"""
+import grp
+import json
+import os
+import signal
+import socketserver
+from typing import Optional
+
+from common import *
+from runner import EmulationRunner
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one JSON job per line, as defined in EmulationRunner, until the
+    client closes its end of the connection. Writes back one line per job,
+    either the JSON BenchmarkResult or {"error": <message>}.
+    """
+    def handle(self):
+        runner = self.server.runner
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+                INFO(f'job {job}')
+                response = runner.run(job).dumps()
+            except Exception as e:
+                # Don't reuse a network that may be in an inconsistent state
+                ERROR(f'job failed: {e}')
+                runner.stop()
+                response = json.dumps({'error': str(e)})
+            self.wfile.write(f'{response}\n'.encode('utf-8'))
+            self.wfile.flush()
+
+
+class EmulationDaemon(socketserver.UnixStreamServer):
+    """
+    Serves benchmark jobs on a Unix socket, one connection at a time, so that
+    consecutive jobs share the warm network and server of the runner.
+    """
+    def __init__(self, path: str, runner: EmulationRunner,
+                 group: Optional[str]=None):
+        """Parameters:
+        - path: Path to the Unix socket.
+        - runner: The runner of the jobs.
+        - group: If provided, the group whose members may also submit jobs.
+          Otherwise only the owner of the daemon, i.e., root, may.
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, JobHandler)
+        # Jobs run as root, and read the certificate and key files they name,
+        # so never let every local user submit them
+        if group is None:
+            os.chmod(path, 0o600)
+        else:
+            os.chown(path, -1, grp.getgrnam(group).gr_gid)
+            os.chmod(path, 0o660)
+        self.path = path
+        self.runner = runner
+
+    def serve(self):
+        """Serve jobs until interrupted, then stop the network."""
+        def interrupt(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, interrupt)
+
+        INFO(f'Serving jobs on {self.path}')
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.runner.stop()
+            self.server_close()
+            os.unlink(self.path)
@@ -2,6 +2,8 @@ import argparse
 from common import *
 from network import *
 from benchmark import *
+from runner import *
+from daemon import EmulationDaemon
 from mininet.cli import CLI
 from mininet.log import setLogLevel
 
@@ -15,47 +17,163 @@ if __name__ == '__main__':
     subparsers = parser.add_subparsers(required=True)
     cli = subparsers.add_parser('cli')
     cli.set_defaults(ty='cli')
+    daemon = subparsers.add_parser(
+        'daemon',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        help='Run benchmark jobs received over a Unix socket on a warm network',
+    )
+    daemon.set_defaults(ty='daemon')
+    daemon.add_argument('--socket', type=str, default='/tmp/emulation.sock',
+        help='Path to the Unix socket')
+    daemon.add_argument('--socket-group', type=str,
+        help='Group whose members may submit jobs on the socket, which is '
+             'otherwise only accessible to root')
+    jobs = subparsers.add_parser(
+        'jobs',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        help='Run a file of benchmark jobs on a single network bring-up',
+    )
+    jobs.set_defaults(ty='jobs')
+    jobs.add_argument('jobfile', type=str,
+        help='Path to a JSON list or JSON lines file of benchmark jobs, as '\
+             'defined in EmulationRunner. Unset job keys default to the '\
+             'experiment and network configurations')
 
     ###########################################################################
     # Experiment configurations
     ###########################################################################
     exp_config = parser.add_argument_group('exp_config')
     exp_config.add_argument('-t', '--trials', type=int, default=1,
-        help='Number of trials')
+        help='Number of trials, or the maximum number of trials with '\
+             '--ci-target')
+    exp_config.add_argument('--ci-target', type=float, metavar='FRACTION',
+        help='If provided, stop running trials once the half-width of the '\
+             '95%% confidence interval of the median throughput is at most '\
+             'this fraction of the median, e.g., 0.05')
+    exp_config.add_argument('--min-trials', type=int,
+        help='With --ci-target, the minimum number of trials (default: '\
+             f'{MIN_ADAPTIVE_TRIALS})')
     exp_config.add_argument('--timeout', type=int,
         help='Experiment timeout, in seconds')
+    exp_config.add_argument('--early-abort', action='store_true',
+        help='With --timeout, abort each trial as soon as the byte progress '\
+             'of the client shows it is certain to miss the timeout, and '\
+             'record it as a timeout with its partial throughput')
+    exp_config.add_argument('--steady-state', action='store_true',
+        help='Record the receive progress of the client during each trial, '\
+             'and include the goodput in steady state, excluding the startup '\
+             'phase, in experiment output')
+    exp_config.add_argument('--steady-state-duration', type=float,
+        metavar='SECONDS',
+        help='If provided, end each transfer once it has been in steady '\
+             'state for this many seconds. Implies --steady-state')
+    exp_config.add_argument('--client-agent', action='store_true',
+        help='Run the requests of all trials in one long-lived client '\
+             'process instead of a new process per trial, so that trials '\
+             'do not include the process startup (only tcp)')
     exp_config.add_argument('--label', type=str, default='NO_LABEL')
     exp_config.add_argument('--logdir', type=str, default='/tmp/atc25-logs',
         help='Directory where host logs are written')
     exp_config.add_argument('--network-statistics', action='store_true',
         help='Include measured network statistics in experiment output')
+    exp_config.add_argument('--telemetry-interval', type=float, metavar='MS',
+        help='If provided, sample the interface counters and queue '\
+             'statistics of the network emulation nodes at this interval '\
+             'during each trial and include them in experiment output')
+    exp_config.add_argument('--qlog', action='store_true',
+        help='Capture qlog files of the client and server in <logdir>/qlog '\
+             'and include their congestion control time series in '\
+             'experiment output (only cloudflare and picoquic)')
+    exp_config.add_argument('--ktls', action='store_true',
+        help='Offload the TLS record encryption of the client and server to '\
+             'the kernel, if supported, and include whether it was active '\
+             'in experiment output (only tcp; requires the tls module)')
+    exp_config.add_argument('--tcp-info-interval', type=float, metavar='MS',
+        help='If provided, sample the TCP_INFO of the connections on the '\
+             'server, and the router if --pep, at this interval during each '\
+             'trial and include them in experiment output (only tcp)')
+    exp_config.add_argument('--capture', action='store_true',
+        help='Capture the packet headers on the primary interfaces during '\
+             'each trial, and include the per-flow goodput, '\
+             'retransmissions, and RTT samples, and the one-way delays '\
+             'across the network emulation nodes in experiment output. The '\
+             'raw captures are discarded.')
+    exp_config.add_argument('--snaplen', type=int, default=CAPTURE_SNAPLEN,
+        help='With --capture, the number of bytes to capture of each packet '\
+             '(default: %(default)s)')
+    exp_config.add_argument('--keep-pcap', action='store_true',
+        help='With --capture, also keep the raw captures in <logdir>/pcap')
     exp_config.add_argument('--topology',
         choices=['direct', 'two_segment'], default='two_segment',
         help='Network topology to use. If "one_segment", uses the network '\
              'path properties for the "near path segment" i.e. Link 1.')
     exp_config.add_argument('--pep', action='store_true',
         help='Enable PEPsal, a connection-splitting TCP PEP')
+    exp_config.add_argument('--instance', type=int, metavar='I',
+        help='Index of this emulation among the emulations running in '\
+             'parallel on this machine. Each instance uses its own host name '\
+             'prefix, subnet, and log directory under --logdir.')
+    exp_config.add_argument('--cpus', type=parse_cpu_list, metavar='LIST',
+        help='Cores to pin the hosts to, e.g., 2-7. Each host gets dedicated '\
+             'cores if there are enough.')
+    exp_config.add_argument('--harness-cpus', type=parse_cpu_list,
+        metavar='LIST', default=DEFAULT_HARNESS_CPUS,
+        help='With --cpus, cores to pin the harness to. These are shared by '\
+             'the harnesses of parallel instances, so that the harness never '\
+             'runs on the cores of the hosts of another instance.')
+    exp_config.add_argument('--sweep', type=str, metavar='FILE',
+        help='JSON or JSONL file of network settings to sweep, e.g., '\
+             '{"delay2": 50, "loss1": 2}. Each setting overrides the '\
+             'net_config options and is applied in place to the same live '\
+             'topology. Outputs one result per setting.')
+    exp_config.add_argument('--config-backend', choices=['batch', 'popen'],
+        default='batch',
+        help='How to execute the ip and tc commands that configure the '\
+             'network: in iproute2 batch mode with one process per host, or '\
+             'with one process per command. The network setup time is '\
+             'logged and recorded in the results.')
 
     ###########################################################################
     # Network Configurations
     ###########################################################################
     net_config = parser.add_argument_group('net_config')
-    net_config.add_argument('--delay1', type=int, default=1, metavar='MS',
+    net_config.add_argument('--delay1', type=int, metavar='MS',
+        default=DEFAULT_NETWORK_SETTING['delay1'],
         help='1/2 RTT on near path segment (to data receiver)')
-    net_config.add_argument('--delay2', type=int, default=25, metavar='MS',
+    net_config.add_argument('--delay2', type=int, metavar='MS',
+        default=DEFAULT_NETWORK_SETTING['delay2'],
         help='1/2 RTT on far path segment')
-    net_config.add_argument('--loss1', type=str, default='1', metavar='PERCENT',
+    net_config.add_argument('--loss1', type=str, metavar='PERCENT',
+        default=DEFAULT_NETWORK_SETTING['loss1'],
         help='loss (in %%) on near path segment')
-    net_config.add_argument('--loss2', type=str, default='0', metavar='PERCENT',
+    net_config.add_argument('--loss2', type=str, metavar='PERCENT',
+        default=DEFAULT_NETWORK_SETTING['loss2'],
         help='loss (in %%) on far path segment')
-    net_config.add_argument('--bw1', type=int, default=100, metavar='MBPS',
+    net_config.add_argument('--bw1', type=int, metavar='MBPS',
+        default=DEFAULT_NETWORK_SETTING['bw1'],
         help='link bandwidth (in Mbps) on near path segment')
-    net_config.add_argument('--bw2', type=int, default=10, metavar='MBPS',
+    net_config.add_argument('--bw2', type=int, metavar='MBPS',
+        default=DEFAULT_NETWORK_SETTING['bw2'],
         help='link bandwidth (in Mbps) on far path segment')
-    net_config.add_argument('--qdisc', type=str, default='red',
+    net_config.add_argument('--qdisc', type=str,
+        default=DEFAULT_NETWORK_SETTING['qdisc'],
         choices=['red', 'bfifo-large', 'bfifo-small', 'pie', 'codel',
                  'policer', 'fq_codel'],
         help='netem queuing discipline')
+    net_config.add_argument('--cross', choices=CROSS_TRAFFIC_KINDS,
+        default=DEFAULT_NETWORK_SETTING['cross'],
+        help='Background cross traffic on a path segment: constant bitrate '\
+             'UDP, web-like TCP flows with Poisson arrivals, or long-lived '\
+             'TCP flows (only two_segment)')
+    net_config.add_argument('--cross-segment', type=int, choices=[1, 2],
+        default=DEFAULT_NETWORK_SETTING['cross_segment'],
+        help='Path segment of the cross traffic')
+    net_config.add_argument('--cross-mbps', type=float, metavar='MBPS',
+        default=DEFAULT_NETWORK_SETTING['cross_mbps'],
+        help='Bitrate of cbr, or average offered load of web cross traffic')
+    net_config.add_argument('--cross-flows', type=int, metavar='N',
+        default=DEFAULT_NETWORK_SETTING['cross_flows'],
+        help='Number of long-lived flows of tcp cross traffic')
 
     ###########################################################################
     # HTTP/1.1+TCP benchmark
@@ -76,6 +194,26 @@ if __name__ == '__main__':
     tcp.add_argument('--keyfile', type=str, default=DEFAULT_SSL_KEYFILE,
         help='Path to SSL key')
 
+    ###########################################################################
+    # Competing HTTP/1.1+TCP flows benchmark
+    ###########################################################################
+    competition = subparsers.add_parser(
+        'competition',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    competition.set_defaults(ty='benchmark', constructor=CompetitionBenchmark)
+    competition.add_argument('-n', type=parse_data_size, default=10000000,
+        help='Number of bytes to download in the HTTP/1.1 GET request of '\
+             'each flow, e.g., 1000, 1K, 1M, 1000000, 1G')
+    competition.add_argument('-cca', '--congestion-control',
+        type=str, default='cubic,bbr',
+        help='Comma-separated flows as CCA[:START_OFFSET_S], e.g., '\
+             '\'bbr,cubic:5\' starts a CUBIC flow 5 seconds after a BBR flow')
+    competition.add_argument('--certfile', type=str, default=DEFAULT_SSL_CERTFILE,
+        help='Path to SSL certificate')
+    competition.add_argument('--keyfile', type=str, default=DEFAULT_SSL_KEYFILE,
+        help='Path to SSL key')
+
     ###########################################################################
     # HTTP/3+QUIC benchmark
     ###########################################################################
@@ -135,32 +273,104 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
-    # Some BBR implementations require pacing.
-    # This includes Cloudflare quiche and Linux kernel versions <5.0.
-    # We automatically set pacing for Linux TCP BBR, but we need to set it
-    # here for user-space implementations.
-    if args.constructor == CloudflareQUICBenchmark and 'bbr' in args.congestion_control:
-        pacing = True
+    # Isolate emulations that run in parallel on the same machine
+    if args.instance is None:
+        prefix, subnet = '', 0
     else:
-        pacing = False
+        prefix, subnet = f'n{args.instance}', args.instance
+        args.logdir = f'{args.logdir}/{args.instance}'
+    init_logdir(args.logdir)
+    batch_config = args.config_backend == 'batch'
+    capture_snaplen = args.snaplen if args.capture else None
+
+    # Keep the harness off the cores reserved for the hosts of any instance
+    if args.cpus:
+        if set(args.harness_cpus) & set(args.cpus):
+            raise ValueError('--harness-cpus must not overlap --cpus')
+        os.sched_setaffinity(0, args.harness_cpus)
+
+    if args.ty == 'daemon':
+        runner = EmulationRunner(args.logdir, prefix=prefix, subnet=subnet,
+                                 cpus=args.cpus, batch_config=batch_config)
+        EmulationDaemon(args.socket, runner, group=args.socket_group).serve()
+        sys.exit(0)
 
-    if args.topology == 'two_segment':
-        net = TwoSegmentNetwork(args.delay1, args.delay2,
-            args.loss1, args.loss2, args.bw1, args.bw2, args.qdisc, pacing)
-        if args.pep:
-            net.start_tcp_pep(logdir=args.logdir)
-    elif args.topology == 'direct':
-        assert not args.pep
-        net = OneSegmentNetwork(args.delay1, args.loss1, args.bw1,
-            args.qdisc, pacing)
+    keys = NETWORK_SETTINGS[args.topology]
+    base_setting = { key: getattr(args, key) for key in keys }
+
+    if args.ty == 'jobs':
+        runner = EmulationRunner(args.logdir, prefix=prefix, subnet=subnet,
+                                 cpus=args.cpus, batch_config=batch_config)
+        try:
+            for job in read_json_file(args.jobfile):
+                topology = job.get('topology', args.topology)
+                base = base_setting if topology == args.topology else {}
+                job = {
+                    'trials': args.trials,
+                    'timeout': args.timeout,
+                    'label': args.label,
+                    'pep': args.pep,
+                    'network_statistics': args.network_statistics,
+                    'telemetry_interval': args.telemetry_interval,
+                    'tcp_info_interval': args.tcp_info_interval,
+                    'qlog': args.qlog,
+                    'ktls': args.ktls,
+                    'capture_snaplen': capture_snaplen,
+                    'keep_pcap': args.keep_pcap,
+                    'min_trials': args.min_trials,
+                    'ci_target': args.ci_target,
+                    'early_abort': args.early_abort,
+                    'steady_state': args.steady_state,
+                    'steady_state_duration': args.steady_state_duration,
+                    'client_agent': args.client_agent,
+                    **job,
+                    'topology': topology,
+                    'network': { **base, **job.get('network', {}) },
+                }
+                INFO(f'job {job}')
+                runner.run(job).print()
+        finally:
+            runner.stop()
+        sys.exit(0)
+
+    if args.ty == 'benchmark':
+        options = TrialOptions(
+            timeout=args.timeout,
+            network_statistics=args.network_statistics,
+            telemetry_interval=args.telemetry_interval,
+            tcp_info_interval=args.tcp_info_interval,
+            capture_snaplen=capture_snaplen,
+            keep_pcap=args.keep_pcap,
+            min_trials=args.min_trials,
+            ci_target=args.ci_target,
+            early_abort=args.early_abort,
+            steady_state=args.steady_state,
+            steady_state_duration=args.steady_state_duration,
+            client_agent=args.client_agent,
+        )
+        pacing = requires_pacing(args.constructor, args.congestion_control)
     else:
-        raise NotImplementedError(args.topology)
+        pacing = False
+    if args.pep and args.topology != 'two_segment':
+        raise ValueError(f'cannot start a TCP PEP in {args.topology} topology')
+    setting = network_setting(args.topology, base_setting)
+    net_kwargs = {}
+    sweep = None
+    if args.ty == 'benchmark' and args.sweep is not None:
+        sweep = read_json_file(args.sweep)
+        # Add the cross traffic hosts if any setting has cross traffic
+        if any(point.get('cross') is not None for point in sweep):
+            net_kwargs['cross_hosts'] = True
+    net = build_network(args.topology, setting, pacing, prefix=prefix,
+                        subnet=subnet, cpus=args.cpus,
+                        batch_config=batch_config, **net_kwargs)
+    if args.pep:
+        net.start_tcp_pep(logdir=args.logdir)
 
     try:
         if args.ty == 'cli':
             CLI(net.net)
         else:
-            init_logdir(args.logdir)
             bm = args.constructor(
                 net,
                 args.label,
@@ -170,12 +380,20 @@ if __name__ == '__main__':
                 certfile=args.certfile,
                 keyfile=args.keyfile,
                 pep=args.pep,
+                qlog=args.qlog,
+                ktls=args.ktls,
             )
-            result = bm.run_benchmark(
-                args.trials,
-                args.timeout,
-                args.network_statistics,
-            )
-            result.print()
+            if sweep is None:
+                result = bm.run_benchmark(args.trials, options=options)
+                result.print()
+            else:
+                bm.start_server()
+                for point in sweep:
+                    setting = network_setting(args.topology,
+                                              { **base_setting, **point })
+                    reconfigure_network(net, args.topology, setting)
+                    result = bm.run_trials(args.trials, options=options)
+                    result.set_network_setting(setting)
+                    result.print()
     finally:
         net.stop()
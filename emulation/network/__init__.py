@@ -1,31 +1,177 @@
 import subprocess
 import sys
+import tempfile
 import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
 
 from common import *
 from mininet.node import Host
 from mininet.net import Mininet
 from mininet.link import TCLink
 
+from .telemetry import PacketCapture, ProgressSampler, TcpInfoTracer, \
+    TelemetrySampler
+from .crosstraffic import CROSS_TRAFFIC_KINDS, CrossTraffic
+from .readiness import listening_ports, wait_until_listening
+
 
 class EmulatedNetwork:
     """
     Defines a basic network in Mininet with two hosts, h1 and h2.
+
+    Multiple networks can run in parallel on the same machine as long as each
+    has a unique host name <prefix> and <subnet> index. The prefix is
+    prepended to every host and interface name, e.g., "h1" and "h1-eth0".
+
+    If <cpus> is provided, the hosts are pinned to dedicated cores from that
+    list so that they do not compete with each other or other processes.
+
+    If <batch_config>, the ip and tc commands that configure the network are
+    executed in iproute2 batch mode, one process per host and command, which
+    sends all the netlink requests from that process instead of forking a
+    process for every command.
     """
     METRICS = ['tx_packets', 'tx_bytes', 'rx_packets', 'rx_bytes']
 
-    def __init__(self, debug: bool=False):
+    def __init__(self, debug: bool=False, prefix: str='', subnet: int=0,
+                 cpus: Optional[List[int]]=None, batch_config: bool=True):
+        self.start_time = time.time()
+        self.setup_time_s = None
         self.net = Mininet(controller=None, link=TCLink)
         self.debug = debug
+        self.prefix = prefix
+        self.subnet = subnet
+        self.cpus = cpus
+        self.cpu_layout = {}
         self.primary_ifaces = []
+        self.bottleneck_mbps = None
+        self.bridged_ifaces = []
         self.iface_to_host = {}
+        self.iface_to_qdisc = {}
+
+        # Queued ip and tc commands, by host and command, while batching
+        self.batch_config = batch_config
+        self.batch = None
+
+        # Background sampler of the network emulation nodes and tracer of TCP
+        # connections, if started
+        self.telemetry = None
+        self.tcp_tracer = None
+        self.capture = None
+
+        # Sender, receiver, and receiver IP of the cross traffic on each path
+        # segment that supports it, and the running cross traffic, if any
+        self.cross_hosts = {}
+        self.cross_traffic = None
 
         # Keep track of background processes for cleanup
         self.background_processes = []
         self.background_threads = []
 
+    def name(self, name: str) -> str:
+        """The name of a host or interface in this network."""
+        return f'{self.prefix}{name}'
+
+    def ip(self, segment: int, host: int) -> str:
+        """The IP address of a host on a path segment in this network."""
+        return subnet_ip(self.subnet, segment, host)
+
+    def pin_cpus(self, hosts: List[Host]):
+        """Assign the cores in <self.cpus> to the hosts, in order. If there
+        are at least as many cores as hosts, every host gets dedicated cores.
+        Otherwise, the hosts share cores round-robin.
+
+        Processes executed on a host are pinned with taskset, and the receive
+        processing of the host's interfaces, which is where the qdiscs of the
+        network emulation nodes do their work, is steered to the same cores
+        with RPS. Must be called after self.iface_to_host is initialized.
+        """
+        if not self.cpus:
+            return
+        for i, host in enumerate(hosts):
+            if len(self.cpus) >= len(hosts):
+                cpus = self.cpus[i::len(hosts)]
+            else:
+                cpus = [self.cpus[i % len(self.cpus)]]
+            self.cpu_layout[host.name] = cpus
+
+            # Pin the host shell, which executes the commands in host.cmd()
+            cpu_list = ','.join([str(cpu) for cpu in cpus])
+            self.popen(None, f'taskset -a -p -c {cpu_list} {host.pid}',
+                       console_logger=TRACE)
+
+        for iface, host in self.iface_to_host.items():
+            mask = cpu_mask(self.cpu_layout[host.name])
+            host.cmd(f'echo {mask} > /sys/class/net/{iface}/queues/rx-0/rps_cpus')
+
+    def _pin_cmd(self, host: Host, cmd: List[str]) -> List[str]:
+        """Prefix the command with taskset if the host is pinned to cores."""
+        cpus = self.cpu_layout.get(host.name)
+        if cpus is None:
+            return cmd
+        cpu_list = ','.join([str(cpu) for cpu in cpus])
+        return ['taskset', '-c', cpu_list] + cmd
+
+    def finish_setup(self):
+        """Record the time to set up the network. Subclasses must call this
+        function at the end of their constructor.
+        """
+        self.setup_time_s = time.time() - self.start_time
+        backend = 'batch' if self.batch_config else 'popen'
+        INFO(f'Network setup time {self.setup_time_s:.3f}s ({backend})')
+
+    @contextmanager
+    def batched(self):
+        """Queue the ip and tc commands executed in this context and execute
+        them on exit, in order, as one batch per host and command. Commands
+        are executed immediately if batch configuration is disabled.
+        """
+        if not self.batch_config or self.batch is not None:
+            yield
+            return
+        self.batch = {}
+        try:
+            yield
+            batch, self.batch = self.batch, None
+            for (host, program), cmds in batch.items():
+                self._execute_batch(host, program, cmds)
+        finally:
+            self.batch = None
+
+    def _execute_batch(self, host: Host, program: str, cmds: List[str]):
+        with tempfile.NamedTemporaryFile('w', suffix='.batch') as f:
+            f.write('\n'.join(cmds) + '\n')
+            f.flush()
+            self.popen(host, f'{program} -batch {f.name}', console_logger=TRACE)
+
+    def ip_cmd(self, host: Host, args: str, console_logger=TRACE):
+        """Execute "ip <args>" on the host, or queue it if batching."""
+        self._iproute2_cmd(host, 'ip', args, console_logger)
+
+    def tc_cmd(self, host: Host, args: str, console_logger=TRACE):
+        """Execute "tc <args>" on the host, or queue it if batching."""
+        self._iproute2_cmd(host, 'tc', args, console_logger)
+
+    def _iproute2_cmd(self, host: Host, program: str, args: str,
+                      console_logger):
+        if self.batch is None:
+            self.popen(host, f'{program} {args}', console_logger=console_logger)
+            return
+        console_logger(f'{host.name} {program} {args} (batch)')
+        self.batch.setdefault((host, program), []).append(args)
+
+    def add_bridge(self, host: Host, ifaces: List[str], bridge: str='br0'):
+        """Bridge the interfaces on the host, e.g., a network emulation node.
+        """
+        self.ip_cmd(host, f'link add name {bridge} type bridge')
+        for iface in ifaces:
+            self.ip_cmd(host, f'link set dev {iface} master {bridge}')
+        self.ip_cmd(host, f'link set dev {bridge} up')
+
     def set_arp_table(self, host: Host, ip: str, mac: str, iface: str):
-        self.popen(host, f'ip neigh add {ip} lladdr {mac} dev {iface} nud permanent')
+        self.ip_cmd(host, f'neigh add {ip} lladdr {mac} dev {iface} nud permanent')
 
     def start_tcpdump(self, logdir: str):
         for iface in self.primary_ifaces:
@@ -35,7 +181,7 @@ class EmulatedNetwork:
 
     def config_iface(self, iface, netem: bool, pacing: bool=False,
                       delay=None, loss=None, bw=None, bdp=None, qdisc=None,
-                      gso=True, tso=True):
+                      gso=True, tso=True, change=False):
         """Configures the given interface <iface>:
         - Netem: whether this is a network emulation node (i.e., delay, loss, etc.
           should be configured)
@@ -43,6 +189,9 @@ class EmulatedNetwork:
         - Delay: <delay>ms delay
         - Base bandwidth: <bw> Mbit/s, range: <bw_min> to <bw_max> Mbit/s
         - Bandwidth-delay product: <bdp> is used to set the queue size
+        - Change: whether to modify the existing qdiscs of a network emulation
+          node in place instead of adding them, i.e., to reconfigure a live
+          network. The interface must have already been configured.
         """
         host = self.iface_to_host[iface]
 
@@ -52,18 +201,27 @@ class EmulatedNetwork:
             # https://groups.google.com/g/bbr-dev/c/zZ5c0qkWqbo/m/QulUwXLZAQAJ
             linux_version = get_linux_version()
             if pacing or linux_version < 5.0:
-                self.popen(host, f'tc qdisc add dev {iface} root handle 2: '\
-                                f'fq pacing', console_logger=TRACE)
+                self.tc_cmd(host, f'qdisc add dev {iface} root handle 2: fq pacing')
             return
 
         # Configure the network emulator node
 
+        # When reconfiguring a live network, the netem qdisc and HTB class are
+        # changed in place. Existing queue management of the same kind is
+        # replaced in place, and of any other kind is deleted first.
+        action = 'change' if change else 'add'
+        replace_leaf = False
+        if change:
+            assert iface in self.iface_to_qdisc, f'{iface} is not configured'
+            replace_leaf = self._clear_queue_management(iface, qdisc)
+        self.iface_to_qdisc[iface] = qdisc
+
         # Add netem with delay variability
-        cmd = f'tc qdisc add dev {iface} root handle 2: '\
-              f'netem delay {delay}ms '
+        cmd = f'qdisc {action} dev {iface} root handle 2: '\
+              f'netem delay {delay}ms'
         if loss is not None and int(loss) > 0:
-            cmd += f'loss {loss}% '
-        self.popen(host, cmd, console_logger=TRACE)
+            cmd += f' loss {loss}%'
+        self.tc_cmd(host, cmd)
 
         # Add HTB for bandwidth
         # Take the min because sch_htb complains about the quantum being too big
@@ -72,24 +230,26 @@ class EmulatedNetwork:
         # twice as high as the policed rate.
         r2q = 10
         quantum = min(int(bw*1000000/8 / r2q), 200000)
-        self.popen(host, f'tc qdisc add dev {iface} parent 2: handle 3: ' \
-                         f'htb default 10', console_logger=TRACE)
+        if not change:
+            self.tc_cmd(host, f'qdisc add dev {iface} parent 2: handle 3: ' \
+                              f'htb default 10')
         htb_rate = int(2*bw) if qdisc == 'policer' else bw
-        self.popen(host, f'tc class add dev {iface} parent 3: ' \
-                         f'classid 10 htb rate {htb_rate}Mbit quantum {quantum}',
-                         console_logger=TRACE)
+        self.tc_cmd(host, f'class {action} dev {iface} parent 3: ' \
+                          f'classid 10 htb rate {htb_rate}Mbit quantum {quantum}')
 
         # Add queue management
         if qdisc == 'policer':
             # Burst time of 10ms
             burst = int(bw * 10 * 1000 / 8)
-            queue_cmd = f'tc filter add dev {iface} parent 3: '\
+            queue_cmd = f'filter add dev {iface} parent 3: '\
                         f'protocol ip u32 match ip src 0.0.0.0/0 '\
                         f'action police rate {bw}mbit burst {burst} '\
                         f'conform-exceed drop'
-            self.popen(host, queue_cmd, console_logger=DEBUG)
+            self.tc_cmd(host, queue_cmd, console_logger=DEBUG)
         elif qdisc is not None:
-            queue_cmd = f'tc qdisc add dev {iface} parent 3:10 handle 11: '
+            # The kernel only replaces a qdisc with one of the same kind
+            queue_cmd = 'replace' if replace_leaf else 'add'
+            queue_cmd = f'qdisc {queue_cmd} dev {iface} parent 3:10 handle 11: '
             if qdisc == 'red':
                 # The harddrop byte limit needs to be a min value or RED will
                 # be unable to calculate the EWMA constant so that min >= avpkt
@@ -120,14 +280,51 @@ class EmulatedNetwork:
                 queue_cmd += f'fq_codel'
             else:
                 raise NotImplementedError(qdisc)
-            self.popen(host, queue_cmd, console_logger=TRACE)
+            self.tc_cmd(host, queue_cmd)
 
         # Turn off tso and gso to send MTU-sized packets
+        if change:
+            return
         gso = 'on' if gso else 'off'
         tso = 'on' if tso else 'off'
         self.popen(host, f'ethtool -K {iface} gso {gso} tso {tso}',
                    console_logger=TRACE)
 
+    @staticmethod
+    def _qdisc_kind(qdisc: Optional[str]) -> Optional[str]:
+        """The kernel qdisc kind of the queue management, e.g., "bfifo" for
+        both "bfifo-large" and "bfifo-small".
+        """
+        if qdisc is not None and qdisc.startswith('bfifo'):
+            return 'bfifo'
+        return qdisc
+
+    def _clear_queue_management(self, iface, qdisc) -> bool:
+        """Removes the queue management on a network emulation node that
+        cannot be replaced in place by the new <qdisc>. The policer is a filter
+        on the HTB qdisc while all others are a leaf qdisc of the HTB class,
+        which the kernel only replaces with a qdisc of the same kind.
+
+        Returns whether the leaf qdisc was kept to be replaced in place.
+        """
+        host = self.iface_to_host[iface]
+        prev_qdisc = self.iface_to_qdisc[iface]
+        if prev_qdisc == 'policer':
+            self.tc_cmd(host, f'filter del dev {iface} parent 3:')
+        elif prev_qdisc is not None:
+            if self._qdisc_kind(prev_qdisc) == self._qdisc_kind(qdisc):
+                return True
+            self.tc_cmd(host, f'qdisc del dev {iface} parent 3:10 handle 11:')
+        return False
+
+    def flush_tcp_metrics(self):
+        """Flush the cached TCP metrics (e.g., ssthresh and RTT) on every host
+        so that connections after reconfiguring a link do not inherit state from
+        the previous network configuration.
+        """
+        for host in self.net.hosts:
+            self.ip_cmd(host, 'tcp_metrics flush all')
+
     def set_tcp_congestion_control(self, cca):
         version = get_linux_version()
         cmd = f'sysctl -w net.ipv4.tcp_congestion_control={cca}'
@@ -139,6 +336,90 @@ class EmulatedNetwork:
             for host in self.net.hosts:
                 self.popen(host, cmd, stderr=False, console_logger=DEBUG)
 
+    def start_cross_traffic(self, kind: str, segment: int, mbps: float,
+                            flows: int):
+        """Start background cross traffic on the path segment, as described
+        in CrossTraffic, until stopped.
+        """
+        assert self.cross_traffic is None, 'cross traffic already started'
+        if segment not in self.cross_hosts:
+            raise ValueError(f'no cross traffic hosts on segment {segment}')
+        sender, receiver, receiver_ip = self.cross_hosts[segment]
+        self.cross_traffic = CrossTraffic(self, sender, receiver, receiver_ip,
+                                          kind, mbps, flows)
+        self.cross_traffic.start()
+
+    def stop_cross_traffic(self):
+        if self.cross_traffic is None:
+            return
+        self.cross_traffic.stop()
+        self.cross_traffic = None
+
+    def start_telemetry(self, interval_ms: float,
+                        duration_s: Optional[float]=None):
+        """Start sampling the interface counters and queue statistics of the
+        interfaces on the network emulation nodes every <interval_ms> in the
+        background. Preallocates enough samples for <duration_s> seconds, or
+        TELEMETRY_MAX_SAMPLES if not provided.
+        """
+        assert self.telemetry is None, 'telemetry already started'
+        if duration_s is None:
+            max_samples = TELEMETRY_MAX_SAMPLES
+        else:
+            max_samples = int(duration_s * 1000 / interval_ms) + 1
+        ifaces = { iface: self.iface_to_host[iface]
+                   for iface in self.iface_to_qdisc }
+        self.telemetry = TelemetrySampler(ifaces, interval_ms, max_samples)
+        self.telemetry.start()
+
+    def stop_telemetry(self) -> Optional[dict]:
+        """Stop sampling and return the encoded samples, if started."""
+        if self.telemetry is None:
+            return None
+        telemetry = self.telemetry.stop()
+        self.telemetry = None
+        return telemetry
+
+    def start_tcp_tracer(self, hosts: List[Host], port: int,
+                         interval_ms: float):
+        """Start sampling the TCP_INFO of the connections to or from <port> on
+        each host every <interval_ms> in the background. Blocks until ready.
+        """
+        assert self.tcp_tracer is None, 'TCP tracer already started'
+        self.tcp_tracer = TcpInfoTracer(self, hosts, port, interval_ms)
+        self.tcp_tracer.start()
+
+    def stop_tcp_tracer(self) -> Optional[dict]:
+        """Stop tracing and return the encoded time series, if started."""
+        if self.tcp_tracer is None:
+            return None
+        tcp_info = self.tcp_tracer.stop()
+        self.tcp_tracer = None
+        return tcp_info
+
+    def start_capture(self, snaplen: int=CAPTURE_SNAPLEN,
+                      bin_ms: float=CAPTURE_BIN_MS,
+                      pcap_prefix: Optional[str]=None):
+        """Start capturing the first <snaplen> bytes of every packet on the
+        primary interfaces, analyzing the captures as they are streamed. The
+        raw captures are discarded unless a <pcap_prefix> is provided. Blocks
+        until ready.
+        """
+        assert self.capture is None, 'capture already started'
+        ifaces = { iface: self.iface_to_host[iface]
+                   for iface in self.primary_ifaces }
+        self.capture = PacketCapture(ifaces, self.bridged_ifaces, snaplen,
+                                     bin_ms, pcap_prefix)
+        self.capture.start()
+
+    def stop_capture(self) -> Optional[dict]:
+        """Stop capturing and return the analyzed metrics, if started."""
+        if self.capture is None:
+            return None
+        capture = self.capture.stop()
+        self.capture = None
+        return capture
+
     def reset_statistics(self):
         """After a reset, an immediate snapshot would return all 0 values.
         """
@@ -158,33 +439,34 @@ class EmulatedNetwork:
         return snapshot
 
     def _read_raw_metrics(self):
-        """Read the current raw metrics.
+        """Read the current raw metrics. Reads the counters of all interfaces
+        in a host's network namespace at once from /proc/<pid>/net/dev, without
+        executing any processes.
         """
+        host_stats = {}
+        for host in set(self.iface_to_host.values()):
+            try:
+                with open(f'/proc/{host.pid}/net/dev') as f:
+                    host_stats[host] = parse_proc_net_dev(f.read())
+            except OSError as e:
+                ERROR(f'failed to get metrics {host.name}: {e}')
+                host_stats[host] = {}
+
         stats = {}
-        for iface in self.iface_to_host:
+        for iface, host in self.iface_to_host.items():
             stats[iface] = {}
             for metric in self.METRICS:
-                stats[iface][metric] = self._read_raw_metric(iface, metric)
+                if iface not in host_stats[host]:
+                    ERROR(f'failed to get metric {iface} {metric}')
+                    stats[iface][metric] = 0
+                else:
+                    stats[iface][metric] = host_stats[host][iface][metric]
         return stats
 
-    def _read_raw_metric(self, iface, metric):
-        """Read a single raw metric.
-        """
-        value = []
-        def append_value(line):
-            value.append(int(line.strip()))
-        cmd = f'cat /sys/class/net/{iface}/statistics/{metric}'
-        host = self.iface_to_host[iface]
-        self.popen(host, cmd, func=append_value)
-        if len(value) == 0:
-            ERROR(f'failed to get metric {iface} {metric}')
-            return 0
-        else:
-            return value[0]
-
     def popen(self, host, cmd, background=False, func=None, timeout=None,
               stdout=False, stderr=True, console_logger=TRACE, logfile=None,
-              raise_error=True):
+              raise_error=True, env=None, cwd=None, abort=None, stdin=False,
+              io=None):
         """
         Start a process that executes a command on the given mininet host.
 
@@ -205,6 +487,18 @@ class EmulatedNetwork:
           function takes as input (line,). Only on mininet hosts.
         - timeout: The cmd timeout, in seconds. Only on mininet hosts and
           synchronous processes.
+        - env: Additional environment variables of the process.
+        - cwd: The working directory of the process. Only on mininet hosts.
+        - abort: A threading.Event that, once set, terminates the process as
+          if it had timed out. Only on mininet hosts and synchronous
+          processes.
+        - stdin: Whether to open a pipe to the stdin of the process, as
+          p.stdin, e.g., to send commands to it. Only on mininet hosts and
+          background processes.
+        - io: A dict to update with the I/O counters of the process in
+          /proc/<pid>/io once it exits, if available, which include those of
+          the children it reaped. Only on mininet hosts and synchronous
+          processes.
 
         Logging parameters:
         - console_logger: Log level function, e.g., DEBUG, for logging to the
@@ -226,8 +520,8 @@ class EmulatedNetwork:
         Returns:
         - If a background process, returns the process and the thread that is
           handling the background process.
-        - If not, returns True if there was a timeout and False if the process
-          executed to completion.
+        - If not, returns True if there was a timeout or the process was
+          aborted, and False if the process executed to completion.
         - For non-zero exitcodes, exits the program unless configured not to.
 
         Raises:
@@ -240,12 +534,15 @@ class EmulatedNetwork:
         console_logger(f'{host_str}{cmd}{background_str}')
 
         # Set debug environment variables.
+        extra_env = env
         env = os.environ.copy()
         env['RUST_BACKTRACE'] = '1'
         if self.debug:
             env['RUST_LOG'] = 'debug'
         else:
             env['RUST_LOG'] = 'info'
+        if extra_env is not None:
+            env.update(extra_env)
 
         # Execute the command on the local host
         if host is None:
@@ -253,6 +550,10 @@ class EmulatedNetwork:
             assert timeout is None
             assert logfile is None
             assert func is None
+            assert cwd is None
+            assert abort is None
+            assert not stdin
+            assert io is None
             p = subprocess.run(cmd, shell=True, text=True, env=env,
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             if p.stdout and stdout:
@@ -268,8 +569,12 @@ class EmulatedNetwork:
         # Execute the command on a mininet host in the background
         if background:
             assert timeout is None
-            p = host.popen(cmd.split(), stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE, text=True, env=env)
+            assert abort is None
+            assert io is None
+            p = host.popen(self._pin_cmd(host, cmd.split()),
+                           stdin=subprocess.PIPE if stdin else None,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           text=True, env=env, cwd=cwd)
             thread = threading.Thread(
                 target=handle_background_process,
                 args=(p, logfile, func),
@@ -280,11 +585,22 @@ class EmulatedNetwork:
             return (p, thread)
 
         # Execute the command synchronously, possibly with a timeout
-        cmd_input = cmd.split()
+        assert not stdin
+        cmd_input = self._pin_cmd(host, cmd.split())
         if timeout is not None:
             cmd_input = ['timeout', f'{timeout}s'] + cmd_input
         p = host.popen(cmd_input, stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE, text=True, env=env)
+                       stderr=subprocess.PIPE, text=True, env=env, cwd=cwd)
+        done = threading.Event()
+        if abort is not None:
+            # Don't poll the process, which would reap it before its I/O
+            # counters are read
+            def terminate_on_abort():
+                while not done.is_set():
+                    if abort.wait(0.1):
+                        p.terminate()
+                        return
+            threading.Thread(target=terminate_on_abort, daemon=True).start()
         for line, stream in read_subprocess_pipe(p):
             if stream == p.stdout and stdout:
                 console_logger(line.strip())
@@ -297,8 +613,13 @@ class EmulatedNetwork:
                 func(line)
 
         # Handle the exitcode
+        if io is not None:
+            io.update(wait_process_io(p) or {})
         exitcode = p.wait()
-        if exitcode == 0:
+        done.set()
+        if abort is not None and abort.is_set():
+            return True
+        elif exitcode == 0:
             return False
         elif exitcode == LINUX_TIMEOUT_EXITCODE:
             return True
@@ -309,6 +630,10 @@ class EmulatedNetwork:
                 raise ValueError(debug_str)
 
     def stop(self):
+        self.stop_cross_traffic()
+        self.stop_telemetry()
+        self.stop_tcp_tracer()
+        self.stop_capture()
         for p in self.background_processes:
             p.terminate()
             p.wait()
@@ -0,0 +1,66 @@
+from typing import Optional
+
+from common import *
+from .readiness import wait_until_listening
+
+CROSS_TRAFFIC_KINDS = ['cbr', 'web', 'tcp']
+
+
+class CrossTraffic:
+    """
+    Background load on one path segment, sent in the same direction as the
+    benchmark's data, from the far end of the segment to the near end, so
+    that it shares the segment's emulated link and queue with the benchmark.
+
+    The load is generated by webserver/cross_traffic.py, with a sink on the
+    receiver and one sender process on the sender, until stopped.
+    """
+    def __init__(self, net, sender, receiver, receiver_ip: str, kind: str,
+                 mbps: float, flows: int, logfile: Optional[str]=None):
+        """Parameters:
+        - net: The EmulatedNetwork to run the processes on.
+        - sender, receiver: The hosts on either end of the segment.
+        - receiver_ip: The IP address of the receiver on the segment.
+        - kind: "cbr" for constant bitrate UDP at <mbps>, "web" for web-like
+          TCP flows with Poisson arrivals and an average load of <mbps>, or
+          "tcp" for <flows> long-lived TCP flows.
+        - logfile: The logfile of the sink and sender, if provided.
+        """
+        if kind not in CROSS_TRAFFIC_KINDS:
+            raise ValueError(f'invalid cross traffic {kind}')
+        self.net = net
+        self.sender = sender
+        self.receiver = receiver
+        self.receiver_ip = receiver_ip
+        self.kind = kind
+        self.mbps = mbps
+        self.flows = flows
+        self.logfile = logfile
+        self.processes = []
+
+    def start(self, timeout: int=SETUP_TIMEOUT):
+        """Start the sink, and the sender once the sink is ready."""
+        cmd = 'python3 webserver/cross_traffic.py'
+        port = CROSS_TRAFFIC_PORT
+
+        p, thread = self.net.popen(self.receiver,
+            f'{cmd} sink --port {port}',
+            background=True, console_logger=DEBUG, logfile=self.logfile)
+        self.processes.append((p, thread))
+        protocol = 'udp' if self.kind == 'cbr' else 'tcp'
+        wait_until_listening(self.receiver, port, protocol, timeout=timeout,
+                             process=p, name='cross traffic sink')
+        p, thread = self.net.popen(self.sender,
+            f'{cmd} {self.kind} --dst {self.receiver_ip} --port {port} '\
+            f'--mbps {self.mbps} --flows {self.flows}',
+            background=True, console_logger=DEBUG, logfile=self.logfile)
+        self.processes.append((p, thread))
+
+    def stop(self):
+        for p, thread in self.processes:
+            p.terminate()
+            p.wait()
+            thread.join()
+            self.net.background_processes.remove(p)
+            self.net.background_threads.remove(thread)
+        self.processes = []
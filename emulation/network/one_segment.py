@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from common import *
 from network import EmulatedNetwork
 
@@ -7,13 +9,17 @@ class OneSegmentNetwork(EmulatedNetwork):
     Defines an emulated network in mininet that directly connects the client /
     data receiver (h1) to the server / data sender (h2) with a single link.
     """
-    def __init__(self, delay, loss, bw, qdisc, pacing):
-        super().__init__()
+    def __init__(self, delay, loss, bw, qdisc, pacing, prefix: str='',
+                 subnet: int=0, cpus: Optional[List[int]]=None,
+                 batch_config: bool=True):
+        super().__init__(prefix=prefix, subnet=subnet, cpus=cpus,
+                         batch_config=batch_config)
+        n = self.name
 
         # Add hosts and switches
-        self.h1 = self.net.addHost('h1', ip='172.16.1.10/24', mac=mac(1))
-        self.h2 = self.net.addHost('h2', ip='172.16.2.10/24', mac=mac(2))
-        self.e1 = self.net.addHost('e1')
+        self.h1 = self.net.addHost(n('h1'), ip=f'{self.ip(1, 10)}/24', mac=mac(1))
+        self.h2 = self.net.addHost(n('h2'), ip=f'{self.ip(2, 10)}/24', mac=mac(2))
+        self.e1 = self.net.addHost(n('e1'))
 
         # Add link
         self.net.addLink(self.h1, self.e1)
@@ -21,32 +27,49 @@ class OneSegmentNetwork(EmulatedNetwork):
         self.net.build()
 
         # Initialize statistics
-        self.primary_ifaces = ['h1-eth0', 'h2-eth0']
+        self.primary_ifaces = [n('h1-eth0'), n('h2-eth0')]
+        self.bridged_ifaces = [(n('h1-eth0'), n('h2-eth0'))]
         self.iface_to_host = {
-            'h1-eth0': self.h1,
-            'h2-eth0': self.h2,
-            'e1-eth0': self.e1,
-            'e1-eth1': self.e1,
+            n('h1-eth0'): self.h1,
+            n('h2-eth0'): self.h2,
+            n('e1-eth0'): self.e1,
+            n('e1-eth1'): self.e1,
         }
+        self.pin_cpus([self.h1, self.h2, self.e1])
+
+        with self.batched():
+            # Setup routing
+            self.ip_cmd(self.h1, f"route add {self.ip(2, 0)}/24 via {self.ip(1, 10)}")
+            self.ip_cmd(self.h2, f"route add {self.ip(1, 0)}/24 via {self.ip(2, 10)}")
+            # Bridging on the network emulation nodes
+            self.add_bridge(self.e1, [n('e1-eth0'), n('e1-eth1')])
 
-        # Setup routing
-        self.popen(self.h1, "ip route add 172.16.2.0/24 via 172.16.1.10")
-        self.popen(self.h2, "ip route add 172.16.1.0/24 via 172.16.2.10")
-        # Bridging on the network emulation nodes
-        self.popen(self.e1, "brctl addbr br0")
-        self.popen(self.e1, "brctl addif br0 e1-eth0")
-        self.popen(self.e1, "brctl addif br0 e1-eth1")
-        self.popen(self.e1, "ip link set dev br0 up")
+            # Prepopulate arp table
+            self.set_arp_table(self.h1, self.ip(2, 10), mac(2), n('h1-eth0'))
+            self.set_arp_table(self.h2, self.ip(1, 10), mac(1), n('h2-eth0'))
 
-        # Prepopulate arp table
-        self.set_arp_table(self.h1, '172.16.2.10', mac(2), 'h1-eth0')
-        self.set_arp_table(self.h2, '172.16.1.10', mac(1), 'h2-eth0')
+            # Configure link latency, delay, bandwidth, and queue size
+            self.config_iface(n('h1-eth0'), False, pacing)
+            self.config_iface(n('h2-eth0'), False, pacing)
+            self.config_links(delay, loss, bw, qdisc)
+        self.finish_setup()
 
-        # Configure link latency, delay, bandwidth, and queue size
+    def config_links(self, delay, loss, bw, qdisc, change=False):
+        """Configure the network emulation node on the link. If <change>,
+        modifies the link of the live network in place.
+        """
         # https://unix.stackexchange.com/questions/100785/bucket-size-in-tbf
         bdp = calculate_bdp(delay, 0, bw, bw)
-        rtt = 2 * delay
-        self.config_iface('h1-eth0', False, pacing)
-        self.config_iface('h2-eth0', False, pacing)
-        self.config_iface('e1-eth0', True, False, delay, loss, bw, bdp, qdisc)
-        self.config_iface('e1-eth1', True, False, delay, loss, bw, bdp, qdisc)
+        self.bottleneck_mbps = bw
+        for iface in [self.name('e1-eth0'), self.name('e1-eth1')]:
+            self.config_iface(iface, True, False, delay, loss, bw, bdp, qdisc,
+                              change=change)
+
+    def reconfigure(self, delay, loss, bw, qdisc):
+        """Switch the delay, loss, bandwidth, and queuing discipline of the
+        live network without rebuilding the topology. Background processes,
+        e.g., the server, keep running.
+        """
+        with self.batched():
+            self.config_links(delay, loss, bw, qdisc, change=True)
+            self.flush_tcp_metrics()
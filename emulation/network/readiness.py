@@ -0,0 +1,57 @@
+"""
+Readiness probes that block until a process serves on its port in the network
+namespace of a mininet host, instead of until it prints a line of output,
+which is missed if the line arrives before the wait starts. The sockets of the
+namespace are read from /proc/<pid>/net/ of the host without executing any
+processes, at intervals that back off exponentially from
+READINESS_MIN_INTERVAL_S to READINESS_MAX_INTERVAL_S.
+"""
+import time
+from typing import Set
+
+from common import *
+
+# The kernel's socket states in /proc/net/, where a UDP server socket is
+# bound but not connected
+SOCKET_STATES = {
+    'tcp': '0A',  # TCP_LISTEN
+    'udp': '07',  # TCP_CLOSE
+}
+
+
+def listening_ports(host, protocol: str) -> Set[int]:
+    """The TCP ports with a listening socket, or the UDP ports with a bound
+    socket, on IPv4 or IPv6 in the host's network namespace.
+    """
+    ports = set()
+    for family in ['', '6']:
+        try:
+            with open(f'/proc/{host.pid}/net/{protocol}{family}') as f:
+                ports |= parse_proc_net_sockets(f.read(),
+                                                SOCKET_STATES[protocol])
+        except FileNotFoundError:
+            # IPv6 is disabled
+            continue
+    return ports
+
+def wait_until_listening(host, port: int, protocol: str='tcp',
+                         timeout: float=SETUP_TIMEOUT, process=None,
+                         name: str='server'):
+    """Block until a process listens on the TCP <port>, or is bound to the
+    UDP <port>, in the host's network namespace.
+
+    Raises:
+    - TimeoutError if the port is not ready after <timeout> seconds.
+    - RuntimeError if the <process>, if provided, exits before then.
+    """
+    deadline = time.monotonic() + timeout
+    interval = READINESS_MIN_INTERVAL_S
+    while port not in listening_ports(host, protocol):
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'{name} exited with {process.returncode} '
+                               f'before listening on {protocol} port {port}')
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f'{name} timeout {timeout}s')
+        time.sleep(min(interval, remaining))
+        interval = min(2 * interval, READINESS_MAX_INTERVAL_S)
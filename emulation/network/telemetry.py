@@ -0,0 +1,405 @@
+import array
+import json
+import re
+import select
+import subprocess
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from common import *
+from progress import ProgressMonitor
+from pcap import DELAY_COLUMNS, FLOW_COLUMNS, DelayMatcher, FlowAnalyzer, \
+    iter_pcap, parse_packet
+
+
+class TelemetrySampler:
+    """
+    Samples the interface counters and queue statistics of the interfaces on
+    the network emulation nodes at a fixed interval in a background thread.
+
+    The interface counters are read from /proc/<pid>/net/dev of each host,
+    and the qdisc statistics from one long-running `tc -s -j -batch -` process
+    per host, so that taking a sample does not execute any processes. Samples
+    are written to a preallocated array of <max_samples> rows, after which
+    sampling stops.
+    """
+    IFACE_FIELDS = ['tx_bytes', 'tx_packets', 'rx_bytes', 'rx_packets']
+    QDISC_FIELDS = ['backlog', 'qlen', 'drops', 'overlimits', 'marks',
+                    'loss_drops']
+
+    def __init__(self, iface_to_host: dict, interval_ms: float,
+                 max_samples: int=TELEMETRY_MAX_SAMPLES):
+        """Parameters:
+        - iface_to_host: The interfaces to sample and their hosts.
+        - interval_ms: The sampling interval, in ms.
+        - max_samples: The maximum number of samples.
+        """
+        self.ifaces = sorted(iface_to_host.keys())
+        self.iface_to_host = iface_to_host
+        self.hosts = []
+        for iface in self.ifaces:
+            if iface_to_host[iface] not in self.hosts:
+                self.hosts.append(iface_to_host[iface])
+        self.interval_ms = interval_ms
+        self.max_samples = max_samples
+        self.columns = ['time_us']
+        for iface in self.ifaces:
+            for field in self.IFACE_FIELDS + self.QDISC_FIELDS:
+                self.columns.append(f'{iface}:{field}')
+
+        self.data = array.array('q', bytes(8 * max_samples * len(self.columns)))
+        self.num_samples = 0
+        self.tc_processes = {}
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        for host in self.hosts:
+            self.tc_processes[host] = host.popen(
+                ['tc', '-s', '-j', '-batch', '-'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, text=True,
+            )
+        self.start_time = time.monotonic()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.start()
+
+    def stop(self) -> dict:
+        """Stop sampling and return the samples, compactly encoded with
+        encode_columns() so that every column is a cumulative counter over
+        time. Decode with decode_columns(data, len(columns)).
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        for p in self.tc_processes.values():
+            p.stdin.close()
+            p.wait()
+        self.tc_processes = {}
+
+        num_columns = len(self.columns)
+        columns = []
+        for i in range(num_columns):
+            end = self.num_samples * num_columns
+            columns.append(self.data[i:end:num_columns])
+        return {
+            'interval_ms': self.interval_ms,
+            'num_samples': self.num_samples,
+            'columns': self.columns,
+            'data': encode_columns(columns),
+        }
+
+    def _run(self):
+        interval_s = self.interval_ms / 1000.
+        next_time = time.monotonic()
+        while not self.stopped.is_set():
+            if self.num_samples == self.max_samples:
+                WARN(f'telemetry stopped after {self.max_samples} samples')
+                return
+            try:
+                self._sample()
+            except Exception as e:
+                ERROR(f'telemetry failed: {e}')
+                return
+            next_time += interval_s
+            self.stopped.wait(max(0, next_time - time.monotonic()))
+
+    def _sample(self):
+        now = time.monotonic()
+        iface_stats = {}
+        qdisc_stats = {}
+        for host in self.hosts:
+            with open(f'/proc/{host.pid}/net/dev') as f:
+                iface_stats.update(parse_proc_net_dev(f.read()))
+            p = self.tc_processes[host]
+            p.stdin.write('qdisc show\n')
+            p.stdin.flush()
+            line = p.stdout.readline()
+            if not line:
+                raise ValueError(f'{host.name} tc exited')
+            qdisc_stats.update(parse_qdisc_stats(json.loads(line)))
+
+        row = [int((now - self.start_time) * 1000000)]
+        for iface in self.ifaces:
+            stats = iface_stats.get(iface, {})
+            for field in self.IFACE_FIELDS:
+                row.append(stats.get(field, 0))
+            stats = qdisc_stats.get(iface, {})
+            for field in self.QDISC_FIELDS:
+                row.append(stats.get(field, 0))
+        start = self.num_samples * len(self.columns)
+        self.data[start:start + len(row)] = array.array('q', row)
+        self.num_samples += 1
+
+
+class ProgressSampler:
+    """
+    Feeds the bytes received on the interfaces of a client host to a
+    ProgressMonitor at a fixed interval in a background thread, for clients
+    that do not report their own progress. The counters include the packet
+    headers, so the projected completion time is slightly early, i.e., the
+    trial is aborted later than it could be.
+    """
+    def __init__(self, host, monitor: ProgressMonitor,
+                 interval_ms: float=PROGRESS_INTERVAL_MS):
+        self.host = host
+        self.monitor = monitor
+        self.interval_ms = interval_ms
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.start_bytes = self._rx_bytes()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _rx_bytes(self) -> int:
+        with open(f'/proc/{self.host.pid}/net/dev') as f:
+            stats = parse_proc_net_dev(f.read())
+        return sum(iface['rx_bytes'] for name, iface in stats.items()
+                   if name != 'lo')
+
+    def _run(self):
+        interval_s = self.interval_ms / 1000.
+        while not self.stopped.wait(interval_s):
+            try:
+                num_bytes = self._rx_bytes() - self.start_bytes
+            except OSError as e:
+                ERROR(f'progress sampling failed: {e}')
+                return
+            now = time.monotonic() - self.start_time
+            if self.monitor.update(now, num_bytes):
+                return
+
+
+class TcpInfoTracer:
+    """
+    Traces the TCP_INFO of the connections to or from a port on each host by
+    running tcp_tracer.py in the background on the host. Each connection is a
+    time series of the following columns, where the times are in us since the
+    tracer started and the BBR gains are multiplied by 1000. Missing values,
+    e.g., the BBR state for other CCAs, are 0.
+    """
+    COLUMNS = ['time_us', 'cwnd', 'srtt_us', 'retrans', 'pacing_rate_bps',
+               'delivery_rate_bps', 'bbr_bw_bps', 'bbr_mrtt_us',
+               'bbr_pacing_gain', 'bbr_cwnd_gain']
+
+    def __init__(self, net, hosts: list, port: int, interval_ms: float):
+        """Parameters:
+        - net: The EmulatedNetwork of the hosts.
+        - hosts: The hosts to trace.
+        - port: The port of the connections to trace.
+        - interval_ms: The sampling interval, in ms.
+        """
+        self.net = net
+        self.hosts = hosts
+        self.port = port
+        self.interval_ms = interval_ms
+        self.processes = []
+        self.connections = { host.name: {} for host in hosts }
+        self.overhead = {}
+
+    def start(self, timeout: int=SETUP_TIMEOUT):
+        """Start the tracers and block until they are ready."""
+        cmd = f'python3 emulation/tcp_tracer.py --port {self.port} '\
+              f'--interval-ms {self.interval_ms}'
+        for host in self.hosts:
+            condition = threading.Condition()
+            def parse_line(line, host=host, condition=condition):
+                if self._parse_line(host, line):
+                    with condition:
+                        condition.notify()
+            with condition:
+                self.processes.append(self.net.popen(host, cmd,
+                    background=True, console_logger=DEBUG, func=parse_line))
+                if not condition.wait(timeout=timeout):
+                    raise TimeoutError(f'start_tcp_tracer timeout {timeout}s')
+
+    def stop(self) -> dict:
+        """Stop the tracers and return the time series of every connection on
+        every host, compactly encoded with encode_columns(), and the overhead
+        of each tracer.
+        """
+        for p, thread in self.processes:
+            p.terminate()
+            p.wait()
+            thread.join()
+            self.net.background_processes.remove(p)
+            self.net.background_threads.remove(thread)
+        self.processes = []
+
+        hosts = {}
+        for host, connections in self.connections.items():
+            hosts[host] = {
+                'overhead': self.overhead.get(host),
+                'connections': [],
+            }
+            for (local, peer), rows in connections.items():
+                hosts[host]['connections'].append({
+                    'local': local,
+                    'peer': peer,
+                    'num_samples': len(rows),
+                    'data': encode_columns(list(zip(*rows))),
+                })
+        return {
+            'interval_ms': self.interval_ms,
+            'columns': self.COLUMNS,
+            'hosts': hosts,
+        }
+
+    def _parse_line(self, host, line) -> bool:
+        """Parse a line of tracer output. Returns whether the tracer is ready.
+        """
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            return False
+        if 'ready' in record:
+            return True
+        if 'overhead' in record:
+            self.overhead[host.name] = record['overhead']
+            return False
+        connections = self.connections[host.name]
+        for info in record['connections']:
+            key = (info['local'], info['peer'])
+            connections.setdefault(key, []).append([
+                record['time_us'],
+                info.get('cwnd', 0),
+                round(info.get('srtt_ms', 0) * 1000),
+                info.get('retrans', 0),
+                info.get('pacing_rate_bps', 0),
+                info.get('delivery_rate_bps', 0),
+                info.get('bbr_bw_bps', 0),
+                round(info.get('bbr_mrtt_ms', 0) * 1000),
+                round(info.get('bbr_pacing_gain', 0) * 1000),
+                round(info.get('bbr_cwnd_gain', 0) * 1000),
+            ])
+        return False
+
+
+class PacketCapture:
+    """
+    Captures the packet headers on the primary interfaces with one tcpdump per
+    interface that writes the capture to its stdout, and analyzes each stream
+    in a background thread as it is captured. Only the compact per-flow
+    metrics of each interface and the one-way delays across each network
+    emulation node are kept, unless the raw capture is also written to
+    <pcap_prefix><iface>.pcap.
+
+    Decoding the headers in Python limits the packet rate that can be analyzed.
+    Packets that tcpdump could not keep up with are reported as dropped.
+    """
+    def __init__(self, iface_to_host: dict, bridged_ifaces: List[Tuple[str, str]],
+                 snaplen: int, bin_ms: float, pcap_prefix: Optional[str]=None):
+        """Parameters:
+        - iface_to_host: The interfaces to capture and their hosts.
+        - bridged_ifaces: The pairs of interfaces on either side of each
+          network emulation node.
+        - snaplen: The number of bytes to capture of each packet.
+        - bin_ms: The duration of the time bins of the time series, in ms.
+        - pcap_prefix: If provided, the path prefix of the raw captures.
+        """
+        self.iface_to_host = iface_to_host
+        self.bridged_ifaces = [pair for pair in bridged_ifaces
+                               if all(iface in iface_to_host for iface in pair)]
+        self.snaplen = snaplen
+        self.bin_ms = bin_ms
+        self.pcap_prefix = pcap_prefix
+        self.processes = {}
+        self.threads = []
+        self.num_packets = {}
+        self.analyzers = {}
+        self.delay_matchers = []
+        self.matchers = {}
+
+    def start(self, timeout: int=SETUP_TIMEOUT):
+        """Start the captures and block until tcpdump is listening on every
+        interface.
+        """
+        self.start_time = time.time()
+        for pair in self.bridged_ifaces:
+            matcher = DelayMatcher(pair, self.start_time, self.bin_ms)
+            lock = threading.Lock()
+            self.delay_matchers.append(matcher)
+            for iface in pair:
+                self.matchers[iface] = (matcher, lock)
+        for iface, host in self.iface_to_host.items():
+            cmd = ['tcpdump', '-i', iface, '-s', str(self.snaplen), '-n',
+                   '-U', '-B', '4096', '-w', '-']
+            p = host.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.processes[iface] = p
+            self.analyzers[iface] = FlowAnalyzer(self.start_time, self.bin_ms)
+            self.num_packets[iface] = 0
+
+            # tcpdump reports that it is listening on stderr
+            ready, _, _ = select.select([p.stderr], [], [], timeout)
+            if not ready or b'listening on' not in p.stderr.readline():
+                raise TimeoutError(f'start_capture timeout {timeout}s')
+            thread = threading.Thread(target=self._run, args=(iface, p.stdout))
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self) -> dict:
+        """Stop the captures and return the metrics of every flow on every
+        interface and the delays across every network emulation node, with
+        their time series compactly encoded with encode_columns().
+        """
+        dropped = {}
+        for iface, p in self.processes.items():
+            p.terminate()
+            p.wait()
+            stderr = p.stderr.read()
+            match = re.search(rb'(\d+) packets? dropped by kernel', stderr)
+            dropped[iface] = int(match.group(1)) if match else None
+        for thread in self.threads:
+            thread.join()
+        self.processes = {}
+        self.threads = []
+
+        ifaces = {}
+        for iface, analyzer in self.analyzers.items():
+            ifaces[iface] = {
+                'num_packets': self.num_packets[iface],
+                'dropped': dropped.get(iface),
+                'flows': analyzer.summary(),
+            }
+        bridges = {}
+        for matcher in self.delay_matchers:
+            bridges.update(matcher.summary())
+        return {
+            'snaplen': self.snaplen,
+            'bin_ms': self.bin_ms,
+            'flow_columns': FLOW_COLUMNS,
+            'delay_columns': DELAY_COLUMNS,
+            'ifaces': ifaces,
+            'bridges': bridges,
+        }
+
+    def _run(self, iface, stdout):
+        analyzer = self.analyzers[iface]
+        matcher, lock = self.matchers.get(iface, (None, None))
+        copy = None
+        if self.pcap_prefix is not None:
+            copy = open(f'{self.pcap_prefix}{iface}.pcap', 'wb')
+        try:
+            for ts, _, data in iter_pcap(stdout, copy):
+                self.num_packets[iface] += 1
+                packet = parse_packet(data)
+                if packet is None:
+                    continue
+                analyzer.add_packet(ts, packet)
+                if matcher is not None:
+                    with lock:
+                        matcher.add_packet(iface, ts, packet)
+        except Exception as e:
+            ERROR(f'{iface} capture failed: {e}')
+        finally:
+            if copy is not None:
+                copy.close()
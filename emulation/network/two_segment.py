@@ -1,6 +1,7 @@
-import threading
+from typing import List, Optional
+
 from common import *
-from network import EmulatedNetwork
+from network import EmulatedNetwork, wait_until_listening
 
 
 class TwoSegmentNetwork(EmulatedNetwork):
@@ -9,97 +10,179 @@ class TwoSegmentNetwork(EmulatedNetwork):
     client and the server. The 1st link is between the client / data receiver
     (h1) and the router (r1), and the 2nd link is between the router (r1) and
     the server / data sender (h2).
+
+    With cross traffic, or if <cross_hosts>, the x1 and x2 hosts bridge the
+    links between the endpoints and the network emulation nodes, i.e., h1-x1-e1
+    and e2-x2-h2, so that they share the emulated links with the endpoints.
+    Cross traffic on the 1st segment is sent from r1 to x1, and on the 2nd
+    segment from x2 to r1, as configured by <cross>, <cross_segment>,
+    <cross_mbps>, and <cross_flows> (see start_cross_traffic()).
     """
-    def __init__(self, delay1, delay2, loss1, loss2, bw1, bw2, qdisc, pacing):
-        super().__init__()
+    def __init__(self, delay1, delay2, loss1, loss2, bw1, bw2, qdisc, pacing,
+                 cross: Optional[str]=None,
+                 cross_segment: int=DEFAULT_NETWORK_SETTING['cross_segment'],
+                 cross_mbps: float=DEFAULT_NETWORK_SETTING['cross_mbps'],
+                 cross_flows: int=DEFAULT_NETWORK_SETTING['cross_flows'],
+                 cross_hosts: bool=False, prefix: str='', subnet: int=0,
+                 cpus: Optional[List[int]]=None, batch_config: bool=True):
+        super().__init__(prefix=prefix, subnet=subnet, cpus=cpus,
+                         batch_config=batch_config)
+        n = self.name
 
         # Add hosts, switches, and network emulation nodes
-        self.h1 = self.net.addHost('h1', ip='172.16.1.10/24', mac=mac(1))
-        self.h2 = self.net.addHost('h2', ip='172.16.2.10/24', mac=mac(2))
-        self.r1 = self.net.addHost('r1')
-        self.e1 = self.net.addHost('e1')
-        self.e2 = self.net.addHost('e2')
+        self.h1 = self.net.addHost(n('h1'), ip=f'{self.ip(1, 10)}/24', mac=mac(1))
+        self.h2 = self.net.addHost(n('h2'), ip=f'{self.ip(2, 10)}/24', mac=mac(2))
+        self.r1 = self.net.addHost(n('r1'))
+        self.e1 = self.net.addHost(n('e1'))
+        self.e2 = self.net.addHost(n('e2'))
+        cross_hosts = cross_hosts or cross is not None
+        if cross_hosts:
+            self.x1 = self.net.addHost(n('x1'))
+            self.x2 = self.net.addHost(n('x2'))
 
         # Add links
-        self.net.addLink(self.h1, self.e1)
+        if cross_hosts:
+            self.net.addLink(self.h1, self.x1)
+            self.net.addLink(self.x1, self.e1)
+        else:
+            self.net.addLink(self.h1, self.e1)
         self.net.addLink(self.e1, self.r1)
         self.net.addLink(self.r1, self.e2)
-        self.net.addLink(self.e2, self.h2)
+        if cross_hosts:
+            self.net.addLink(self.e2, self.x2)
+            self.net.addLink(self.x2, self.h2)
+        else:
+            self.net.addLink(self.e2, self.h2)
         self.net.build()
 
         # Initialize statistics
-        self.primary_ifaces = ['h1-eth0', 'r1-eth0', 'r1-eth1', 'h2-eth0']
+        self.primary_ifaces = [n('h1-eth0'), n('r1-eth0'), n('r1-eth1'),
+                               n('h2-eth0')]
+        self.bridged_ifaces = [(n('h1-eth0'), n('r1-eth0')),
+                               (n('r1-eth1'), n('h2-eth0'))]
         self.iface_to_host = {
-            'h1-eth0': self.h1,
-            'r1-eth0': self.r1,
-            'r1-eth1': self.r1,
-            'h2-eth0': self.h2,
-            'e1-eth0': self.e1,
-            'e1-eth1': self.e1,
-            'e2-eth0': self.e2,
-            'e2-eth1': self.e2,
+            n('h1-eth0'): self.h1,
+            n('r1-eth0'): self.r1,
+            n('r1-eth1'): self.r1,
+            n('h2-eth0'): self.h2,
+            n('e1-eth0'): self.e1,
+            n('e1-eth1'): self.e1,
+            n('e2-eth0'): self.e2,
+            n('e2-eth1'): self.e2,
         }
+        hosts = [self.h1, self.h2, self.r1, self.e1, self.e2]
+        if cross_hosts:
+            for host in ['x1', 'x2']:
+                self.iface_to_host[n(f'{host}-eth0')] = getattr(self, host)
+                self.iface_to_host[n(f'{host}-eth1')] = getattr(self, host)
+            hosts += [self.x1, self.x2]
+            self.cross_hosts = {
+                1: (self.r1, self.x1, self.ip(1, 20)),
+                2: (self.x2, self.r1, self.ip(2, 1)),
+            }
+        self.pin_cpus(hosts)
 
         # Setup routing and forwarding
-        self.popen(self.r1, "ifconfig r1-eth0 0")
-        self.popen(self.r1, "ifconfig r1-eth1 0")
-        self.popen(self.r1, f"ifconfig r1-eth0 hw ether {mac(3)}")
-        self.popen(self.r1, f"ifconfig r1-eth1 hw ether {mac(4)}")
-        self.popen(self.r1, "ip addr add 172.16.1.1/24 brd + dev r1-eth0")
-        self.popen(self.r1, "ip addr add 172.16.2.1/24 brd + dev r1-eth1")
-        self.r1.cmd("echo 1 > /proc/sys/net/ipv4/ip_forward")
-        self.popen(self.h1, "ip route add 172.16.2.0/24 via 172.16.1.1")
-        self.popen(self.h2, "ip route add 172.16.1.0/24 via 172.16.2.1")
-
-        # Set up bridging on the network emulation nodes
-        self.popen(self.e1, "brctl addbr br0")
-        self.popen(self.e1, "brctl addif br0 e1-eth0")
-        self.popen(self.e1, "brctl addif br0 e1-eth1")
-        self.popen(self.e1, "ip link set dev br0 up")
-        self.popen(self.e2, "brctl addbr br0")
-        self.popen(self.e2, "brctl addif br0 e2-eth0")
-        self.popen(self.e2, "brctl addif br0 e2-eth1")
-        self.popen(self.e2, "ip link set dev br0 up")
-
-        # Prepopulate arp table
-        self.set_arp_table(self.h1, '172.16.1.1', mac(3), 'h1-eth0')
-        self.set_arp_table(self.r1, '172.16.1.10', mac(1), 'r1-eth0')
-        self.set_arp_table(self.r1, '172.16.2.10', mac(2), 'r1-eth1')
-        self.set_arp_table(self.h2, '172.16.2.1', mac(4), 'h2-eth0')
-
-        # Configure link latency, delay, bandwidth, and queue size
+        with self.batched():
+            self.ip_cmd(self.r1, f"addr flush dev {n('r1-eth0')}")
+            self.ip_cmd(self.r1, f"addr flush dev {n('r1-eth1')}")
+            self.ip_cmd(self.r1, f"link set dev {n('r1-eth0')} address {mac(3)}")
+            self.ip_cmd(self.r1, f"link set dev {n('r1-eth1')} address {mac(4)}")
+            self.ip_cmd(self.r1, f"addr add {self.ip(1, 1)}/24 brd + dev {n('r1-eth0')}")
+            self.ip_cmd(self.r1, f"addr add {self.ip(2, 1)}/24 brd + dev {n('r1-eth1')}")
+            self.r1.cmd("echo 1 > /proc/sys/net/ipv4/ip_forward")
+            self.ip_cmd(self.h1, f"route add {self.ip(2, 0)}/24 via {self.ip(1, 1)}")
+            self.ip_cmd(self.h2, f"route add {self.ip(1, 0)}/24 via {self.ip(2, 1)}")
+
+            # Set up bridging on the network emulation nodes
+            self.add_bridge(self.e1, [n('e1-eth0'), n('e1-eth1')])
+            self.add_bridge(self.e2, [n('e2-eth0'), n('e2-eth1')])
+
+            # Prepopulate arp table
+            self.set_arp_table(self.h1, self.ip(1, 1), mac(3), n('h1-eth0'))
+            self.set_arp_table(self.r1, self.ip(1, 10), mac(1), n('r1-eth0'))
+            self.set_arp_table(self.r1, self.ip(2, 10), mac(2), n('r1-eth1'))
+            self.set_arp_table(self.h2, self.ip(2, 1), mac(4), n('h2-eth0'))
+
+            # Set up the cross traffic hosts as bridges with their own address
+            if cross_hosts:
+                for host, segment, digit in [(self.x1, 1, 5), (self.x2, 2, 6)]:
+                    router_iface = n(f'r1-eth{segment - 1}')
+                    self.add_bridge(host, [f'{host.name}-eth0',
+                                           f'{host.name}-eth1'])
+                    self.ip_cmd(host, f'link set dev br0 address {mac(digit)}')
+                    self.ip_cmd(host, f'addr add {self.ip(segment, 20)}/24 dev br0')
+                    self.set_arp_table(host, self.ip(segment, 1),
+                                       mac(segment + 2), 'br0')
+                    self.set_arp_table(self.r1, self.ip(segment, 20),
+                                       mac(digit), router_iface)
+
+            # Configure link latency, delay, bandwidth, and queue size
+            self.config_iface(n('h1-eth0'), False, pacing)
+            self.config_iface(n('r1-eth0'), False, pacing)
+            self.config_iface(n('r1-eth1'), False, pacing)
+            self.config_iface(n('h2-eth0'), False, pacing)
+            self.config_links(delay1, delay2, loss1, loss2, bw1, bw2, qdisc)
+        if cross is not None:
+            self.start_cross_traffic(cross, cross_segment, cross_mbps,
+                                     cross_flows)
+        self.finish_setup()
+
+    def config_links(self, delay1, delay2, loss1, loss2, bw1, bw2, qdisc,
+                     change=False):
+        """Configure the network emulation nodes on both path segments. If
+        <change>, modifies the links of the live network in place.
+        """
         # https://unix.stackexchange.com/questions/100785/bucket-size-in-tbf
-        rtt = 2 * (delay1 + delay2)
         bdp = calculate_bdp(delay1, delay2, bw1, bw2)
-        self.config_iface('h1-eth0', False, pacing)
-        self.config_iface('r1-eth0', False, pacing)
-        self.config_iface('r1-eth1', False, pacing)
-        self.config_iface('h2-eth0', False, pacing)
-        self.config_iface('e1-eth0', True, False, delay1, loss1, bw1, bdp, qdisc)
-        self.config_iface('e1-eth1', True, False, delay1, loss1, bw1, bdp, qdisc)
-        self.config_iface('e2-eth0', True, False, delay2, loss2, bw2, bdp, qdisc)
-        self.config_iface('e2-eth1', True, False, delay2, loss2, bw2, bdp, qdisc)
+        self.bottleneck_mbps = min(bw1, bw2)
+        for iface in [self.name('e1-eth0'), self.name('e1-eth1')]:
+            self.config_iface(iface, True, False, delay1, loss1, bw1, bdp,
+                              qdisc, change=change)
+        for iface in [self.name('e2-eth0'), self.name('e2-eth1')]:
+            self.config_iface(iface, True, False, delay2, loss2, bw2, bdp,
+                              qdisc, change=change)
+
+    def reconfigure(self, delay1, delay2, loss1, loss2, bw1, bw2, qdisc,
+                    cross: Optional[str]=None,
+                    cross_segment: int=DEFAULT_NETWORK_SETTING['cross_segment'],
+                    cross_mbps: float=DEFAULT_NETWORK_SETTING['cross_mbps'],
+                    cross_flows: int=DEFAULT_NETWORK_SETTING['cross_flows']):
+        """Switch the delay, loss, bandwidth, queuing discipline, and cross
+        traffic of the live network without rebuilding the topology.
+        Background processes, e.g., the server and the TCP PEP, keep running,
+        but the cross traffic is restarted.
+        """
+        self.stop_cross_traffic()
+        with self.batched():
+            self.config_links(delay1, delay2, loss1, loss2, bw1, bw2, qdisc,
+                              change=True)
+            self.flush_tcp_metrics()
+        if cross is not None:
+            self.start_cross_traffic(cross, cross_segment, cross_mbps,
+                                     cross_flows)
 
     def start_tcp_pep(self, logdir: str, timeout: int=SETUP_TIMEOUT):
         self.popen(self.r1, 'ip rule add fwmark 1 lookup 100')
         self.popen(self.r1, 'ip route add local 0.0.0.0/0 dev lo table 100')
         self.popen(self.r1, 'iptables -t mangle -F')
-        self.popen(self.r1, 'iptables -t mangle -A PREROUTING -i r1-eth1 -p tcp -j TPROXY --on-port 5000 --tproxy-mark 1')
-        self.popen(self.r1, 'iptables -t mangle -A PREROUTING -i r1-eth0 -p tcp -j TPROXY --on-port 5000 --tproxy-mark 1')
-
-        condition = threading.Condition()
-        def notify_when_ready(line):
-            if 'Pepsal started' in line:
-                with condition:
-                    condition.notify()
+        # Do not split the connections of the cross traffic
+        for segment in self.cross_hosts:
+            self.popen(self.r1, f'iptables -t mangle -A PREROUTING -s {self.ip(segment, 20)} -j RETURN')
+        tproxy_rules = [
+            f"PREROUTING -i {self.name(iface)} -p tcp -j TPROXY --on-port {TCP_PEP_PORT} --tproxy-mark 1"
+            for iface in ['r1-eth1', 'r1-eth0']
+        ]
+        for rule in tproxy_rules:
+            self.popen(self.r1, f'iptables -t mangle -A {rule}')
 
         # The start_tcp_pep() function blocks until the TCP PEP is ready to
-        # split connections. That is, when we observe the 'Pepsal started'
-        # string in the router output.
+        # split connections. That is, when it listens on the port that the
+        # TPROXY rules redirect the connections to, and the rules are in place.
         logfile = f'{logdir}/{ROUTER_LOGFILE}'
-        self.popen(self.r1, 'pepsal -v', background=True,
-            console_logger=DEBUG, logfile=logfile, func=notify_when_ready)
-        with condition:
-            notified = condition.wait(timeout=timeout)
-            if not notified:
-                raise TimeoutError(f'start_tcp_pep timeout {timeout}s')
+        p, _ = self.popen(self.r1, 'pepsal -v', background=True,
+            console_logger=DEBUG, logfile=logfile)
+        wait_until_listening(self.r1, TCP_PEP_PORT, 'tcp', timeout=timeout,
+                             process=p, name='start_tcp_pep')
+        for rule in tproxy_rules:
+            self.popen(self.r1, f'iptables -t mangle -C {rule}')
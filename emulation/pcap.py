@@ -0,0 +1,303 @@
+"""
+Streaming analysis of header-only packet captures. Reads pcap records one at
+a time, e.g., from the stdout of `tcpdump -w -`, and keeps only the compact
+per-flow and per-bridge metrics, so the raw capture never has to be stored.
+
+Payload lengths are computed from the IP and UDP headers rather than the
+captured length, so a small snaplen that only captures the headers suffices.
+"""
+import struct
+from collections import OrderedDict, deque
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from common import encode_columns
+
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+LINKTYPE_ETHERNET = 1
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+SEQ_SPACE = 1 << 32
+
+FLOW_COLUMNS = ['bin', 'goodput_bytes', 'num_rtt_samples', 'mean_rtt_us',
+                'min_rtt_us']
+DELAY_COLUMNS = ['bin', 'num_samples', 'mean_delay_us', 'max_delay_us']
+
+
+def read_exactly(f: BinaryIO, n: int,
+                 copy: Optional[BinaryIO]=None) -> Optional[bytes]:
+    """Read n bytes from a file or pipe, or None at EOF. Writes the bytes to
+    <copy>, if provided.
+    """
+    data = b''
+    while len(data) < n:
+        chunk = f.read(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    if copy is not None:
+        copy.write(data)
+    return data
+
+def iter_pcap(
+    f: BinaryIO, copy: Optional[BinaryIO]=None,
+) -> Iterator[Tuple[float, int, bytes]]:
+    """Yields the (timestamp, original length, captured bytes) of each record
+    in a pcap stream with Ethernet link type. Writes the stream to <copy> as it
+    is read, if provided, e.g., to also keep the raw capture.
+    """
+    header = read_exactly(f, 24, copy)
+    if header is None:
+        return
+    for endian in ['<', '>']:
+        magic = struct.unpack(f'{endian}I', header[:4])[0]
+        if magic in [PCAP_MAGIC_US, PCAP_MAGIC_NS]:
+            break
+    else:
+        raise ValueError('invalid pcap magic number')
+    divisor = 1e9 if magic == PCAP_MAGIC_NS else 1e6
+    linktype = struct.unpack(f'{endian}I', header[20:24])[0]
+    if linktype != LINKTYPE_ETHERNET:
+        raise ValueError(f'unsupported pcap link type {linktype}')
+
+    record_header = struct.Struct(f'{endian}IIII')
+    while True:
+        header = read_exactly(f, record_header.size, copy)
+        if header is None:
+            return
+        ts_sec, ts_frac, caplen, origlen = record_header.unpack(header)
+        data = read_exactly(f, caplen, copy)
+        if data is None:
+            return
+        yield (ts_sec + ts_frac / divisor, origlen, data)
+
+def parse_packet(data: bytes) -> Optional[tuple]:
+    """Parse the IPv4 TCP or UDP headers of an Ethernet frame. Returns
+    (flow, payload length, seq, ack, identity) where the flow is
+    (src, sport, dst, dport, proto), seq and ack are None for UDP, and the
+    identity identifies the same packet on different interfaces. Returns None
+    for other packets or truncated headers.
+    """
+    offset = 14
+    if len(data) < offset:
+        return None
+    ethertype = struct.unpack_from('!H', data, 12)[0]
+    if ethertype == ETHERTYPE_VLAN:
+        offset += 4
+        ethertype = struct.unpack_from('!H', data, 16)[0]
+    if ethertype != ETHERTYPE_IPV4 or len(data) < offset + 20:
+        return None
+    ihl = (data[offset] & 0x0f) * 4
+    total_len, = struct.unpack_from('!H', data, offset + 2)
+    proto = data[offset + 9]
+    src = '.'.join(str(b) for b in data[offset+12:offset+16])
+    dst = '.'.join(str(b) for b in data[offset+16:offset+20])
+    l4 = offset + ihl
+
+    if proto == IPPROTO_TCP:
+        if len(data) < l4 + 20:
+            return None
+        sport, dport, seq, ack, data_offset = \
+            struct.unpack_from('!HHIIB', data, l4)
+        payload_len = total_len - ihl - (data_offset >> 4) * 4
+    elif proto == IPPROTO_UDP:
+        if len(data) < l4 + 8:
+            return None
+        sport, dport, udp_len = struct.unpack_from('!HHH', data, l4)
+        payload_len = udp_len - 8
+        seq, ack = None, None
+    else:
+        return None
+
+    # The IP header without the TTL and checksum, which change at the
+    # router, the transport header, and the start of the payload
+    identity = data[offset:offset+8] + data[offset+12:offset+20] + \
+        data[l4:l4+40]
+    return ((src, sport, dst, dport, proto), payload_len, seq, ack, identity)
+
+def unwrap_seq(seq: int, ref: int) -> int:
+    """Unwrap a 32-bit sequence number to the one closest to <ref>."""
+    diff = (seq - ref) % SEQ_SPACE
+    if diff >= SEQ_SPACE // 2:
+        diff -= SEQ_SPACE
+    return ref + diff
+
+def flow_label(flow: tuple) -> str:
+    src, sport, dst, dport, proto = flow
+    proto = { IPPROTO_TCP: 'tcp', IPPROTO_UDP: 'udp' }[proto]
+    return f'{proto} {src}:{sport} > {dst}:{dport}'
+
+
+class Bins:
+    """Sparse time bins of a count, sum, min, and max of samples."""
+    def __init__(self):
+        self.bins = OrderedDict()
+
+    def add(self, i: int, value: int=0, total: int=0):
+        if i not in self.bins:
+            self.bins[i] = [0, 0, value, value, 0]
+        b = self.bins[i]
+        b[0] += 1
+        b[1] += value
+        b[2] = min(b[2], value)
+        b[3] = max(b[3], value)
+        b[4] += total
+
+
+class FlowState:
+    def __init__(self, flow: tuple):
+        self.flow = flow
+        self.packets = 0
+        self.bytes = 0
+        self.retransmissions = 0
+        self.goodput = Bins()
+        self.rtt = Bins()
+
+        # TCP sequence space, unwrapped relative to the first sequence number,
+        # and the segments awaiting an ACK to take an RTT sample
+        self.isn = None
+        self.highest = 0
+        self.pending = deque()
+
+
+class FlowAnalyzer:
+    """
+    Computes per-flow goodput over time, TCP retransmission counts, and TCP
+    RTT samples from the packets on one interface. Goodput counts the new
+    payload bytes of each flow, i.e., excluding retransmissions for TCP. RTT
+    samples are taken from the time a segment is seen to the time its first
+    ACK is seen in the reverse direction, skipping retransmitted segments, so
+    they measure the RTT from the capture point to the receiver and back.
+    """
+    def __init__(self, start_time: float, bin_ms: float):
+        self.start_time = start_time
+        self.bin_ms = bin_ms
+        self.flows = {}
+
+    def bin(self, ts: float) -> int:
+        return int((ts - self.start_time) * 1000 / self.bin_ms)
+
+    def add_packet(self, ts: float, packet: tuple):
+        flow, payload_len, seq, ack, _ = packet
+        if flow not in self.flows:
+            self.flows[flow] = FlowState(flow)
+        state = self.flows[flow]
+        state.packets += 1
+        state.bytes += max(payload_len, 0)
+        i = self.bin(ts)
+
+        if seq is None:
+            if payload_len > 0:
+                state.goodput.add(i, total=payload_len)
+            return
+
+        if payload_len > 0:
+            if state.isn is None:
+                state.isn = seq
+            start = unwrap_seq(seq - state.isn, state.highest)
+            end = start + payload_len
+            if start < state.highest:
+                # Karn's algorithm: no RTT samples from retransmitted data
+                state.retransmissions += 1
+                while state.pending and state.pending[-1][0] > start:
+                    state.pending.pop()
+            else:
+                state.pending.append((end, ts))
+            if end > state.highest:
+                state.goodput.add(i, total=end - max(start, state.highest))
+                state.highest = end
+
+        # Take an RTT sample for the data in the reverse direction
+        src, sport, dst, dport, proto = flow
+        reverse = self.flows.get((dst, dport, src, sport, proto))
+        if reverse is None or reverse.isn is None or not reverse.pending:
+            return
+        acked = unwrap_seq(ack - reverse.isn, reverse.highest)
+        sent_ts = None
+        while reverse.pending and reverse.pending[0][0] <= acked:
+            _, sent_ts = reverse.pending.popleft()
+        if sent_ts is not None:
+            reverse.rtt.add(i, round((ts - sent_ts) * 1000000))
+
+    def summary(self) -> list:
+        """The metrics of each flow that carried payload, with the time series
+        of FLOW_COLUMNS compactly encoded with encode_columns().
+        """
+        flows = []
+        for state in self.flows.values():
+            if state.bytes == 0:
+                continue
+            rows = []
+            for i in sorted(set(state.goodput.bins) | set(state.rtt.bins)):
+                goodput = state.goodput.bins.get(i, [0, 0, 0, 0, 0])
+                rtt = state.rtt.bins.get(i, [0, 0, 0, 0, 0])
+                mean_rtt = rtt[1] // rtt[0] if rtt[0] > 0 else 0
+                rows.append([i, goodput[4], rtt[0], mean_rtt, rtt[2]])
+            flows.append({
+                'flow': flow_label(state.flow),
+                'packets': state.packets,
+                'bytes': state.bytes,
+                'retransmissions': state.retransmissions,
+                'num_bins': len(rows),
+                'data': encode_columns(list(zip(*rows)) or [[]] * len(FLOW_COLUMNS)),
+            })
+        return flows
+
+
+class DelayMatcher:
+    """
+    Matches the same packet seen on the interfaces on either side of a network
+    emulation node to measure its one-way delay across the node, in either
+    direction. The queueing delay is the delay in excess of the minimum delay,
+    i.e., the propagation delay of the emulated link.
+    """
+    def __init__(self, ifaces: Tuple[str, str], start_time: float,
+                 bin_ms: float, max_pending: int=100000):
+        self.ifaces = ifaces
+        self.start_time = start_time
+        self.bin_ms = bin_ms
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.delays = {
+            f'{ifaces[0]} > {ifaces[1]}': Bins(),
+            f'{ifaces[1]} > {ifaces[0]}': Bins(),
+        }
+
+    def add_packet(self, iface: str, ts: float, packet: tuple):
+        identity = packet[-1]
+        match = self.pending.pop(identity, None)
+        if match is None or match[0] == iface:
+            self.pending[identity] = (iface, ts)
+            if len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+            return
+
+        # The earlier packet was seen on the sending side
+        other_iface, other_ts = match
+        if other_ts <= ts:
+            direction, delay, sent_ts = f'{other_iface} > {iface}', ts - other_ts, other_ts
+        else:
+            direction, delay, sent_ts = f'{iface} > {other_iface}', other_ts - ts, ts
+        i = int((sent_ts - self.start_time) * 1000 / self.bin_ms)
+        self.delays[direction].add(i, round(delay * 1000000))
+
+    def summary(self) -> dict:
+        """The one-way delays in each direction, with the time series of
+        DELAY_COLUMNS compactly encoded with encode_columns().
+        """
+        summary = {}
+        for direction, delays in self.delays.items():
+            rows = []
+            for i, (count, total, _, max_delay, _) in delays.bins.items():
+                rows.append([i, count, total // count, max_delay])
+            rows.sort()
+            base_delays = [b[2] for b in delays.bins.values()]
+            summary[direction] = {
+                'num_samples': sum(row[1] for row in rows),
+                'base_delay_us': min(base_delays) if base_delays else None,
+                'num_bins': len(rows),
+                'data': encode_columns(list(zip(*rows)) or [[]] * len(DELAY_COLUMNS)),
+            }
+        return summary
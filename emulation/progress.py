@@ -0,0 +1,175 @@
+"""
+Receive progress of the client during a trial. The client reports its byte
+progress at a fixed interval, which is used to abort trials that are certain
+to exceed the timeout, i.e., the download could not complete in time even at
+a rate well above any rate observed so far, and to detect when the transfer
+reaches steady state, i.e., after the startup phase.
+"""
+import bisect
+import threading
+from typing import List, Optional, Tuple
+
+from common import *
+
+
+def parse_progress(line: str) -> Optional[Tuple[float, int]]:
+    """Parse a '[PROGRESS] bytes=<int> time_s=<float>' line into
+    (time_s, bytes), or None if the line is not a progress line.
+    """
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        kvs = dict(kv.split('=') for kv in line.split()[1:])
+        return (float(kvs['time_s']), int(kvs['bytes']))
+    except (KeyError, ValueError):
+        return None
+
+def bytes_at(times: List[float], num_bytes: List[int], time_s: float) -> float:
+    """The number of bytes received by <time_s>, interpolated linearly between
+    the progress events at <times>, starting from 0 bytes at 0s.
+    """
+    i = bisect.bisect_left(times, time_s)
+    if i == len(times):
+        return num_bytes[-1] if num_bytes else 0
+    if times[i] == time_s:
+        return num_bytes[i]
+    prev_time, prev_bytes = (times[i-1], num_bytes[i-1]) if i > 0 else (0., 0)
+    fraction = (time_s - prev_time) / (times[i] - prev_time)
+    return prev_bytes + fraction * (num_bytes[i] - prev_bytes)
+
+def steady_state_start(
+    times: List[float], num_bytes: List[int],
+    window_ms: float=STEADY_STATE_WINDOW_MS,
+    num_windows: int=STEADY_STATE_WINDOWS,
+    tolerance: float=STEADY_STATE_TOLERANCE,
+) -> Optional[float]:
+    """The time steady state starts, i.e., the start of the first
+    <num_windows> consecutive windows of <window_ms> whose goodputs are all
+    within <tolerance> of their mean, or None if not yet in steady state.
+    """
+    if len(times) == 0:
+        return None
+    window_s = window_ms / 1000.
+    num_boundaries = int(times[-1] / window_s) + 1
+    cumulative = [bytes_at(times, num_bytes, i * window_s)
+                  for i in range(num_boundaries)]
+    goodputs = [cumulative[i+1] - cumulative[i]
+                for i in range(num_boundaries - 1)]
+    for i in range(len(goodputs) - num_windows + 1):
+        run = goodputs[i:i+num_windows]
+        mean = sum(run) / num_windows
+        if mean > 0 and all(abs(x - mean) <= tolerance * mean for x in run):
+            return i * window_s
+    return None
+
+def steady_state_goodput_mbps(times: List[float], num_bytes: List[int],
+                              start_s: float) -> Optional[float]:
+    """The goodput from <start_s> to the last progress event."""
+    if len(times) == 0 or times[-1] <= start_s:
+        return None
+    received = num_bytes[-1] - bytes_at(times, num_bytes, start_s)
+    return 8 * received / 1000000 / (times[-1] - start_s)
+
+
+class ProgressMonitor:
+    """
+    Projects the completion time of a download of <total_bytes> from periodic
+    progress events and decides whether it is certain to miss the <timeout>.
+
+    The decision is conservative: the earliest possible completion time
+    assumes the remaining bytes are received at PROGRESS_RATE_MARGIN times the
+    highest rate observed between any two consecutive events, and no decision
+    is made before PROGRESS_MIN_EVENTS events and PROGRESS_MIN_ELAPSED_FRACTION
+    of the timeout have passed, e.g., while the sender is still in slow start.
+    Once the trial is hopeless, the <abort> event is set.
+
+    With <steady_state_duration>, the <abort> event is also set once the
+    transfer has been in steady state for that many seconds, to end it early.
+    """
+    def __init__(self, total_bytes: int, timeout: Optional[float]=None,
+                 steady_state_duration: Optional[float]=None):
+        self.total_bytes = total_bytes
+        self.timeout = timeout
+        self.steady_state_duration = steady_state_duration
+        self.abort = threading.Event()
+        self.aborted = False
+        self.steady_state_ended = False
+        self.num_events = 0
+        self.time_s = 0.
+        self.bytes = 0
+        self.peak_rate = 0.
+        self.times = []
+        self.num_bytes = []
+        self.steady_state_start_s = None
+
+    def update(self, time_s: float, num_bytes: int) -> bool:
+        """Add a progress event of the bytes received by <time_s> seconds
+        after the client started. Returns whether the client should be
+        terminated.
+        """
+        if self.num_events > 0 and time_s > self.time_s:
+            rate = (num_bytes - self.bytes) / (time_s - self.time_s)
+            self.peak_rate = max(self.peak_rate, rate)
+        self.num_events += 1
+        self.time_s = time_s
+        self.bytes = num_bytes
+        self.times.append(time_s)
+        self.num_bytes.append(num_bytes)
+        if self.abort.is_set():
+            return True
+        if self.hopeless():
+            self.aborted = True
+            self.abort.set()
+        elif self.steady_state_duration is not None:
+            if self.steady_state_start_s is None:
+                self.steady_state_start_s = \
+                    steady_state_start(self.times, self.num_bytes)
+            start_s = self.steady_state_start_s
+            if start_s is not None and \
+                    time_s - start_s >= self.steady_state_duration:
+                self.steady_state_ended = True
+                self.abort.set()
+        return self.abort.is_set()
+
+    def min_time_s(self) -> float:
+        """The earliest time the download could complete."""
+        remaining = max(self.total_bytes - self.bytes, 0)
+        if remaining == 0:
+            return self.time_s
+        if self.peak_rate == 0:
+            return float('inf')
+        return self.time_s + remaining / (PROGRESS_RATE_MARGIN * self.peak_rate)
+
+    def projected_time_s(self) -> float:
+        """The completion time at the mean rate so far."""
+        if self.bytes == 0:
+            return float('inf')
+        return self.time_s * self.total_bytes / self.bytes
+
+    def hopeless(self) -> bool:
+        if self.timeout is None:
+            return False
+        if self.num_events < PROGRESS_MIN_EVENTS or self.bytes == 0:
+            return False
+        if self.time_s < PROGRESS_MIN_ELAPSED_FRACTION * self.timeout:
+            return False
+        return self.min_time_s() > self.timeout
+
+    def summary(self) -> dict:
+        """The progress at the last event, including the partial throughput
+        and the projected completion times.
+        """
+        partial_throughput_mbps = None
+        if self.time_s > 0:
+            partial_throughput_mbps = 8 * self.bytes / 1000000 / self.time_s
+        min_time_s = self.min_time_s()
+        projected_time_s = self.projected_time_s()
+        return {
+            'num_events': self.num_events,
+            'time_s': self.time_s,
+            'bytes': self.bytes,
+            'partial_throughput_mbps': partial_throughput_mbps,
+            'min_time_s': None if min_time_s == float('inf') else min_time_s,
+            'projected_time_s': None if projected_time_s == float('inf') \
+                else projected_time_s,
+        }
@@ -0,0 +1,176 @@
+"""
+Streaming parser that reduces qlog files to compact congestion control time
+series, reading one event at a time instead of loading the whole file.
+
+Supports the two formats written by the QUIC benchmarks:
+- JSON-SEQ (.sqlog), e.g., by quiche with QLOGDIR, where each record is
+  prefixed by a record separator and the first record is the header. Event
+  times are in ms.
+- JSON (.qlog), e.g., by picoquic, where the events of a trace are written one
+  per line as arrays in the order of its "event_fields", and times are in the
+  "time_units" of the trace configuration (us by default).
+
+All times in the reduced time series are in us. The qlog file of a client
+is also reduced to the times of the phases of its download, in seconds.
+"""
+import json
+import os
+import re
+from typing import Iterator, Optional, Tuple
+
+from common import encode_columns
+
+RECORD_SEPARATOR = '\x1e'
+
+# The time series columns, and the names of each metric in the
+# recovery:metrics_updated events of each implementation
+COLUMNS = ['time_us', 'cwnd', 'bytes_in_flight', 'smoothed_rtt_us',
+           'latest_rtt_us', 'pacing_rate_bps']
+METRICS = {
+    'cwnd': ['congestion_window', 'cwnd'],
+    'bytes_in_flight': ['bytes_in_flight'],
+    'smoothed_rtt_us': ['smoothed_rtt'],
+    'latest_rtt_us': ['latest_rtt'],
+    'pacing_rate_bps': ['pacing_rate'],
+}
+RTT_KEYS = ['smoothed_rtt', 'latest_rtt', 'min_rtt', 'rtt_variance']
+
+
+def iter_qlog_events(path: str) -> Iterator[Tuple[float, str, dict]]:
+    """Yields the (time_us, name, data) of each event in the qlog file, where
+    the name is "<category>:<event>", e.g., "recovery:metrics_updated", and
+    the time is relative to the start of the trace. The RTTs in the data are
+    normalized to us.
+    """
+    with open(path) as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == RECORD_SEPARATOR:
+            events = _iter_json_seq_events(f)
+        else:
+            events = _iter_json_events(f)
+        for time_us, name, data, multiplier in events:
+            if multiplier != 1:
+                for key in RTT_KEYS:
+                    if isinstance(data.get(key), (int, float)):
+                        data[key] *= multiplier
+            yield (time_us, name, data)
+
+def _iter_json_seq_events(f):
+    for line in f:
+        line = line.strip().lstrip(RECORD_SEPARATOR)
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if 'name' not in record or 'time' not in record:
+            continue
+        yield (record['time'] * 1000, record['name'], record.get('data', {}),
+               1000)
+
+def _iter_json_events(f):
+    decoder = json.JSONDecoder()
+    event_fields = ['relative_time', 'category', 'event', 'data']
+    multiplier = 1
+    for line in f:
+        line = line.strip()
+        match = re.search(r'"event_fields"\s*:\s*(\[[^\]]*\])', line)
+        if match is not None:
+            event_fields = json.loads(match.group(1))
+        match = re.search(r'"time_units"\s*:\s*"(\w+)"', line)
+        if match is not None:
+            multiplier = 1000 if match.group(1) == 'ms' else 1
+        if not line.startswith('['):
+            continue
+
+        # Ignore the end of the enclosing JSON after the last event
+        try:
+            event, _ = decoder.raw_decode(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(event, list) or len(event) != len(event_fields):
+            continue
+        event = dict(zip(event_fields, event))
+        time = event.get('relative_time', event.get('time', 0))
+        name = f"{event.get('category')}:{event.get('event')}"
+        yield (time * multiplier, name, event.get('data', {}), multiplier)
+
+def qlog_vantage_point(path: str) -> Optional[str]:
+    """The type of the vantage point of the trace in the qlog file, e.g.,
+    "client" or "server", from the header at the start of the file.
+    """
+    with open(path) as f:
+        header = f.read(4096)
+    match = re.search(r'"vantage_point"\s*:\s*\{[^}]*"type"\s*:\s*"(\w+)"',
+                      header)
+    return None if match is None else match.group(1)
+
+def _update_phases(phases: dict, time_us: float, name: str, data: dict):
+    """Update the PHASES of a download from the qlog events of the client:
+    connect_s at the first packet sent, handshake_s at the first received
+    HANDSHAKE_DONE frame, and first_byte_s and last_byte_s at the first and
+    last received STREAM frame on the request stream.
+    """
+    time_s = time_us / 1e6
+    if name == 'transport:packet_sent':
+        phases.setdefault('connect_s', time_s)
+    elif name == 'transport:packet_received':
+        for frame in data.get('frames', []):
+            if not isinstance(frame, dict):
+                continue
+            frame_type = frame.get('frame_type')
+            if frame_type == 'handshake_done':
+                phases.setdefault('handshake_s', time_s)
+            elif frame_type == 'stream' and \
+                    frame.get('stream_id', frame.get('id')) == 0:
+                phases.setdefault('first_byte_s', time_s)
+                phases['last_byte_s'] = time_s
+
+def summarize_qlog(path: str) -> Optional[dict]:
+    """Reduce the qlog file to the time series of its congestion control
+    metrics, as in COLUMNS, and the times of its packet losses, each compactly
+    encoded with encode_columns(). Metrics are carried forward from the last
+    update that set them, and only rows that change are kept. Returns None if
+    the file has no metrics updates.
+
+    The qlog file of a client is also reduced to the phases of its download,
+    relative to the start of the trace.
+    """
+    vantage_point = qlog_vantage_point(path)
+    row = [0] * len(COLUMNS)
+    rows = []
+    losses = []
+    phases = {}
+    for time_us, name, data in iter_qlog_events(path):
+        if vantage_point == 'client':
+            _update_phases(phases, time_us, name, data)
+        if name == 'recovery:packet_lost':
+            losses.append(round(time_us))
+        elif name == 'recovery:metrics_updated':
+            new_row = list(row)
+            new_row[0] = round(time_us)
+            for i, column in enumerate(COLUMNS[1:], start=1):
+                for key in METRICS[column]:
+                    if key not in data:
+                        continue
+                    new_row[i] = round(data[key])
+            if new_row[1:] != row[1:]:
+                rows.append(new_row)
+            row = new_row
+
+    if len(rows) == 0:
+        return None
+    summary = {
+        'file': os.path.basename(path),
+        'vantage_point': vantage_point,
+        'columns': COLUMNS,
+        'num_samples': len(rows),
+        'data': encode_columns(list(zip(*rows))),
+        'num_losses': len(losses),
+        'losses': encode_columns([losses]),
+    }
+    if len(phases) > 0:
+        summary['phases'] = phases
+    return summary
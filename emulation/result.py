@@ -1,5 +1,9 @@
 import json
 from datetime import datetime
+from typing import Optional
+
+from common import encode_columns, median_ci
+from progress import steady_state_goodput_mbps, steady_state_start
 
 
 class BenchmarkResult:
@@ -16,6 +20,50 @@ class BenchmarkResult:
         }
         self.outputs = []
 
+    def set_network_setting(self, setting):
+        self.inputs['network'] = setting
+
+    def set_cpu_layout(self, layout):
+        self.inputs['cpus'] = layout
+
+    def set_setup_time(self, setup_time_s: float):
+        self.inputs['setup_time_s'] = setup_time_s
+
+    def set_ktls(self, state: dict):
+        """Record that kTLS was requested, and whether the kernel handled
+        the record encryption (tx) and decryption (rx) of the client and
+        server in the most recent trial.
+        """
+        self.inputs['ktls'] = {'enabled': True, **state}
+
+    def set_client_agent(self):
+        """Record that the trials ran in one long-lived client process."""
+        self.inputs['client_agent'] = True
+
+    def throughput_ci(self):
+        """The median throughput of the successful trials and the half-width
+        of its 95% confidence interval.
+        """
+        values = [output['throughput_mbps'] for output in self.outputs
+                  if output['success'] and 'throughput_mbps' in output]
+        return median_ci(values)
+
+    def set_stopping(self, min_trials: int, max_trials: int, ci_target: float,
+                     converged: bool):
+        """Record the decision to stop running trials, and whether it is
+        because the confidence interval of the median throughput converged to
+        within <ci_target> of the median, or because it reached <max_trials>.
+        """
+        median, halfwidth = self.throughput_ci()
+        self.inputs['stopping'] = {
+            'min_trials': min_trials,
+            'max_trials': max_trials,
+            'ci_target': ci_target,
+            'median_throughput_mbps': median,
+            'ci_halfwidth_mbps': None if halfwidth == float('inf') else halfwidth,
+            'converged': converged,
+        }
+
     def append_new_output(self):
         self.inputs['num_trials'] += 1
         self.outputs.append({
@@ -28,23 +76,111 @@ class BenchmarkResult:
     def set_timeout(self, timeout: bool):
         self.outputs[-1]['timeout'] = timeout
 
-    def set_time_s(self, time_s: float):
+    def set_time_s(self, time_s: float, phases: Optional[dict]=None):
+        """Record the runtime of the trial and its throughput. With the
+        <phases> of the download, e.g., from parse_phases(), also record the
+        transfer throughput from the end of the handshake to the last byte.
+        """
         self.outputs[-1]['time_s'] = time_s
         self.outputs[-1]['throughput_mbps'] = \
             8 * self.inputs['data_size'] / 1000000 / time_s
+        if phases is None:
+            return
+        self.outputs[-1]['phases'] = phases
+        if 'handshake_s' in phases and 'last_byte_s' in phases:
+            transfer_s = phases['last_byte_s'] - phases['handshake_s']
+            if transfer_s > 0:
+                self.outputs[-1]['transfer_throughput_mbps'] = \
+                    8 * self.inputs['data_size'] / 1000000 / transfer_s
+
+    def set_aborted(self):
+        """Record that the trial was aborted before the timeout because it
+        was certain to miss it.
+        """
+        self.outputs[-1]['aborted'] = True
+
+    def set_partial_transfer(self, time_s: float, num_bytes: int):
+        """Record a transfer that was ended early, once it had been in steady
+        state for long enough, with the throughput of the bytes received.
+        """
+        self.outputs[-1]['steady_state_ended'] = True
+        self.outputs[-1]['time_s'] = time_s
+        self.outputs[-1]['bytes'] = num_bytes
+        self.outputs[-1]['throughput_mbps'] = 8 * num_bytes / 1000000 / time_s
+
+    def set_progress(self, summary: dict, times: list, num_bytes: list):
+        """Record the receive progress of the client, and derive the goodput
+        in steady state, i.e., excluding the startup phase. The progress
+        events at <times> are compactly encoded with encode_columns() as
+        ['time_us', 'bytes'] columns.
+        """
+        output = self.outputs[-1]
+        times, num_bytes = list(times), list(num_bytes)
+        if output['success'] and not output.get('steady_state_ended') and \
+                len(times) > 0 and output['time_s'] > times[-1]:
+            # The rest of the data arrived by the end of the transfer
+            times.append(output['time_s'])
+            num_bytes.append(self.inputs['data_size'])
+        start_s = steady_state_start(times, num_bytes)
+        output['progress'] = {
+            **summary,
+            'num_samples': len(times),
+            'columns': ['time_us', 'bytes'],
+            'data': encode_columns([
+                [round(time_s * 1000000) for time_s in times], num_bytes]),
+        }
+        output['steady_state_start_s'] = start_s
+        output['steady_state_goodput_mbps'] = None if start_s is None else \
+            steady_state_goodput_mbps(times, num_bytes, start_s)
+
+    def set_competition(self, flows: list, fairness_index: Optional[float],
+                        aggregate_mbps: Optional[float],
+                        bottleneck_mbps: Optional[float]):
+        """Record the outputs of each competing flow, Jain's fairness index of
+        their throughputs, and the aggregate goodput of the flows as the
+        throughput of the trial, and as a fraction of the bottleneck bandwidth.
+        """
+        output = self.outputs[-1]
+        output['flows'] = flows
+        output['fairness_index'] = fairness_index
+        output['aggregate_throughput_mbps'] = aggregate_mbps
+        if aggregate_mbps is not None:
+            output['throughput_mbps'] = aggregate_mbps
+        output['utilization'] = None
+        if aggregate_mbps is not None and bottleneck_mbps:
+            output['utilization'] = aggregate_mbps / bottleneck_mbps
+
+    def set_disk_writes(self, client_io: Optional[dict], sink_bytes: int,
+                        system_disk_write_bytes: Optional[int]):
+        """Record the bytes the client wrote to disk and to any file or pipe
+        during the trial, from its I/O counters in /proc/<pid>/io, the bytes
+        of the downloads that the client saved to tmpfs instead, and the bytes
+        written to all disks by any process. Counters that are unavailable are
+        None.
+        """
+        client_io = client_io or {}
+        self.outputs[-1]['disk_write_bytes'] = client_io.get('write_bytes')
+        self.outputs[-1]['wchar'] = client_io.get('wchar')
+        self.outputs[-1]['sink_bytes'] = sink_bytes
+        self.outputs[-1]['system_disk_write_bytes'] = system_disk_write_bytes
 
     def set_network_statistics(self, statistics):
         self.outputs[-1]['statistics'] = statistics
 
-    def set_additional_data(self, data):
-        self.outputs[-1]['additional_data'] = data
+    def set_additional_data(self, data: dict):
+        # Merge with the additional data already set for this trial
+        additional_data = self.outputs[-1].setdefault('additional_data', {})
+        additional_data.update(data)
 
-    def print(self, pretty_print=False):
+    def dumps(self, pretty_print=False) -> str:
         result = {
             'inputs': self.inputs,
             'outputs': self.outputs,
         }
         if pretty_print:
-            print(json.dumps(result, indent=2))
+            return json.dumps(result, indent=2)
         else:
-            print(json.dumps(result))
+            return json.dumps(result)
+
+    def print(self, pretty_print=False):
+        print(self.dumps(pretty_print), flush=True)
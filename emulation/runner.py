@@ -0,0 +1,230 @@
+"""
+Run benchmark jobs on an emulated network that is kept warm between jobs.
+"""
+from typing import List, Optional
+
+from common import *
+from network import *
+from benchmark import *
+from result import BenchmarkResult
+
+BENCHMARKS = {
+    'tcp': LinuxTCPBenchmark,
+    'google': GoogleQUICBenchmark,
+    'cloudflare': CloudflareQUICBenchmark,
+    'picoquic': PicoQUICBenchmark,
+    'competition': CompetitionBenchmark,
+}
+
+NETWORK_SETTINGS = {
+    'two_segment': ['delay1', 'delay2', 'loss1', 'loss2', 'bw1', 'bw2', 'qdisc',
+                    'cross', 'cross_segment', 'cross_mbps', 'cross_flows'],
+    'direct': ['delay1', 'loss1', 'bw1', 'qdisc'],
+}
+
+
+def requires_pacing(constructor, cca: str) -> bool:
+    # Some BBR implementations require pacing.
+    # This includes Cloudflare quiche and Linux kernel versions <5.0.
+    # We automatically set pacing for Linux TCP BBR, but we need to set it
+    # here for user-space implementations.
+    return constructor == CloudflareQUICBenchmark and 'bbr' in cca
+
+def network_setting(topology: str, setting: dict) -> dict:
+    """The full network setting of the topology, where the values in
+    <setting> override the defaults. If the topology is "direct", uses the
+    network path properties for the near path segment i.e. Link 1.
+    """
+    if topology not in NETWORK_SETTINGS:
+        raise NotImplementedError(topology)
+    keys = NETWORK_SETTINGS[topology]
+    result = { key: DEFAULT_NETWORK_SETTING[key] for key in keys }
+    for key, value in setting.items():
+        if key not in result:
+            raise ValueError(f'invalid {topology} network setting {key}')
+        result[key] = str(value) if key.startswith('loss') else value
+    return result
+
+def build_network(topology: str, setting: dict, pacing: bool,
+                  **kwargs) -> EmulatedNetwork:
+    """Build the network for the topology and full network setting. Passes
+    the remaining arguments to the EmulatedNetwork constructor.
+    """
+    s = setting
+    if topology == 'two_segment':
+        return TwoSegmentNetwork(s['delay1'], s['delay2'], s['loss1'],
+            s['loss2'], s['bw1'], s['bw2'], s['qdisc'], pacing,
+            cross=s['cross'], cross_segment=s['cross_segment'],
+            cross_mbps=s['cross_mbps'], cross_flows=s['cross_flows'],
+            **kwargs)
+    elif topology == 'direct':
+        return OneSegmentNetwork(s['delay1'], s['loss1'], s['bw1'],
+            s['qdisc'], pacing, **kwargs)
+    else:
+        raise NotImplementedError(topology)
+
+def reconfigure_network(net: EmulatedNetwork, topology: str, setting: dict):
+    """Apply the full network setting in place to the live network."""
+    s = setting
+    if topology == 'two_segment':
+        net.reconfigure(s['delay1'], s['delay2'], s['loss1'], s['loss2'],
+                        s['bw1'], s['bw2'], s['qdisc'], s['cross'],
+                        s['cross_segment'], s['cross_mbps'], s['cross_flows'])
+    elif topology == 'direct':
+        net.reconfigure(s['delay1'], s['loss1'], s['bw1'], s['qdisc'])
+    else:
+        raise NotImplementedError(topology)
+
+
+class EmulationRunner:
+    """
+    Runs benchmark jobs, keeping the emulated network and the HTTP server warm
+    between consecutive jobs. The network is only rebuilt if the topology,
+    pacing, PEP, or whether there is cross traffic changes, otherwise its
+    links and cross traffic are reconfigured in place. The
+    server is only restarted if the protocol, CCA, data size, certificates,
+    qlog capture, or kTLS change.
+
+    A job is a dict with the following keys, all optional except "protocol":
+    - protocol: One of "tcp", "google", "cloudflare", or "picoquic".
+    - cca: The congestion control algorithm (default: "cubic").
+    - n: The data size, e.g., 1000000 or "1M" (default: 10000).
+    - trials: Number of trials, or the maximum number of trials with
+      ci_target (default: 1).
+    - min_trials, ci_target: If ci_target is provided, stop running trials
+      once the 95% confidence interval of the median throughput is within
+      this fraction of the median, after at least min_trials trials.
+    - timeout: The number of seconds to wait for each client.
+    - early_abort: Whether to abort trials that are certain to miss the
+      timeout (default: false).
+    - steady_state: Whether to record the receive progress of the client and
+      the goodput in steady state (default: false).
+    - steady_state_duration: If provided, end each transfer once it has been
+      in steady state for this many seconds.
+    - client_agent: Whether to run the requests of all trials in one
+      long-lived client process (only "tcp", default: false).
+    - label: The label of the result (default: "NO_LABEL").
+    - pep: Whether to start a TCP PEP (default: false).
+    - topology: One of "two_segment" or "direct" (default: "two_segment").
+    - network: A dict of network settings that override the defaults in
+      DEFAULT_NETWORK_SETTING, e.g., {"delay2": 50, "loss1": "2"}. In the
+      "two_segment" topology, "cross" is the kind of cross traffic, one of
+      "cbr", "web", or "tcp" (default: none), on the "cross_segment" path
+      segment, at "cross_mbps" for "cbr" and "web", or with "cross_flows"
+      long-lived flows for "tcp".
+    - network_statistics: Whether to collect network statistics.
+    - telemetry_interval: If provided, the interval in ms at which to sample
+      the queues of the network emulation nodes during each trial.
+    - tcp_info_interval: If provided, the interval in ms at which to sample
+      the TCP_INFO of the connections during each trial (only "tcp").
+    - qlog: Whether to capture qlog files (only "cloudflare" and "picoquic").
+    - ktls: Whether to offload TLS to the kernel (only "tcp").
+    - capture_snaplen: If provided, the number of bytes of every packet to
+      capture and analyze during each trial.
+    - keep_pcap: Whether to also keep the raw packet captures.
+    - certfile, keyfile: Paths to the TLS/SSL certificate and key files.
+    """
+    def __init__(self, logdir: str, prefix: str='', subnet: int=0,
+                 cpus: Optional[List[int]]=None, batch_config: bool=True):
+        """Parameters:
+        - logdir: Path to a log directory (that already exists).
+        - prefix, subnet, cpus, batch_config: Passed to the EmulatedNetwork
+          constructor.
+        """
+        self.logdir = logdir
+        self.net_kwargs = {
+            'prefix': prefix,
+            'subnet': subnet,
+            'cpus': cpus,
+            'batch_config': batch_config,
+        }
+        self.net = None
+        self.net_key = None
+        self.setting = None
+        self.bm = None
+        self.bm_key = None
+
+    def run(self, job: dict) -> BenchmarkResult:
+        """Run the benchmark job and return its result, with the network
+        setting recorded in the result inputs.
+        """
+        protocol = job['protocol']
+        if protocol not in BENCHMARKS:
+            raise ValueError(f'invalid protocol {protocol}')
+        constructor = BENCHMARKS[protocol]
+        cca = job.get('cca', 'cubic')
+        n = parse_data_size(str(job.get('n', 10000)))
+        pep = job.get('pep', False)
+        topology = job.get('topology', 'two_segment')
+        setting = network_setting(topology, job.get('network', {}))
+        if constructor == GoogleQUICBenchmark:
+            keyfile = job.get('keyfile', DEFAULT_SSL_KEYFILE_GOOGLE)
+        else:
+            keyfile = job.get('keyfile', DEFAULT_SSL_KEYFILE)
+        certfile = job.get('certfile', DEFAULT_SSL_CERTFILE)
+        if pep and topology != 'two_segment':
+            raise ValueError(f'cannot start a TCP PEP in {topology} topology')
+
+        pacing = requires_pacing(constructor, cca)
+        self._prepare_network(topology, setting, pacing, pep)
+        self._prepare_server(constructor, cca, n, certfile, keyfile, pep,
+                             job.get('qlog', False), job.get('ktls', False))
+
+        self.bm.label = job.get('label', 'NO_LABEL')
+        options = TrialOptions(
+            timeout=job.get('timeout'),
+            network_statistics=job.get('network_statistics', False),
+            telemetry_interval=job.get('telemetry_interval'),
+            tcp_info_interval=job.get('tcp_info_interval'),
+            capture_snaplen=job.get('capture_snaplen'),
+            keep_pcap=job.get('keep_pcap', False),
+            min_trials=job.get('min_trials'),
+            ci_target=job.get('ci_target'),
+            early_abort=job.get('early_abort', False),
+            steady_state=job.get('steady_state', False),
+            steady_state_duration=job.get('steady_state_duration'),
+            client_agent=job.get('client_agent', False),
+        )
+        result = self.bm.run_trials(job.get('trials', 1), options=options)
+        result.set_network_setting(setting)
+        return result
+
+    def _prepare_network(self, topology: str, setting: dict, pacing: bool,
+                         pep: bool):
+        key = (topology, pacing, pep, setting.get('cross') is not None)
+        if self.net is not None and self.net_key != key:
+            self.stop()
+        if self.net is None:
+            self.net = build_network(topology, setting, pacing,
+                                     **self.net_kwargs)
+            if pep:
+                self.net.start_tcp_pep(logdir=self.logdir)
+            self.net_key = key
+        elif self.setting != setting:
+            reconfigure_network(self.net, topology, setting)
+        self.setting = setting
+
+    def _prepare_server(self, constructor, cca: str, n: int, certfile: str,
+                        keyfile: str, pep: bool, qlog: bool, ktls: bool):
+        key = (constructor, cca, n, certfile, keyfile, qlog, ktls)
+        if self.bm is not None and self.bm_key == key:
+            return
+        if self.bm is not None:
+            self.bm.stop_server()
+            self.bm = None
+        bm = constructor(self.net, 'NO_LABEL', self.logdir, n, cca=cca,
+                         certfile=certfile, keyfile=keyfile, pep=pep,
+                         qlog=qlog, ktls=ktls)
+        bm.start_server()
+        self.bm = bm
+        self.bm_key = key
+
+    def stop(self):
+        """Stop the network and any processes running on it."""
+        if self.net is not None:
+            self.net.stop()
+        self.net = None
+        self.net_key = None
+        self.setting = None
+        self.bm = None
+        self.bm_key = None
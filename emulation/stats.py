@@ -0,0 +1,37 @@
+"""
+The stopping rule of adaptive trials, shared by the emulation and the notebook,
+so that both decide the same number of trials. Only depends on the standard
+library, so that the notebook can import it without the emulation's
+dependencies.
+"""
+import math
+
+MIN_ADAPTIVE_TRIALS = 2
+
+# Two-sided 95% quantiles of Student's t-distribution, by degrees of freedom
+T_QUANTILES_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+Z_QUANTILE_95 = 1.960
+
+
+def median_ci(values):
+    """The median of the values and the half-width of its 95% confidence
+    interval, approximating the standard error of the median as
+    sqrt(pi/2) * s / sqrt(n) with the t quantile for n-1 degrees of freedom.
+    The half-width is infinite for fewer than two values.
+    """
+    values = sorted(values)
+    n = len(values)
+    if n == 0:
+        return (None, float('inf'))
+    median = (values[(n - 1) // 2] + values[n // 2]) / 2
+    if n < 2:
+        return (median, float('inf'))
+    mean = sum(values) / n
+    stdev = (sum((x - mean) ** 2 for x in values) / (n - 1)) ** 0.5
+    df = n - 1
+    t = T_QUANTILES_95[df - 1] if df <= len(T_QUANTILES_95) else Z_QUANTILE_95
+    return (median, t * (math.pi / 2) ** 0.5 * stdev / n ** 0.5)
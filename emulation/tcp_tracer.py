@@ -0,0 +1,81 @@
+"""
+Samples the TCP_INFO of the established connections to or from a port at a
+fixed interval with `ss`, and prints one JSON line per sample with at least
+one connection. Prints a JSON line when ready, and on SIGTERM, prints the
+overhead of the tracer as a final JSON line and exits.
+"""
+import argparse
+import json
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+from common import parse_ss_tcp_info
+
+
+def cpu_time():
+    """CPU time spent by the tracer, including the ss processes."""
+    cpu_s = 0
+    for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+        usage = resource.getrusage(who)
+        cpu_s += usage.ru_utime + usage.ru_stime
+    return cpu_s
+
+def overhead(start_time, start_cpu_s, num_samples):
+    """CPU time spent sampling since the tracer was ready."""
+    wall_s = time.monotonic() - start_time
+    cpu_s = cpu_time() - start_cpu_s
+    return {
+        'num_samples': num_samples,
+        'wall_s': wall_s,
+        'cpu_s': cpu_s,
+        'cpu_percent': 100 * cpu_s / wall_s if wall_s > 0 else 0,
+    }
+
+def run(port, interval_ms):
+    cmd = ['ss', '-tinH', 'state', 'established',
+           f'( sport = :{port} or dport = :{port} )']
+    start_time = time.monotonic()
+    start_cpu_s = cpu_time()
+    num_samples = 0
+
+    def stop(signum, frame):
+        print(json.dumps({
+            'overhead': overhead(start_time, start_cpu_s, num_samples),
+        }), flush=True)
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, stop)
+    print(json.dumps({ 'ready': True }), flush=True)
+
+    next_time = start_time
+    while True:
+        now = time.monotonic()
+        p = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+        connections = parse_ss_tcp_info(p.stdout)
+        if len(connections) > 0:
+            sample = {
+                'time_us': int((now - start_time) * 1000000),
+                'connections': connections,
+            }
+            print(json.dumps(sample), flush=True)
+        num_samples += 1
+
+        # Skip the samples we are too late for instead of catching up, which
+        # bounds the overhead by the sampling interval
+        next_time += interval_ms / 1000.
+        now = time.monotonic()
+        if next_time < now:
+            next_time = now + interval_ms / 1000.
+        time.sleep(next_time - now)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8443,
+        help='Port of the connections to trace')
+    parser.add_argument('--interval-ms', type=float, default=10,
+        help='Sampling interval, in ms')
+    args = parser.parse_args()
+    run(args.port, args.interval_ms)
@@ -73,6 +73,8 @@ class CLITestCase(unittest.TestCase):
         self.assertEqual(len(outputs), num_trials)
         for i in range(num_trials):
             self.assertTrue(outputs[i].get('success'), outputs[i])
+            self.assertIn('disk_write_bytes', outputs[i])
+            self.assertIn('sink_bytes', outputs[i])
         return outputs
 
 
@@ -131,3 +133,143 @@ class TestBenchmarkBBR(CLITestCase):
 
     def test_picoquic_quic_benchmark(self):
         self.execute_command_and_check('picoquic', [], ['-cca', 'bbr'])
+
+
+class TestBenchmarkTracing(CLITestCase):
+    def test_telemetry(self):
+        outputs = self.execute_command_and_check(
+            'tcp', ['--telemetry-interval', '10'], ['-n', '1M'])
+        telemetry = outputs[0]['additional_data']['telemetry']
+        self.assertGreater(telemetry['num_samples'], 0)
+        self.assertEqual(telemetry['columns'][0], 'time_us')
+
+    def test_tcp_info_with_pep(self):
+        outputs = self.execute_command_and_check(
+            'tcp', ['--pep', '--tcp-info-interval', '10'],
+            ['-cca', 'bbr', '-n', '1M'])
+        tcp_info = outputs[0]['additional_data']['tcp_info']
+        self.assertEqual(set(tcp_info['hosts'].keys()), {'h2', 'r1'})
+        for host in tcp_info['hosts'].values():
+            self.assertGreater(len(host['connections']), 0)
+            self.assertGreater(host['overhead']['num_samples'], 0)
+
+    def test_capture(self):
+        outputs = self.execute_command_and_check(
+            'tcp', ['--capture'], ['-n', '1M'])
+        capture = outputs[0]['additional_data']['capture']
+        self.assertEqual(capture['snaplen'], CAPTURE_SNAPLEN)
+        self.assertEqual(set(capture['ifaces'].keys()),
+                         {'h1-eth0', 'r1-eth0', 'r1-eth1', 'h2-eth0'})
+        for iface in capture['ifaces'].values():
+            self.assertGreater(len(iface['flows']), 0)
+        delays = capture['bridges']['h2-eth0 > r1-eth1']
+        self.assertGreater(delays['num_samples'], 0)
+
+
+class TestEarlyAbort(CLITestCase):
+    def test_linux_tcp_benchmark(self):
+        # 100 MB over the 10 Mbps bottleneck takes far longer than 10s
+        stdout, _ = self.execute_command(
+            'tcp', ['--timeout', '10', '--early-abort'], ['-n', '100M'])
+        output = self.parse_json_lines(stdout)[0]['outputs'][0]
+        self.assertTrue(output['timeout'])
+        self.assertTrue(output['aborted'])
+        self.assertGreater(output['progress']['min_time_s'], 10)
+        self.assertLess(output['progress']['time_s'], 10)
+        self.assertGreater(output['progress']['partial_throughput_mbps'], 0)
+
+    def test_picoquic_quic_benchmark(self):
+        stdout, _ = self.execute_command(
+            'picoquic', ['--timeout', '10', '--early-abort'], ['-n', '100M'])
+        output = self.parse_json_lines(stdout)[0]['outputs'][0]
+        self.assertTrue(output['timeout'])
+        self.assertTrue(output['aborted'])
+
+
+class TestSteadyState(CLITestCase):
+    def test_linux_tcp_benchmark(self):
+        outputs = self.execute_command_and_check(
+            'tcp', ['--steady-state'], ['-n', '10M'])
+        self.assertEqual(outputs[0]['progress']['columns'],
+                         ['time_us', 'bytes'])
+        self.assertIn('steady_state_goodput_mbps', outputs[0])
+
+    def test_steady_state_duration(self):
+        outputs = self.execute_command_and_check(
+            'tcp', ['--steady-state-duration', '3'], ['-n', '100M'])
+        self.assertTrue(outputs[0]['steady_state_ended'])
+        self.assertLess(outputs[0]['bytes'], 100000000)
+        self.assertIsNotNone(outputs[0]['steady_state_goodput_mbps'])
+
+
+class TestKTLS(CLITestCase):
+    def test_linux_tcp_benchmark(self):
+        stdout, _ = self.execute_command('tcp', ['--ktls'], ['-n', '1M'])
+        line = self.parse_json_lines(stdout)[0]
+        self.assertTrue(line['outputs'][0]['success'])
+        ktls = line['inputs']['ktls']
+        self.assertTrue(ktls['enabled'])
+        self.assertIn('server_tx', ktls)
+        self.assertIn('client_rx', ktls)
+
+
+class TestCompetition(CLITestCase):
+    def test_competition_benchmark(self):
+        outputs = self.execute_command_and_check(
+            'competition', [], ['-n', '5M', '-cca', 'bbr,cubic:1'])
+        flows = outputs[0]['flows']
+        self.assertEqual([flow['cca'] for flow in flows], ['bbr', 'cubic'])
+        self.assertEqual([flow['offset_s'] for flow in flows], [0, 1])
+        for flow in flows:
+            self.assertTrue(flow['success'])
+            self.assertIn('shared_throughput_mbps', flow)
+        self.assertGreaterEqual(outputs[0]['fairness_index'], 0.5)
+        self.assertLessEqual(outputs[0]['fairness_index'], 1)
+        self.assertGreater(outputs[0]['utilization'], 0)
+
+
+class TestClientAgent(CLITestCase):
+    def test_linux_tcp_benchmark(self):
+        stdout, _ = self.execute_command(
+            'tcp', ['--client-agent', '-t', '3'], ['-n', '1M'])
+        line = self.parse_json_lines(stdout)[0]
+        self.assertTrue(line['inputs']['client_agent'])
+        self.assertEqual(len(line['outputs']), 3)
+        for output in line['outputs']:
+            self.assertTrue(output['success'])
+            self.assertEqual(list(output['phases']), PHASES)
+            self.assertGreater(output['transfer_throughput_mbps'],
+                               output['throughput_mbps'])
+
+    def test_linux_tcp_benchmark_with_early_abort(self):
+        # The agent is restarted after an aborted request
+        stdout, _ = self.execute_command(
+            'tcp', ['--client-agent', '-t', '2', '--timeout', '10',
+                    '--early-abort'], ['-n', '100M'])
+        outputs = self.parse_json_lines(stdout)[0]['outputs']
+        self.assertEqual([output['aborted'] for output in outputs],
+                         [True, True])
+
+
+class TestJobs(CLITestCase):
+    def test_job_file(self):
+        # Two jobs on a single network bring-up, the second with its own
+        # network setting
+        jobs = [
+            {'protocol': 'tcp', 'label': 'tcp_cubic', 'n': '1M'},
+            {'protocol': 'picoquic', 'label': 'picoquic_cubic', 'n': '1M',
+             'trials': 2, 'network': {'delay1': 5}},
+        ]
+        jobfile = os.path.join(self.logdir, 'jobs.jsonl')
+        with open(jobfile, 'w') as f:
+            for job in jobs:
+                f.write(f'{json.dumps(job)}\n')
+        stdout, _ = self.execute_command('jobs', [], [jobfile])
+        lines = self.parse_json_lines(stdout)
+        self.assertEqual([line['inputs']['label'] for line in lines],
+                         ['tcp_cubic', 'picoquic_cubic'])
+        self.assertEqual([len(line['outputs']) for line in lines], [1, 2])
+        self.assertEqual(lines[1]['inputs']['network']['delay1'], 5)
+        for line in lines:
+            for output in line['outputs']:
+                self.assertTrue(output['success'], output)
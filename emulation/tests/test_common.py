@@ -3,6 +3,7 @@ Test common.py.
 """
 import unittest
 import subprocess
+import tempfile
 from common import *
 
 
@@ -31,9 +32,207 @@ class TestHelperFunctions(unittest.TestCase):
         self.assertEqual(actual_bytes, expected_bytes,
                          'calculated bdp in bytes')
 
+    def test_subnet_ip(self):
+        self.assertEqual(subnet_ip(0, 1, 10), '172.16.1.10')
+        self.assertEqual(subnet_ip(0, 2, 1), '172.16.2.1')
+        self.assertEqual(subnet_ip(3, 1, 10), '172.16.7.10')
+        self.assertEqual(subnet_ip(3, 2, 10), '172.16.8.10')
+        with self.assertRaises(AssertionError):
+            subnet_ip(0, 3, 10)
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(parse_cpu_list('3'), [3])
+        self.assertEqual(parse_cpu_list('2-5,8'), [2, 3, 4, 5, 8])
+        self.assertEqual(parse_cpu_list('8,0-1,1'), [0, 1, 8])
+        with self.assertRaises(ValueError):
+            parse_cpu_list('a-b')
+
+    def test_cpu_mask(self):
+        self.assertEqual(cpu_mask([0]), '00000001')
+        self.assertEqual(cpu_mask([2, 3, 4, 5, 8]), '0000013c')
+        self.assertEqual(cpu_mask([1, 33]), '00000002,00000002')
+
     def test_mac(self):
         self.assertEqual(mac(0), '00:00:00:00:00:00')
         self.assertEqual(mac(1), '00:00:00:00:00:01')
         self.assertEqual(mac(2), '00:00:00:00:00:02')
         with self.assertRaises(AssertionError):
             mac(9999999999999)
+
+    def test_parse_proc_net_dev(self):
+        contents = (
+            'Inter-|   Receive                                                |  Transmit\n'
+            ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n'
+            '    lo:       0       0    0    0    0     0          0         0        0       0    0    0    0     0       0          0\n'
+            'h1-eth0:1234567   890    1    2    0     0          0         0   654321     432    0    3    0     0       0          0\n'
+        )
+        stats = parse_proc_net_dev(contents)
+        self.assertEqual(list(stats.keys()), ['lo', 'h1-eth0'])
+        self.assertEqual(stats['h1-eth0']['rx_bytes'], 1234567)
+        self.assertEqual(stats['h1-eth0']['rx_packets'], 890)
+        self.assertEqual(stats['h1-eth0']['rx_dropped'], 2)
+        self.assertEqual(stats['h1-eth0']['tx_bytes'], 654321)
+        self.assertEqual(stats['h1-eth0']['tx_packets'], 432)
+        self.assertEqual(stats['h1-eth0']['tx_dropped'], 3)
+        self.assertEqual(stats['lo']['tx_bytes'], 0)
+
+    def test_parse_proc_net_sockets(self):
+        contents = (
+            '  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n'
+            '   0: 0A1002AC:20FB 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 12345 1\n'
+            '   1: 0A1002AC:20FB 0A1001AC:A95E 01 00000000:00000000 00:00000000 00000000     0        0 12346 1\n'
+            '   2: 00000000000000000000000000000000:1151 00000000000000000000000000000000:0000 07 00000000:00000000 00:00000000 00000000     0        0 12347 2\n'
+        )
+        self.assertEqual(parse_proc_net_sockets(contents, '0A'), {8443})
+        self.assertEqual(parse_proc_net_sockets(contents, '07'), {4433})
+        self.assertEqual(parse_proc_net_sockets(contents, '06'), set())
+
+    def test_parse_proc_diskstats(self):
+        contents = (
+            '   7       0 loop0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0\n'
+            ' 254       0 vda 7062 3911 1618138 6841 4670 4812 1029920 4691 0 2512 11812\n'
+            ' 254       1 vda1 7000 3900 1618000 6800 4600 4800 1029900 4600 0 2500 11800\n'
+        )
+        self.assertEqual(parse_proc_diskstats(contents), {
+            'loop0': 0,
+            'vda': 1029920 * DISKSTATS_SECTOR_SIZE,
+            'vda1': 1029900 * DISKSTATS_SECTOR_SIZE,
+        })
+
+    def test_parse_proc_io(self):
+        contents = (
+            'rchar: 2012\n'
+            'wchar: 1048576\n'
+            'syscr: 7\n'
+            'syscw: 256\n'
+            'read_bytes: 0\n'
+            'write_bytes: 4096\n'
+            'cancelled_write_bytes: 0\n'
+        )
+        counters = parse_proc_io(contents)
+        self.assertEqual(counters['wchar'], 1048576)
+        self.assertEqual(counters['write_bytes'], 4096)
+        self.assertEqual(len(counters), 7)
+
+    def test_wait_process_io(self):
+        p = subprocess.Popen(['dd', 'if=/dev/zero', 'of=/dev/null',
+                              'bs=4096', 'count=16'],
+                             stderr=subprocess.DEVNULL)
+        counters = wait_process_io(p)
+        self.assertEqual(p.wait(), 0)
+        if counters is None:
+            self.skipTest('no I/O accounting')
+        self.assertGreaterEqual(counters['wchar'], 16 * 4096)
+        self.assertIsNone(wait_process_io(p))
+
+    def test_parse_qdisc_stats(self):
+        qdiscs = [
+            {'kind': 'netem', 'handle': '2:', 'dev': 'e1-eth0', 'drops': 7,
+             'backlog': 0, 'qlen': 0, 'overlimits': 0},
+            {'kind': 'htb', 'handle': '3:', 'dev': 'e1-eth0', 'drops': 5,
+             'backlog': 3000, 'qlen': 2, 'overlimits': 11},
+            {'kind': 'red', 'handle': '11:', 'dev': 'e1-eth0', 'drops': 5,
+             'backlog': 3000, 'qlen': 2, 'marked': 4},
+            {'kind': 'netem', 'handle': '2:', 'dev': 'e1-eth1', 'drops': 0},
+        ]
+        stats = parse_qdisc_stats(qdiscs)
+        self.assertEqual(stats['e1-eth0'], {
+            'backlog': 3000,
+            'qlen': 2,
+            'drops': 5,
+            'overlimits': 11,
+            'marks': 4,
+            'loss_drops': 7,
+        })
+        self.assertEqual(stats['e1-eth1']['backlog'], 0)
+        self.assertEqual(parse_qdisc_stats([]), {})
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('1500000bps'), 1500000)
+        self.assertEqual(parse_rate('1.5Mbps'), 1500000)
+        self.assertEqual(parse_rate('77.2Kbps'), 77200)
+        self.assertEqual(parse_rate('2Gbps'), 2000000000)
+        with self.assertRaises(ValueError):
+            parse_rate('1.5Mb')
+
+    def test_parse_ss_tcp_info(self):
+        output = (
+            '0      0      172.16.2.10:8443 172.16.1.10:43358\n'
+            '\t bbr wscale:10,10 rto:204 rtt:52.1/0.5 mss:1448 cwnd:84 '
+            'bytes_sent:5 bbr:(bw:16.4Mbps,mrtt:50.2,pacing_gain:2.88672,'
+            'cwnd_gain:2.88672) send 18.6Mbps pacing_rate 47.3Mbps '
+            'delivery_rate 16.4Mbps delivered:2 retrans:0/3 minrtt:50.2\n'
+            '0      0      172.16.2.10:8443 172.16.1.10:43360\n'
+            '\t cubic wscale:10,10 rto:200 rtt:0.038/0.019 cwnd:10 '
+            'pacing_rate 197149604496bps\n'
+        )
+        connections = parse_ss_tcp_info(output)
+        self.assertEqual(len(connections), 2)
+        self.assertEqual(connections[0], {
+            'local': '172.16.2.10:8443',
+            'peer': '172.16.1.10:43358',
+            'srtt_ms': 52.1,
+            'cwnd': 84,
+            'bbr_bw_bps': 16400000,
+            'bbr_mrtt_ms': 50.2,
+            'bbr_pacing_gain': 2.88672,
+            'bbr_cwnd_gain': 2.88672,
+            'pacing_rate_bps': 47300000,
+            'delivery_rate_bps': 16400000,
+            'retrans': 3,
+        })
+        self.assertEqual(connections[1], {
+            'local': '172.16.2.10:8443',
+            'peer': '172.16.1.10:43360',
+            'srtt_ms': 0.038,
+            'cwnd': 10,
+            'pacing_rate_bps': 197149604496,
+        })
+        self.assertEqual(parse_ss_tcp_info(''), [])
+
+    def test_encode_columns(self):
+        columns = [[0, 10, 20, 35], [100, 90, 95, 1 << 40], [5, 5, 5, 5]]
+        encoded = encode_columns(columns)
+        self.assertIsInstance(encoded, str)
+        self.assertEqual(decode_columns(encoded, 3), columns)
+        self.assertEqual(decode_columns(encode_columns([[], []]), 2), [[], []])
+
+    def test_median_ci(self):
+        self.assertEqual(median_ci([]), (None, float('inf')))
+        self.assertEqual(median_ci([5.0]), (5.0, float('inf')))
+        median, halfwidth = median_ci([10.0, 12.0, 11.0])
+        self.assertEqual(median, 11.0)
+        self.assertAlmostEqual(halfwidth, 4.303 * 1.2533 * 1.0 / 3 ** 0.5,
+                               places=3)
+        median, halfwidth = median_ci([10.0, 10.0])
+        self.assertEqual((median, halfwidth), (10.0, 0.0))
+
+    def test_jain_fairness_index(self):
+        self.assertEqual(jain_fairness_index([5, 5, 5]), 1)
+        self.assertEqual(jain_fairness_index([10, 0]), 0.5)
+        self.assertAlmostEqual(jain_fairness_index([3, 1]), 0.8)
+        self.assertIsNone(jain_fairness_index([]))
+        self.assertIsNone(jain_fairness_index([0, 0]))
+
+    def test_parse_phases(self):
+        line = '[TIMING] connect_s=0.05 handshake_s=0.15 first_byte_s=0.2 '\
+               'last_byte_s=1.5'
+        self.assertEqual(parse_phases(line), {
+            'connect_s': 0.05, 'handshake_s': 0.15, 'first_byte_s': 0.2,
+            'last_byte_s': 1.5,
+        })
+        self.assertEqual(parse_phases('[TIMING] connect_s=0.05'),
+                         {'connect_s': 0.05})
+        self.assertIsNone(parse_phases('[TIMING] connect_s=abc'))
+        self.assertIsNone(parse_phases('[TCP_CLIENT] status_code=200'))
+
+    def test_read_json_file(self):
+        expected = [{'delay2': 50}, {'loss1': '2', 'qdisc': 'pie'}]
+        with tempfile.NamedTemporaryFile('w') as f:
+            f.write('[{"delay2": 50},\n {"loss1": "2", "qdisc": "pie"}]')
+            f.flush()
+            self.assertEqual(read_json_file(f.name), expected, 'json list')
+        with tempfile.NamedTemporaryFile('w') as f:
+            f.write('{"delay2": 50}\n\n{"loss1": "2", "qdisc": "pie"}\n')
+            f.flush()
+            self.assertEqual(read_json_file(f.name), expected, 'jsonl')
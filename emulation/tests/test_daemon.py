@@ -0,0 +1,85 @@
+"""
+Test daemon.py.
+"""
+import unittest
+import json
+import os
+import socket
+import stat
+import tempfile
+import threading
+
+from daemon import EmulationDaemon
+
+
+class FakeResult:
+    def __init__(self, job):
+        self.job = job
+
+    def dumps(self):
+        return json.dumps({'inputs': self.job, 'outputs': []})
+
+
+class FakeRunner:
+    """Runs jobs without a network, failing those without a protocol."""
+    def __init__(self):
+        self.jobs = []
+        self.num_stops = 0
+
+    def run(self, job):
+        if 'protocol' not in job:
+            raise ValueError('missing protocol')
+        self.jobs.append(job)
+        return FakeResult(job)
+
+    def stop(self):
+        self.num_stops += 1
+
+
+class TestEmulationDaemon(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'emulation.sock')
+        self.runner = FakeRunner()
+        self.daemon = EmulationDaemon(self.path, self.runner)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        self.daemon.server_close()
+        self._dir.cleanup()
+
+    def submit(self, lines):
+        """Submit the lines on one connection and return the responses."""
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            sock.sendall(''.join(f'{line}\n' for line in lines).encode())
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile() as f:
+                return [json.loads(line) for line in f]
+
+    def test_socket_is_private(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_jobs_on_one_connection(self):
+        jobs = [{'protocol': 'tcp', 'label': 'a'},
+                {'protocol': 'picoquic', 'label': 'b'}]
+        responses = self.submit([json.dumps(job) for job in jobs])
+        self.assertEqual([response['inputs'] for response in responses], jobs)
+        self.assertEqual(self.runner.jobs, jobs)
+
+    def test_invalid_jobs(self):
+        responses = self.submit([json.dumps({'label': 'a'}), 'not json',
+                                 json.dumps({'protocol': 'tcp'})])
+        self.assertEqual(len(responses), 3)
+        self.assertEqual(responses[0], {'error': 'missing protocol'})
+        self.assertIn('error', responses[1])
+        self.assertEqual(responses[2]['inputs'], {'protocol': 'tcp'})
+        # The network is not reused after a failed job
+        self.assertEqual(self.runner.num_stops, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
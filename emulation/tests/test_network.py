@@ -94,9 +94,11 @@ class NetworkTestCase(unittest.TestCase):
     def setUpTwoSegmentNetwork(
         self, delay1=1, delay2=10, loss1=0, loss2=0, bw1=50, bw2=10,
         qdisc='red', pacing=False, setup_time=0, cache=True,
+        batch_config=True, **kwargs,
     ) -> TwoSegmentNetwork:
         net = TwoSegmentNetwork(delay1, delay2, loss1, loss2, bw1, bw2,
-                                qdisc, pacing)
+                                qdisc, pacing, batch_config=batch_config,
+                                **kwargs)
         if cache:
             self.stopNetwork()
             self.net = net
@@ -107,9 +109,10 @@ class NetworkTestCase(unittest.TestCase):
 
     def setUpOneSegmentNetwork(
         self, delay=10, loss=0, bw=10, qdisc='red', pacing=False,
-        setup_time=0, cache=True,
+        setup_time=0, cache=True, batch_config=True,
     ) -> OneSegmentNetwork:
-        net = OneSegmentNetwork(delay, loss, bw, qdisc, pacing)
+        net = OneSegmentNetwork(delay, loss, bw, qdisc, pacing,
+                                batch_config=batch_config)
         if cache:
             self.stopNetwork()
             self.net = net
@@ -419,3 +422,146 @@ class TestPrepopulateArpTable(NetworkTestCase):
         net.start_tcpdump(logdir=self.logdir)
         time.sleep(1)
         self.check_arp_table_is_used(net, [net.h1, net.h2])
+
+
+class TestBatchConfig(NetworkTestCase):
+    def show(self, net):
+        """The qdiscs and neighbors of every interface in the network."""
+        config = {}
+        for iface, host in net.iface_to_host.items():
+            config[iface] = (
+                host.cmd(f'tc qdisc show dev {iface}'),
+                host.cmd(f'ip neigh show dev {iface}'),
+            )
+        return config
+
+    def test_batch_config_one_segment_network(self):
+        net = self.setUpOneSegmentNetwork(batch_config=False)
+        expected = self.show(net)
+        net = self.setUpOneSegmentNetwork(batch_config=True)
+        self.assertEqual(self.show(net), expected)
+        self.ping(net.h1, net.h2)
+
+    def test_batch_config_two_segment_network(self):
+        for qdisc in ['red', 'policer']:
+            net = self.setUpTwoSegmentNetwork(qdisc=qdisc, batch_config=False)
+            expected = self.show(net)
+            net = self.setUpTwoSegmentNetwork(qdisc=qdisc, batch_config=True)
+            self.assertEqual(self.show(net), expected)
+            self.ping(net.h1, net.h2)
+
+
+class TestReconfigure(NetworkTestCase):
+    def test_reconfigure_qdisc(self):
+        net = self.setUpTwoSegmentNetwork(qdisc='red')
+        for qdisc in ['pie', 'policer', 'fq_codel', None]:
+            net.reconfigure(1, 10, 0, 0, 50, 10, qdisc)
+            for iface in net.iface_to_qdisc:
+                host = net.iface_to_host[iface]
+                qdiscs = host.cmd(f'tc qdisc show dev {iface}')
+                filters = host.cmd(f'tc filter show dev {iface} parent 3:')
+                self.assertEqual('handle 11:' in qdiscs,
+                                 qdisc not in [None, 'policer'], qdiscs)
+                if qdisc not in [None, 'policer']:
+                    self.assertIn(f'qdisc {qdisc} 11:', qdiscs)
+                self.assertEqual('police' in filters, qdisc == 'policer')
+            self.ping(net.h1, net.h2)
+
+
+class TestStatistics(NetworkTestCase):
+    def test_snapshot_statistics(self):
+        net = self.setUpTwoSegmentNetwork()
+        net.reset_statistics()
+        snapshot = net.snapshot_statistics()
+        self.assertEqual(snapshot['ifaces'], sorted(net.iface_to_host.keys()))
+        for metric in net.METRICS:
+            self.assertEqual(snapshot[metric], [0] * len(snapshot['ifaces']))
+
+        self.ping(net.h1, net.h2, n=5)
+        snapshot = net.snapshot_statistics()
+        i = snapshot['ifaces'].index(net.name('h1-eth0'))
+        self.assertGreaterEqual(snapshot['tx_packets'][i], 5)
+        self.assertGreaterEqual(snapshot['rx_packets'][i], 5)
+        self.assertGreater(snapshot['tx_bytes'][i], 0)
+
+    def test_telemetry(self):
+        net = self.setUpTwoSegmentNetwork()
+        net.start_telemetry(interval_ms=10, duration_s=10)
+        self.ping(net.h1, net.h2, n=10, interval=0.05)
+        telemetry = net.stop_telemetry()
+        self.assertIsNone(net.stop_telemetry())
+
+        columns = telemetry['columns']
+        num_samples = telemetry['num_samples']
+        self.assertEqual(columns[0], 'time_us')
+        self.assertGreater(num_samples, 10)
+        data = decode_columns(telemetry['data'], len(columns))
+        self.assertEqual(len(data[0]), num_samples)
+        self.assertEqual(data[0], sorted(data[0]))
+        tx_packets = data[columns.index(f"{net.name('e1-eth1')}:tx_packets")]
+        self.assertGreaterEqual(tx_packets[-1] - tx_packets[0], 5)
+
+
+class TestReadiness(NetworkTestCase):
+    def test_wait_until_listening(self):
+        net = self.setUpTwoSegmentNetwork()
+        port = TCP_SERVER_PORT
+        with self.assertRaises(TimeoutError):
+            wait_until_listening(net.h2, port, 'tcp', timeout=0.1)
+        p, _ = net.popen(net.h2, f'python3 -m http.server {port}',
+                         background=True)
+        wait_until_listening(net.h2, port, 'tcp', process=p)
+        # The socket is only in the namespace of the host
+        self.assertIn(port, listening_ports(net.h2, 'tcp'))
+        self.assertNotIn(port, listening_ports(net.h1, 'tcp'))
+
+    def test_process_exits_before_listening(self):
+        net = self.setUpTwoSegmentNetwork()
+        p, _ = net.popen(net.h2, 'false', background=True)
+        with self.assertRaises(RuntimeError):
+            wait_until_listening(net.h2, TCP_SERVER_PORT, 'tcp', process=p)
+
+
+class TestCrossTraffic(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        # Run the cross traffic generator from the base repo
+        self._cwd = os.getcwd()
+        os.chdir('..')
+
+    def tearDown(self):
+        super().tearDown()
+        os.chdir(self._cwd)
+
+    def tx_bytes(self, net, iface):
+        snapshot = net.snapshot_statistics()
+        return snapshot['tx_bytes'][snapshot['ifaces'].index(net.name(iface))]
+
+    def test_cbr_on_each_segment(self):
+        for segment, iface in [(1, 'e1-eth0'), (2, 'e2-eth0')]:
+            net = self.setUpTwoSegmentNetwork(bw1=20, bw2=20, cross='cbr',
+                cross_segment=segment, cross_mbps=5)
+            net.reset_statistics()
+            time.sleep(2)
+            # The cross traffic shares the link towards the data receiver
+            mbps = 8 * self.tx_bytes(net, iface) / 1000000 / 2
+            self.assertGreater(mbps, 4)
+            self.assertLess(mbps, 6)
+            self.ping(net.h1, net.h2)
+
+    def test_reconfigure_cross_traffic(self):
+        net = self.setUpTwoSegmentNetwork(cross_hosts=True)
+        net.reset_statistics()
+        time.sleep(1)
+        self.assertLess(self.tx_bytes(net, 'e2-eth0'), 10000)
+
+        net.reconfigure(1, 10, 0, 0, 50, 10, 'red', cross='tcp',
+                        cross_segment=2, cross_flows=2)
+        time.sleep(1)
+        net.reset_statistics()
+        time.sleep(2)
+        mbps = 8 * self.tx_bytes(net, 'e2-eth0') / 1000000 / 2
+        self.assertGreater(mbps, 8)
+
+        net.reconfigure(1, 10, 0, 0, 50, 10, 'red')
+        self.assertIsNone(net.cross_traffic)
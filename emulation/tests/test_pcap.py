@@ -0,0 +1,129 @@
+"""
+Test pcap.py.
+"""
+import io
+import struct
+import unittest
+
+from common import *
+from pcap import *
+
+
+SERVER = ('10.0.2.10', 8443)
+CLIENT = ('10.0.1.10', 40000)
+
+
+def tcp_frame(src, dst, seq, ack, payload_len, ip_id=0, ttl=64):
+    """An Ethernet frame with the IPv4 and TCP headers of a segment, truncated
+    to the headers as if captured with a small snaplen.
+    """
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 40 + payload_len, ip_id, 0x4000,
+                     ttl, IPPROTO_TCP, 0,
+                     bytes(int(b) for b in src[0].split('.')),
+                     bytes(int(b) for b in dst[0].split('.')))
+    tcp = struct.pack('!HHIIBBHHH', src[1], dst[1], seq % SEQ_SPACE,
+                      ack % SEQ_SPACE, 5 << 4, 0x10, 65535, 0, 0)
+    return bytes(12) + struct.pack('!H', ETHERTYPE_IPV4) + ip + tcp
+
+def pcap_bytes(records):
+    data = struct.pack('<IHHiIII', PCAP_MAGIC_US, 2, 4, 0, 0, 128,
+                       LINKTYPE_ETHERNET)
+    for ts, frame in records:
+        data += struct.pack('<IIII', int(ts), round(ts % 1 * 1000000),
+                            len(frame), len(frame))
+        data += frame
+    return data
+
+
+class TestPcap(unittest.TestCase):
+    def test_iter_pcap(self):
+        frame = tcp_frame(SERVER, CLIENT, 1, 1, 1000)
+        data = pcap_bytes([(100.5, frame), (100.75, frame)])
+        copy = io.BytesIO()
+        records = list(iter_pcap(io.BytesIO(data), copy))
+        self.assertEqual([ts for ts, _, _ in records], [100.5, 100.75])
+        self.assertEqual(records[0][2], frame)
+        self.assertEqual(copy.getvalue(), data)
+
+        # A partial trailing record is ignored
+        records = list(iter_pcap(io.BytesIO(data[:-10])))
+        self.assertEqual(len(records), 1)
+
+    def test_parse_packet(self):
+        flow, payload_len, seq, ack, _ = parse_packet(
+            tcp_frame(SERVER, CLIENT, 5, 7, 1448))
+        self.assertEqual(flow, ('10.0.2.10', 8443, '10.0.1.10', 40000,
+                                IPPROTO_TCP))
+        self.assertEqual(payload_len, 1448)
+        self.assertEqual((seq, ack), (5, 7))
+        self.assertIsNone(parse_packet(bytes(20)))
+
+        # The identity does not change with the TTL
+        identity1 = parse_packet(tcp_frame(SERVER, CLIENT, 5, 7, 10, ttl=64))[-1]
+        identity2 = parse_packet(tcp_frame(SERVER, CLIENT, 5, 7, 10, ttl=63))[-1]
+        self.assertEqual(identity1, identity2)
+
+    def test_unwrap_seq(self):
+        self.assertEqual(unwrap_seq(10, 0), 10)
+        self.assertEqual(unwrap_seq(5, (1 << 32) - 5), (1 << 32) + 5)
+        self.assertEqual(unwrap_seq((1 << 32) - 5, 5), -5)
+
+    def test_flow_analyzer(self):
+        isn = (1 << 32) - 1000
+        analyzer = FlowAnalyzer(start_time=0, bin_ms=100)
+        packets = [
+            (0.00, tcp_frame(SERVER, CLIENT, isn, 1, 1000)),
+            (0.01, tcp_frame(SERVER, CLIENT, isn + 1000, 1, 1000)),
+            (0.05, tcp_frame(CLIENT, SERVER, 1, isn + 1000, 0)),
+            (0.15, tcp_frame(SERVER, CLIENT, isn + 1000, 1, 1000)),
+            (0.16, tcp_frame(SERVER, CLIENT, isn + 2000, 1, 1000)),
+            (0.22, tcp_frame(CLIENT, SERVER, 1, isn + 3000, 0)),
+        ]
+        for ts, frame in packets:
+            analyzer.add_packet(ts, parse_packet(frame))
+
+        flows = analyzer.summary()
+        self.assertEqual(len(flows), 1)
+        flow = flows[0]
+        self.assertEqual(flow['flow'], 'tcp 10.0.2.10:8443 > 10.0.1.10:40000')
+        self.assertEqual(flow['packets'], 4)
+        self.assertEqual(flow['bytes'], 4000)
+        self.assertEqual(flow['retransmissions'], 1)
+
+        # The retransmission is not goodput, and the ACK of the retransmitted
+        # data is not an RTT sample
+        columns = decode_columns(flow['data'], len(FLOW_COLUMNS))
+        self.assertEqual(columns, [
+            [0, 1, 2],
+            [2000, 1000, 0],
+            [1, 0, 1],
+            [50000, 0, 60000],
+            [50000, 0, 60000],
+        ])
+
+    def test_delay_matcher(self):
+        matcher = DelayMatcher(('r1-eth1', 'h2-eth0'), start_time=0, bin_ms=100)
+        for i in range(3):
+            sent = parse_packet(tcp_frame(SERVER, CLIENT, 1000 * i, 1, 1000,
+                                          ip_id=i, ttl=64))
+            received = parse_packet(tcp_frame(SERVER, CLIENT, 1000 * i, 1,
+                                              1000, ip_id=i, ttl=63))
+            # The receiving side may be analyzed first
+            if i == 1:
+                matcher.add_packet('r1-eth1', 0.025 + i * 0.01, received)
+                matcher.add_packet('h2-eth0', i * 0.01, sent)
+            else:
+                matcher.add_packet('h2-eth0', i * 0.01, sent)
+                matcher.add_packet('r1-eth1', 0.02 + i * 0.015, received)
+
+        summary = matcher.summary()
+        self.assertEqual(summary['r1-eth1 > h2-eth0']['num_samples'], 0)
+        delays = summary['h2-eth0 > r1-eth1']
+        self.assertEqual(delays['num_samples'], 3)
+        self.assertEqual(delays['base_delay_us'], 20000)
+        columns = decode_columns(delays['data'], len(DELAY_COLUMNS))
+        self.assertEqual(columns, [[0], [3], [25000], [30000]])
+
+
+if __name__ == '__main__':
+    unittest.main()
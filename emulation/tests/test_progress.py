@@ -0,0 +1,88 @@
+"""
+Test progress.py.
+"""
+import unittest
+
+from common import *
+from progress import *
+
+
+class TestProgress(unittest.TestCase):
+    def test_parse_progress(self):
+        self.assertEqual(parse_progress('[PROGRESS] bytes=1000 time_s=0.5\n'),
+                         (0.5, 1000))
+        self.assertIsNone(parse_progress('[TCP_CLIENT] status_code=200'))
+        self.assertIsNone(parse_progress('[PROGRESS] bytes=1000'))
+
+    def test_on_track(self):
+        # 1 MB/s for a 10 MB download completes in 10s of the 20s timeout
+        monitor = ProgressMonitor(10000000, timeout=20)
+        for i in range(1, 10):
+            self.assertFalse(monitor.update(i, i * 1000000))
+        self.assertFalse(monitor.aborted)
+        self.assertAlmostEqual(monitor.projected_time_s(), 10)
+
+    def test_hopeless(self):
+        # 1 MB/s for a 100 MB download would take 100s of the 20s timeout,
+        # which is certain once enough of the timeout has passed
+        monitor = ProgressMonitor(100000000, timeout=20)
+        aborted_at = None
+        for i in range(1, 10):
+            if monitor.update(i * 0.5, i * 500000):
+                aborted_at = i * 0.5
+                break
+        self.assertEqual(aborted_at, PROGRESS_MIN_EVENTS * 0.5)
+        self.assertTrue(monitor.abort.is_set())
+
+        summary = monitor.summary()
+        self.assertAlmostEqual(summary['partial_throughput_mbps'], 8)
+        self.assertAlmostEqual(summary['projected_time_s'], 100)
+        self.assertGreater(summary['min_time_s'], 20)
+        self.assertLess(summary['min_time_s'], summary['projected_time_s'])
+
+    def test_within_margin(self):
+        # Would miss the timeout at the current rate, but not at a rate within
+        # the margin of the peak rate
+        monitor = ProgressMonitor(25000000, timeout=20)
+        for i in range(1, 10):
+            self.assertFalse(monitor.update(i, i * 1000000))
+
+    def test_no_progress(self):
+        # Do not abort before any bytes are received, e.g., during setup
+        monitor = ProgressMonitor(1000000, timeout=20)
+        for i in range(1, 10):
+            self.assertFalse(monitor.update(i, 0))
+        self.assertIsNone(monitor.summary()['projected_time_s'])
+
+    def test_steady_state(self):
+        # Slow start doubles the goodput of each window until 1 MB/s
+        times, num_bytes = [], []
+        total = 0
+        for i in range(1, 61):
+            total += min(2 ** (i // 5) * 3125, 100000)
+            times.append(i * 0.1)
+            num_bytes.append(total)
+        start_s = steady_state_start(times, num_bytes, window_ms=500,
+                                     num_windows=4, tolerance=0.2)
+        self.assertAlmostEqual(start_s, 2.5)
+        self.assertAlmostEqual(
+            steady_state_goodput_mbps(times, num_bytes, start_s), 8)
+
+        # Not in steady state before enough windows
+        self.assertIsNone(steady_state_start(times[:30], num_bytes[:30],
+            window_ms=500, num_windows=4, tolerance=0.2))
+        self.assertIsNone(steady_state_start([], []))
+
+    def test_steady_state_duration(self):
+        monitor = ProgressMonitor(100000000, steady_state_duration=3)
+        for i in range(1, 100):
+            if monitor.update(i * 0.1, i * 100000):
+                break
+        self.assertTrue(monitor.steady_state_ended)
+        self.assertFalse(monitor.aborted)
+        self.assertEqual(monitor.steady_state_start_s, 0)
+        self.assertAlmostEqual(monitor.time_s, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Test qlog.py.
+"""
+import unittest
+import tempfile
+
+from common import *
+from qlog import *
+
+
+JSON_SEQ_QLOG = (
+    '\x1e{"qlog_version":"0.3","qlog_format":"JSON-SEQ","trace":'
+    '{"vantage_point":{"type":"server"}}}\n'
+    '\x1e{"time":0.0,"name":"transport:packet_sent","data":{}}\n'
+    '\x1e{"time":1.5,"name":"recovery:metrics_updated","data":'
+    '{"smoothed_rtt":52.0,"latest_rtt":52.0,"congestion_window":13500,'
+    '"bytes_in_flight":1200}}\n'
+    '\x1e{"time":2.0,"name":"recovery:metrics_updated","data":'
+    '{"bytes_in_flight":2400,"pacing_rate":1000000}}\n'
+    '\x1e{"time":2.5,"name":"recovery:metrics_updated","data":'
+    '{"bytes_in_flight":2400}}\n'
+    '\x1e{"time":3.25,"name":"recovery:packet_lost","data":'
+    '{"header":{"packet_number":3}}}\n'
+)
+
+JSON_QLOG = (
+    '{ "qlog_version": "draft-00", "title": "picoquic", "traces": [\n'
+    '{ "vantage_point": { "name": "backend-67", "type": "server" },\n'
+    '"title": "picoquic", "description": "0102030405060708",\n'
+    '"event_fields": ["relative_time", "path_id", "category", "event", "data"],\n'
+    '"configuration": {"time_units": "us"},\n'
+    '"common_fields": { "protocol_type": "QUIC_HTTP3", "reference_time": "1"},\n'
+    '"events": [\n'
+    '[0, 0, "transport", "datagram_received", { "byte_length": 1252}],\n'
+    '[1500, 0, "recovery", "metrics_updated", {"cwnd": 15360,"bytes_in_flight": 1200,"smoothed_rtt": 52000,"latest_rtt": 51000}],\n'
+    '[2500, 0, "recovery", "packet_lost", {"packet_type" : "1RTT", "packet_number" : 3}],\n'
+    '[3000, 0, "recovery", "metrics_updated", {"cwnd": 7680,"bytes_in_flight": 0}]]}]}\n'
+)
+
+CLIENT_QLOG = (
+    '\x1e{"qlog_version":"0.3","qlog_format":"JSON-SEQ","trace":'
+    '{"vantage_point":{"type":"client"}}}\n'
+    '\x1e{"time":0.5,"name":"transport:packet_sent","data":{}}\n'
+    '\x1e{"time":51.0,"name":"recovery:metrics_updated","data":'
+    '{"smoothed_rtt":50.0,"congestion_window":13500}}\n'
+    '\x1e{"time":101.0,"name":"transport:packet_received","data":'
+    '{"frames":[{"frame_type":"ack"},{"frame_type":"handshake_done"}]}}\n'
+    '\x1e{"time":151.0,"name":"transport:packet_received","data":'
+    '{"frames":[{"frame_type":"stream","stream_id":0,"length":1000}]}}\n'
+    '\x1e{"time":152.0,"name":"transport:packet_received","data":'
+    '{"frames":[{"frame_type":"stream","stream_id":3,"length":10}]}}\n'
+    '\x1e{"time":175.0,"name":"transport:packet_received","data":'
+    '{"frames":[{"frame_type":"stream","stream_id":0,"fin":true}]}}\n'
+)
+
+
+class TestQlog(unittest.TestCase):
+    def write(self, contents):
+        f = tempfile.NamedTemporaryFile('w', suffix='.qlog')
+        f.write(contents)
+        f.flush()
+        return f
+
+    def test_iter_json_seq_events(self):
+        with self.write(JSON_SEQ_QLOG) as f:
+            events = list(iter_qlog_events(f.name))
+        self.assertEqual(len(events), 5)
+        time_us, name, data = events[1]
+        self.assertEqual(time_us, 1500)
+        self.assertEqual(name, 'recovery:metrics_updated')
+        self.assertEqual(data['smoothed_rtt'], 52000)
+        self.assertEqual(events[4][:2], (3250, 'recovery:packet_lost'))
+
+    def test_iter_json_events(self):
+        with self.write(JSON_QLOG) as f:
+            events = list(iter_qlog_events(f.name))
+        self.assertEqual(len(events), 4)
+        self.assertEqual(events[0][:2], (0, 'transport:datagram_received'))
+        time_us, name, data = events[1]
+        self.assertEqual(time_us, 1500)
+        self.assertEqual(name, 'recovery:metrics_updated')
+        self.assertEqual(data['smoothed_rtt'], 52000)
+        self.assertEqual(events[3][:2], (3000, 'recovery:metrics_updated'))
+
+    def test_summarize_json_seq_qlog(self):
+        with self.write(JSON_SEQ_QLOG) as f:
+            summary = summarize_qlog(f.name)
+        self.assertEqual(summary['columns'], COLUMNS)
+        self.assertEqual(summary['num_samples'], 2)
+        self.assertEqual(decode_columns(summary['data'], len(COLUMNS)), [
+            [1500, 2000],
+            [13500, 13500],
+            [1200, 2400],
+            [52000, 52000],
+            [52000, 52000],
+            [0, 1000000],
+        ])
+        self.assertEqual(summary['num_losses'], 1)
+        self.assertEqual(decode_columns(summary['losses'], 1), [[3250]])
+
+    def test_summarize_json_qlog(self):
+        with self.write(JSON_QLOG) as f:
+            summary = summarize_qlog(f.name)
+        self.assertEqual(summary['num_samples'], 2)
+        columns = decode_columns(summary['data'], len(COLUMNS))
+        self.assertEqual(columns[0], [1500, 3000])
+        self.assertEqual(columns[1], [15360, 7680])
+        self.assertEqual(columns[2], [1200, 0])
+        self.assertEqual(columns[3], [52000, 52000])
+        self.assertEqual(decode_columns(summary['losses'], 1), [[2500]])
+
+    def test_summarize_client_qlog_phases(self):
+        with self.write(CLIENT_QLOG) as f:
+            self.assertEqual(qlog_vantage_point(f.name), 'client')
+            summary = summarize_qlog(f.name)
+        self.assertEqual(summary['vantage_point'], 'client')
+        self.assertEqual(summary['phases'], {
+            'connect_s': 0.0005,
+            'handshake_s': 0.101,
+            'first_byte_s': 0.151,
+            'last_byte_s': 0.175,
+        })
+
+    def test_summarize_server_qlog_without_phases(self):
+        with self.write(JSON_QLOG) as f:
+            self.assertEqual(qlog_vantage_point(f.name), 'server')
+            summary = summarize_qlog(f.name)
+        self.assertEqual(summary['vantage_point'], 'server')
+        self.assertNotIn('phases', summary)
+
+    def test_summarize_qlog_without_metrics(self):
+        with self.write('\x1e{"qlog_version":"0.3"}\n') as f:
+            self.assertIsNone(summarize_qlog(f.name))
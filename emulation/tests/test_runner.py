@@ -0,0 +1,67 @@
+"""
+Test runner.py.
+"""
+import unittest
+import os
+import tempfile
+
+from runner import EmulationRunner
+
+
+class TestEmulationRunner(unittest.TestCase):
+    def setUp(self):
+        # Run tests from the upper-level directory (the base repo)
+        self._cwd = os.getcwd()
+        os.chdir('..')
+        self._logdir = tempfile.TemporaryDirectory()
+        self.runner = EmulationRunner(self._logdir.name)
+
+    def tearDown(self):
+        self.runner.stop()
+        self._logdir.cleanup()
+        os.chdir(self._cwd)
+
+    def run_job(self, **job):
+        result = self.runner.run({'protocol': 'tcp', **job})
+        self.assertTrue(result.outputs[0]['success'], result.outputs[0])
+        return result
+
+    def warm(self):
+        """The network and the server process of the runner."""
+        return (self.runner.net, self.runner.bm.server_process[0])
+
+    def test_reuses_network_and_server(self):
+        self.run_job()
+        net, server = self.warm()
+        self.assertEqual(net.bottleneck_mbps, 10)
+        result = self.run_job(network={'delay1': 5, 'bw2': 20})
+        self.assertEqual(self.warm(), (net, server))
+        self.assertEqual(result.inputs['network']['delay1'], 5)
+        # The links were reconfigured in place
+        self.assertEqual(net.bottleneck_mbps, 20)
+
+    def test_restarts_server(self):
+        self.run_job()
+        net, server = self.warm()
+        self.run_job(n=20000)
+        self.assertIs(self.runner.net, net)
+        self.assertIsNot(self.runner.bm.server_process[0], server)
+
+    def test_rebuilds_network(self):
+        changes = [
+            {'topology': 'direct'},
+            {'protocol': 'cloudflare', 'cca': 'bbr'},
+            {'pep': True},
+            {'network': {'cross': 'cbr'}},
+        ]
+        for change in changes:
+            with self.subTest(**change):
+                self.run_job()
+                net, server = self.warm()
+                self.run_job(**change)
+                self.assertIsNot(self.runner.net, net)
+                self.assertIsNot(self.runner.bm.server_process[0], server)
+
+
+if __name__ == '__main__':
+    unittest.main()
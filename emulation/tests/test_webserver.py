@@ -0,0 +1,118 @@
+"""
+Test the HTTP server and client in webserver/ over the loopback interface.
+"""
+import unittest
+import os
+import socket
+import subprocess
+import tempfile
+import time
+
+from common import *
+from progress import parse_progress
+
+N = 1000000
+CHUNK_SIZE = 65536
+TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestWebserver(unittest.TestCase):
+    def setUp(self):
+        # Run tests from the upper-level directory (the base repo)
+        self._cwd = os.getcwd()
+        os.chdir('..')
+        self._certdir = tempfile.TemporaryDirectory()
+        self.certfile = os.path.join(self._certdir.name, 'cert.pem')
+        self.keyfile = os.path.join(self._certdir.name, 'cert.key')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048',
+                        '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                        '-keyout', self.keyfile, '-out', self.certfile],
+                       check=True, capture_output=True)
+        self.port = free_port()
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.terminate()
+            self.server.wait()
+        self._certdir.cleanup()
+        os.chdir(self._cwd)
+
+    def start_server(self, options=[]):
+        cmd = ['python3', 'webserver/http_server.py', '--server-port',
+               str(self.port), '-n', str(N), '--chunk-size', str(CHUNK_SIZE),
+               '--certfile', self.certfile, '--keyfile', self.keyfile]
+        self.server = subprocess.Popen(cmd + options,
+                                       stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            self.assertIsNone(self.server.poll(), 'server exited')
+            try:
+                socket.create_connection(('127.0.0.1', self.port)).close()
+                return
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+        self.fail('server did not start')
+
+    def start_client(self, options=[]):
+        cmd = ['python3', 'webserver/http_client.py', '--server-port',
+               str(self.port), '-n', str(N), '--progress-interval', '1']
+        return subprocess.Popen(cmd + options, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True)
+
+    def check_client(self, p):
+        """Check that the client downloaded all the bytes, and that its
+        progress, result, and timing lines parse.
+        """
+        stdout, stderr = p.communicate(timeout=TIMEOUT)
+        self.assertEqual(p.returncode, 0, stderr)
+        self.assertIn(f'Downloaded {N} bytes', stdout)
+
+        lines = stderr.splitlines()
+        progress = [parse_progress(line) for line in lines
+                    if line.startswith(PROGRESS_PREFIX)]
+        self.assertGreater(len(progress), 0)
+        self.assertNotIn(None, progress)
+        self.assertEqual(progress, sorted(progress))
+        self.assertLessEqual(progress[-1][1], N)
+
+        results = [line for line in lines if line.startswith('[TCP_CLIENT]')]
+        self.assertEqual(len(results), 1)
+        kvs = dict(kv.split('=') for kv in results[0].split()[1:])
+        self.assertEqual(int(kvs['status_code']), HTTP_OK_STATUSCODE)
+        self.assertAlmostEqual(float(kvs['end_s']) - float(kvs['start_s']),
+                               float(kvs['time_s']), places=3)
+
+        phases = [parse_phases(line) for line in lines
+                  if line.startswith(TIMING_PREFIX)]
+        self.assertEqual(len(phases), 1)
+        self.assertEqual(list(phases[0]), PHASES)
+        self.assertEqual([phases[0][phase] for phase in PHASES],
+                         sorted(phases[0].values()))
+        self.assertAlmostEqual(phases[0]['last_byte_s'],
+                               float(kvs['time_s']), places=3)
+
+    def test_no_tls(self):
+        self.start_server(['--no-tls'])
+        self.check_client(self.start_client(['--no-tls']))
+
+    def test_tls(self):
+        self.start_server()
+        self.check_client(self.start_client())
+
+    def test_concurrent(self):
+        self.start_server(['--concurrent'])
+        clients = [self.start_client() for _ in range(2)]
+        for p in clients:
+            self.check_client(p)
+
+
+if __name__ == '__main__':
+    unittest.main()
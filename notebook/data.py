@@ -1,14 +1,23 @@
 import os
 import json
 import select
+import socket
 import statistics
 import subprocess
+import tempfile
+import threading
 import time
 import sys
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
 from typing import List, Tuple, Dict, Optional
 
+# The stopping rule of adaptive trials is shared with the emulation
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from emulation.stats import MIN_ADAPTIVE_TRIALS, median_ci
+
 from common import WORKDIR
 from experiment import Treatment, NetworkSetting, DirectNetworkSetting, Experiment
 
@@ -25,6 +34,7 @@ class RawDataFile:
         self._treatment = treatment
         self._network_setting = network_setting
         base_dir = f'{data_home}/{network_setting.label()}'
+        self.base_dir = base_dir
         self.base_path = f'{base_dir}/{treatment.label()}'
         os.system(f'mkdir -p {base_dir}')
         os.system(f'touch {self.stdout_filename()}')
@@ -46,16 +56,55 @@ class RawDataFile:
     def fulllog_filename(self) -> str:
         return f'{self.base_path}.log'
 
-    def cmd(self, data_size: int, num_trials: int, timeout: Optional[int]):
+    def jobs_log_filename(self) -> str:
+        """Full log of the batches of jobs run in this network setting."""
+        return f'{self.base_dir}/jobs.log'
+
+    def _network_cmd(self, timeout: Optional[int], instance: Optional[int],
+                     cpus: Optional[str]):
         cmd = ['sudo -E python3 emulation/main.py']
         if timeout is not None:
             cmd.append('--timeout')
             cmd.append(str(timeout))
+        if instance is not None:
+            cmd.append('--instance')
+            cmd.append(str(instance))
+        if cpus is not None:
+            cmd.append('--cpus')
+            cmd.append(cpus)
         for key in self._network_setting.labels:
-            cmd.append(f'--{key}')
+            cmd.append(f"--{key.replace('_', '-')}")
             cmd.append(str(self._network_setting.settings[key]))
+        return cmd
+
+    def batch_cmd(self, job_filename: str, timeout: Optional[int],
+                  instance: Optional[int]=None, cpus: Optional[str]=None):
+        """Runs all jobs in the job file on the network setting of this file.
+        """
+        cmd = self._network_cmd(timeout, instance, cpus)
+        cmd.append('jobs')
+        cmd.append(job_filename)
+        return ' '.join(cmd)
+
+    def cmd(self, data_size: int, num_trials: int, timeout: Optional[int],
+            instance: Optional[int]=None, cpus: Optional[str]=None,
+            min_trials: Optional[int]=None, ci_target: Optional[float]=None,
+            early_abort: bool=False,
+            steady_state_duration: Optional[float]=None):
+        cmd = self._network_cmd(timeout, instance, cpus)
         cmd.append('-t')
         cmd.append(str(num_trials))
+        if ci_target is not None:
+            cmd.append('--ci-target')
+            cmd.append(str(ci_target))
+            if min_trials is not None:
+                cmd.append('--min-trials')
+                cmd.append(str(min_trials))
+        if early_abort:
+            cmd.append('--early-abort')
+        if steady_state_duration is not None:
+            cmd.append('--steady-state-duration')
+            cmd.append(str(steady_state_duration))
         cmd.append('--label')
         cmd.append(self._treatment.label())
         protocol = self._treatment.protocol
@@ -69,6 +118,42 @@ class RawDataFile:
         cmd.append(str(data_size))
         return ' '.join(cmd)
 
+    def job(self, data_size: int, num_trials: int, timeout: Optional[int],
+            min_trials: Optional[int]=None, ci_target: Optional[float]=None,
+            early_abort: bool=False,
+            steady_state_duration: Optional[float]=None):
+        """The same benchmark as cmd() as a job for the emulation daemon or a
+        job file.
+        """
+        settings = self._network_setting.settings
+        network = {}
+        for key in self._network_setting.labels:
+            if key != 'topology':
+                network[key] = settings[key]
+        job = {
+            'protocol': self._treatment.protocol,
+            'label': self._treatment.label(),
+            'n': data_size,
+            'trials': num_trials,
+            'topology': settings.get('topology', 'two_segment'),
+            'network': network,
+        }
+        if timeout is not None:
+            job['timeout'] = timeout
+        if ci_target is not None:
+            job['ci_target'] = ci_target
+            if min_trials is not None:
+                job['min_trials'] = min_trials
+        if early_abort:
+            job['early_abort'] = True
+        if steady_state_duration is not None:
+            job['steady_state_duration'] = steady_state_duration
+        if self._treatment.cca:
+            job['cca'] = self._treatment.cca
+        if self._treatment.protocol == 'tcp' and self._treatment.pep:
+            job['pep'] = True
+        return job
+
 
 class RawDataParser:
     def __init__(
@@ -162,9 +247,36 @@ class RawDataParser:
                 # then this counts as a valid data point.
                 # Later validation parses the data point for a metric.
                 timeout = self.exp.timeout
-                if timeout is not None and output['time_s'] >= timeout:
+                if timeout is None:
+                    continue
+                if output.get('aborted'):
+                    # An aborted trial could not have completed before its
+                    # earliest possible completion time
+                    min_time_s = output['progress']['min_time_s']
+                    if min_time_s is None or min_time_s >= timeout:
+                        yield (data_size, output)
+                elif output['time_s'] >= timeout:
                     yield (data_size, output)
 
+    def _num_missing(self, outputs: list) -> int:
+        """The number of trials missing from a data point with the <outputs>.
+        With adaptive trials, none are missing once the confidence interval of
+        the median throughput of all its successful trials, across every run
+        that collected them, has converged.
+        """
+        ci_target = self.exp.ci_target
+        if ci_target is not None:
+            min_trials = self.exp.min_trials
+            if min_trials is None:
+                min_trials = min(MIN_ADAPTIVE_TRIALS, self.exp.num_trials)
+            values = [output['throughput_mbps'] for output in outputs
+                      if output['success'] and 'throughput_mbps' in output]
+            median, halfwidth = median_ci(values)
+            if len(outputs) >= min_trials and median is not None and \
+                    halfwidth <= ci_target * median:
+                return 0
+        return max(self.exp.num_trials - len(outputs), 0)
+
     def _maybe_add(self, treatment: str, network_setting: str, data_size: int,
                   value) -> bool:
         # Don't add the value if it is not one of the requested data points
@@ -186,8 +298,54 @@ class RawDataParser:
 """For executing mininet commands to collect missing data.
 """
 class RawDataExecutor:
-    def __init__(self, timeout):
+    def __init__(self, timeout, num_workers: int=1, cpus_per_worker: int=0,
+                 daemon_socket: Optional[str]=None, batch: bool=False,
+                 min_trials: Optional[int]=None,
+                 ci_target: Optional[float]=None,
+                 early_abort: bool=False,
+                 steady_state_duration: Optional[float]=None):
+        """Parameters:
+        - num_workers: Number of emulations to run in parallel. Each worker
+          runs its own isolated network instance.
+        - cpus_per_worker: If positive, the number of dedicated cores to pin
+          the hosts of each worker's network to. Core 0 is left for the
+          harnesses and the rest of the system.
+        - daemon_socket: If provided, submits jobs to the emulation daemon
+          listening on this Unix socket instead of spawning a process per
+          chunk, e.g., started with `sudo -E python3 emulation/main.py daemon`.
+          With multiple workers, worker i submits to `<daemon_socket>.<i>`,
+          e.g., started with `--instance <i> daemon --socket <daemon_socket>.<i>`.
+          The socket is only accessible to root unless the daemon is started
+          with `daemon --socket-group <group>`, so a notebook that does not
+          run as root needs its user in that group.
+        - batch: Whether to group missing data by network setting and run
+          each group as one job file on a single network bring-up, instead of
+          spawning a process per chunk. Ignored if daemon_socket is provided.
+        - min_trials, ci_target: If ci_target is provided, the missing trials
+          of each data point run as one chunk that stops early once the
+          confidence interval of the median throughput converges, as in
+          Experiment.
+        - early_abort: Whether to abort trials that are certain to miss the
+          timeout, as in Experiment.
+        - steady_state_duration: If provided, end each transfer once it has
+          been in steady state for this many seconds, as in Experiment.
+        """
         self.timeout = timeout
+        self.early_abort = early_abort
+        self.steady_state_duration = steady_state_duration
+        self.min_trials = min_trials
+        self.ci_target = ci_target
+        self.num_workers = num_workers
+        self.cpus_per_worker = cpus_per_worker
+        self.daemon_socket = daemon_socket
+        self.batch = batch
+        self._lock = threading.Lock()
+
+    def _cpus(self, instance: Optional[int]) -> Optional[str]:
+        if self.cpus_per_worker <= 0:
+            return None
+        start = 1 + (0 if instance is None else instance) * self.cpus_per_worker
+        return f'{start}-{start + self.cpus_per_worker - 1}'
 
     def _collect_missing_data(
         self,
@@ -195,19 +353,121 @@ class RawDataExecutor:
         chunk_size: int=10,
     ):
         print(len(missing_data))
+        chunks = []
         for file, data_size, num_missing in missing_data:
+            if self.ci_target is not None:
+                # The stopping rule can only cover the trials of one chunk
+                chunks.append((file, data_size, num_missing))
+                continue
             remaining = num_missing
             while remaining != 0:
                 num_trials = min(chunk_size, remaining)
+                chunks.append((file, data_size, num_trials))
+                remaining -= num_trials
+
+        # Each task collects data on its own network bring-up
+        if self.batch and self.daemon_socket is None:
+            groups = defaultdict(list)
+            for chunk in chunks:
+                groups[chunk[0].network_setting()].append(chunk)
+            tasks = [lambda instance, group=group:
+                self._execute_batch(group, instance) for group in groups.values()]
+        else:
+            tasks = [lambda instance, chunk=chunk:
+                self._execute_chunk(*chunk, instance) for chunk in chunks]
+
+        if self.num_workers == 1:
+            for task in tasks:
                 start = time.time()
-                self._execute_chunk(file, data_size, num_trials)
+                task(None)
                 print(time.time() - start)
-                remaining -= num_trials
+            return
+
+        # Hand out tasks to the workers, each with its own network instance
+        instances = Queue()
+        for instance in range(self.num_workers):
+            instances.put(instance)
 
-    def _execute_chunk(self, file: RawDataFile, data_size: int, num_trials: int):
+        def execute(task):
+            instance = instances.get()
+            try:
+                start = time.time()
+                task(instance)
+                print(f'[{instance}] {time.time() - start}')
+            finally:
+                instances.put(instance)
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            futures = [pool.submit(execute, task) for task in tasks]
+            for future in futures:
+                future.result()
+
+    def _execute_chunk(self, file: RawDataFile, data_size: int, num_trials: int,
+                       instance: Optional[int]=None):
+        if self.daemon_socket is not None:
+            self._submit_chunk(file, data_size, num_trials, instance)
+            return
+
+        cmd = file.cmd(data_size, num_trials, timeout=self.timeout,
+                       instance=instance, cpus=self._cpus(instance),
+                       min_trials=self.min_trials, ci_target=self.ci_target,
+                       early_abort=self.early_abort,
+                       steady_state_duration=self.steady_state_duration)
+        print(cmd, end=' ' if instance is None else '\n')
+        self._execute_cmd(
+            cmd,
+            stdout_filename=lambda line: file.stdout_filename(),
+            stderr_filename=file.stderr_filename(),
+            fulllog_filename=file.fulllog_filename(),
+        )
+
+    def _execute_batch(self, chunks: List[Tuple[RawDataFile, int, int]],
+                       instance: Optional[int]=None):
+        """Run the chunks, which share the same network setting, as one job
+        file. Results are appended to the file of the treatment in their label.
+        """
+        files = {}
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl',
+                                         delete=False) as f:
+            job_filename = f.name
+            for file, data_size, num_trials in chunks:
+                files[file.treatment()] = file
+                job = file.job(data_size, num_trials, timeout=self.timeout,
+                               min_trials=self.min_trials,
+                               ci_target=self.ci_target,
+                               early_abort=self.early_abort,
+                               steady_state_duration=self.steady_state_duration)
+                f.write(f'{json.dumps(job)}\n')
+
+        def stdout_filename(line):
+            try:
+                label = json.loads(line)['inputs']['label']
+                return files[label].stdout_filename()
+            except Exception:
+                return None
+
+        file = chunks[0][0]
+        cmd = file.batch_cmd(job_filename, timeout=self.timeout,
+                             instance=instance, cpus=self._cpus(instance))
+        print(f'{cmd} ({len(chunks)} jobs)', end=' ' if instance is None else '\n')
+        try:
+            self._execute_cmd(
+                cmd,
+                stdout_filename=stdout_filename,
+                stderr_filename=file.jobs_log_filename(),
+                fulllog_filename=file.jobs_log_filename(),
+            )
+        finally:
+            os.remove(job_filename)
+
+    def _execute_cmd(self, cmd: str, stdout_filename, stderr_filename: str,
+                     fulllog_filename: str):
+        """Execute the command and append its output to the logfiles. The
+        stdout_filename function returns the logfile of each line of stdout.
+        Parallel workers may append to the same logfiles, so write whole lines
+        at a time.
+        """
         # Start the process
-        cmd = file.cmd(data_size, num_trials, timeout=self.timeout)
-        print(cmd, end=' ')
         p = subprocess.Popen(
             cmd.split(' '),
             stdout=subprocess.PIPE,
@@ -216,29 +476,33 @@ class RawDataExecutor:
             text=True,
         )
 
-        # Write process output to the appropriate logfiles
-        with open(file.stdout_filename(), 'a') as stdout,\
-             open(file.stderr_filename(), 'a') as stderr,\
-             open(file.fulllog_filename(), 'a') as fulllog:
-            while p.poll() is None:
-                ready, _, _ = select.select([p.stdout, p.stderr], [], [])
-                for stream in ready:
-                    line = stream.readline()
-                    if not line:
+        def write(line, stream):
+            filenames = [fulllog_filename]
+            if stream == p.stdout:
+                filenames.append(stdout_filename(line))
+            if stream == p.stderr:
+                filenames.append(stderr_filename)
+            with self._lock:
+                for filename in set(filenames):
+                    if filename is None:
                         continue
-                    if stream == p.stdout:
-                        stdout.write(line)
-                    if stream == p.stderr:
-                        stderr.write(line)
-                    fulllog.write(line)
+                    with open(filename, 'a') as f:
+                        f.write(line)
 
-            # Flush remaining data after process exit
-            for line in p.stdout:
-                stdout.write(line)
-                fulllog.write(line)
-            for line in p.stderr:
-                stderr.write(line)
-                fulllog.write(line)
+        # Write process output to the appropriate logfiles
+        while p.poll() is None:
+            ready, _, _ = select.select([p.stdout, p.stderr], [], [])
+            for stream in ready:
+                line = stream.readline()
+                if not line:
+                    continue
+                write(line, stream)
+
+        # Flush remaining data after process exit
+        for line in p.stdout:
+            write(line, p.stdout)
+        for line in p.stderr:
+            write(line, p.stderr)
 
         # Cleanup the process
         exitcode = p.wait()
@@ -246,6 +510,37 @@ class RawDataExecutor:
             print(f'execute error: {exitcode}')
             sys.exit(1)
 
+    def _submit_chunk(self, file: RawDataFile, data_size: int, num_trials: int,
+                      instance: Optional[int]=None):
+        path = self.daemon_socket
+        if instance is not None:
+            path = f'{path}.{instance}'
+        job = file.job(data_size, num_trials, timeout=self.timeout,
+                       min_trials=self.min_trials, ci_target=self.ci_target,
+                       early_abort=self.early_abort,
+                       steady_state_duration=self.steady_state_duration)
+        print(f'{path} {json.dumps(job)}', end=' ' if instance is None else '\n')
+
+        # The daemon replies with one line per job
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(f'{json.dumps(job)}\n'.encode('utf-8'))
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile('r') as f:
+                lines = f.readlines()
+
+        with self._lock:
+            with open(file.stdout_filename(), 'a') as stdout,\
+                 open(file.stderr_filename(), 'a') as stderr,\
+                 open(file.fulllog_filename(), 'a') as fulllog:
+                for line in lines:
+                    fulllog.write(line)
+                    if 'error' in json.loads(line):
+                        stderr.write(line)
+                        print(f'execute error: {line}')
+                        sys.exit(1)
+                    stdout.write(line)
+
 
 class RawData(RawDataParser, RawDataExecutor):
     def __init__(
@@ -256,6 +551,10 @@ class RawData(RawDataParser, RawDataExecutor):
         max_data_sizes: Dict[str, int]={},
         max_networks: Dict[str, int]={},
         data_suffix: str='',
+        num_workers: int=1,
+        cpus_per_worker: int=0,
+        daemon_socket: Optional[str]=None,
+        batch: bool=False,
     ):
         """Parameters:
         - execute: Whether to collect missing data points.
@@ -272,6 +571,14 @@ class RawData(RawDataParser, RawDataExecutor):
           sizes.
         - data_suffix: The suffix of the directory to {WORKDIR}/data in
           which to parse raw data.
+        - num_workers: Number of emulations to run in parallel when collecting
+          missing data points.
+        - cpus_per_worker: If positive, the number of dedicated cores to pin
+          the hosts of each emulation to.
+        - daemon_socket: If provided, collects missing data points by
+          submitting jobs to the emulation daemon on this Unix socket.
+        - batch: Whether to collect the missing data points of each network
+          setting with a single network bring-up.
         """
         if len(data_suffix) > 0:
             data_home = f'{DEFAULT_DATA_HOME}/{data_suffix}'
@@ -279,7 +586,11 @@ class RawData(RawDataParser, RawDataExecutor):
             data_home = DEFAULT_DATA_HOME
         RawDataParser.__init__(self, exp, max_data_sizes=max_data_sizes,
             max_networks=max_networks, data_home=data_home)
-        RawDataExecutor.__init__(self, exp.timeout)
+        RawDataExecutor.__init__(self, exp.timeout, num_workers=num_workers,
+            cpus_per_worker=cpus_per_worker, daemon_socket=daemon_socket,
+            batch=batch, min_trials=exp.min_trials, ci_target=exp.ci_target,
+            early_abort=exp.early_abort,
+            steady_state_duration=exp.steady_state_duration)
 
         for i in range(max_retries):
             missing_data = self._find_missing_data()
@@ -303,8 +614,7 @@ class RawData(RawDataParser, RawDataExecutor):
                     continue
                 file = RawDataFile(treatment, network_setting, self.data_home)
                 for data_size, size_data in sorted(network_data.items()):
-                    num_results = len(size_data)
-                    num_missing = self.exp.num_trials - num_results
+                    num_missing = self._num_missing(size_data)
                     if num_missing > 0:
                         missing_data.append((file, data_size, num_missing))
         return missing_data
@@ -318,6 +628,10 @@ class DirectRawData(RawDataParser, RawDataExecutor):
         max_retries=10,
         max_num_timeouts=1,
         data_suffix: str='',
+        num_workers: int=1,
+        cpus_per_worker: int=0,
+        daemon_socket: Optional[str]=None,
+        batch: bool=False,
     ):
         """Parameters:
         - execute: Whether to collect missing data points.
@@ -325,6 +639,14 @@ class DirectRawData(RawDataParser, RawDataExecutor):
           points after the first attempt.
         - data_suffix: The suffix of the directory to {WORKDIR}/data in
           which to parse raw data.
+        - num_workers: Number of emulations to run in parallel when collecting
+          missing data points.
+        - cpus_per_worker: If positive, the number of dedicated cores to pin
+          the hosts of each emulation to.
+        - daemon_socket: If provided, collects missing data points by
+          submitting jobs to the emulation daemon on this Unix socket.
+        - batch: Whether to collect the missing data points of each network
+          setting with a single network bring-up.
         """
         if len(data_suffix) > 0:
             data_home = f'{DEFAULT_DATA_HOME}/{data_suffix}'
@@ -332,7 +654,11 @@ class DirectRawData(RawDataParser, RawDataExecutor):
             data_home = DEFAULT_DATA_HOME
         RawDataParser.__init__(self, exp, max_data_sizes={}, max_networks={},
             data_home=data_home)
-        RawDataExecutor.__init__(self, exp.timeout)
+        RawDataExecutor.__init__(self, exp.timeout, num_workers=num_workers,
+            cpus_per_worker=cpus_per_worker, daemon_socket=daemon_socket,
+            batch=batch, min_trials=exp.min_trials, ci_target=exp.ci_target,
+            early_abort=exp.early_abort,
+            steady_state_duration=exp.steady_state_duration)
 
         for i in range(max_retries):
             treatments = self.exp.get_treatments()
@@ -390,7 +716,7 @@ class DirectRawData(RawDataParser, RawDataExecutor):
 
             # If there are any trials remaining, then execute the data point
             # (and don't explore more).
-            num_missing = self.exp.num_trials - len(outputs)
+            num_missing = self._num_missing(outputs)
             if num_missing > 0:
                 file = RawDataFile(treatment, ns, self.data_home)
                 missing_data.append((file, data_size, num_missing))
@@ -77,14 +77,24 @@ class NetworkSetting:
         'bw1': 100,
         'bw2': 10,
         'qdisc': None,
+        'cross': None,
+        'cross_segment': 2,
+        'cross_mbps': 5,
+        'cross_flows': 1,
     }
 
     def __init__(self, delay1: Optional[int]=None, delay2: Optional[int]=None,
                  loss1: Optional[str]=None, loss2: Optional[str]=None,
                  bw1: Optional[int]=None, bw2: Optional[int]=None,
-                 qdisc: Optional[str]=None):
+                 qdisc: Optional[str]=None, cross: Optional[str]=None,
+                 cross_segment: Optional[int]=None,
+                 cross_mbps: Optional[float]=None,
+                 cross_flows: Optional[int]=None):
         """
         Labels is a list of setting names that are different from default.
+
+        The cross traffic settings, like the qdisc, are only part of the
+        settings and the label if provided, e.g., cross='cbr', cross_mbps=5.
         """
         self.settings = {
             'delay1': delay1,
@@ -96,6 +106,15 @@ class NetworkSetting:
         }
         if qdisc is not None:
             self.settings['qdisc'] = qdisc
+        cross_settings = {
+            'cross': cross,
+            'cross_segment': cross_segment,
+            'cross_mbps': cross_mbps,
+            'cross_flows': cross_flows,
+        }
+        for key, value in cross_settings.items():
+            if value is not None:
+                self.settings[key] = value
         self.labels = []
         for key, value in sorted(self.settings.items()):
             if value == NetworkSetting.DEFAULTS[key]:
@@ -124,6 +143,11 @@ class NetworkSetting:
             bw1=self.settings['bw2'],
             bw2=self.settings['bw1'],
             qdisc=self.settings.get('qdisc'),
+            cross=self.settings.get('cross'),
+            cross_segment=None if 'cross_segment' not in self.settings else
+                3 - self.settings['cross_segment'],
+            cross_mbps=self.settings.get('cross_mbps'),
+            cross_flows=self.settings.get('cross_flows'),
         )
 
     def clone(self):
@@ -164,7 +188,11 @@ class Experiment:
                  network_losses: List[str]=[],
                  network_delays: List[int]=[],
                  network_bws: List[int]=[],
-                 cartesian: bool=True):
+                 cartesian: bool=True,
+                 min_trials: Optional[int]=None,
+                 ci_target: Optional[float]=None,
+                 early_abort: bool=False,
+                 steady_state_duration: Optional[float]=None):
         """Parameters:
         - network_settings: List of network settings to test in the experiment.
           Typically used if varying data size as the test parameter. If empty,
@@ -182,8 +210,22 @@ class Experiment:
         - cartesian: If True, takes the Cartesian product of network settings
           and data sizes in the experiment. If False, zips the network settings
           and data sizes one-to-one.
+        - ci_target: If provided, `num_trials` is the maximum number of trials
+          of each data point, and its trials stop once the half-width of the
+          95% confidence interval of the median throughput is at most this
+          fraction of the median, after at least `min_trials` trials.
+        - early_abort: With `timeout`, whether to abort each trial as soon as
+          it is certain to miss the timeout, instead of waiting for it.
+        - steady_state_duration: If provided, end each transfer once it has
+          been in steady state for this many seconds, so the throughput of a
+          trial does not depend on a data size long enough to amortize the
+          startup phase.
         """
         self.num_trials = num_trials
+        self.min_trials = min_trials
+        self.ci_target = ci_target
+        self.early_abort = early_abort
+        self.steady_state_duration = steady_state_duration
         self.treatments = [x.label() for x in treatments]
 
         if len(network_settings) > 0:
@@ -0,0 +1,108 @@
+"""
+Test data.py.
+"""
+import unittest
+import json
+import tempfile
+from types import SimpleNamespace
+
+from data import RawDataExecutor, RawDataFile, RawDataParser, median_ci
+from experiment import LinuxTCPTreatment, NetworkSetting
+
+
+def output(throughput_mbps, success=True):
+    return {'success': success, 'throughput_mbps': throughput_mbps}
+
+
+class TestNumMissing(unittest.TestCase):
+    def parser(self, num_trials=30, ci_target=None, min_trials=None):
+        parser = RawDataParser.__new__(RawDataParser)
+        parser.exp = SimpleNamespace(num_trials=num_trials,
+                                     ci_target=ci_target,
+                                     min_trials=min_trials)
+        return parser
+
+    def test_fixed_trials(self):
+        parser = self.parser()
+        self.assertEqual(parser._num_missing([]), 30)
+        self.assertEqual(parser._num_missing([output(10.0)] * 12), 18)
+        self.assertEqual(parser._num_missing([output(10.0)] * 31), 0)
+
+    def test_converged_record(self):
+        # A record of 3 trials converged within 5%, in addition to the trials
+        # of an earlier run that are far apart
+        converged = [output(10.0), output(10.1), output(9.9)]
+        parser = self.parser(ci_target=0.05)
+        self.assertEqual(parser._num_missing(converged), 0)
+        earlier = [output(2.0), output(20.0)]
+        self.assertEqual(parser._num_missing(earlier + converged), 25)
+
+    def test_min_trials(self):
+        parser = self.parser(ci_target=0.05, min_trials=5)
+        self.assertEqual(parser._num_missing([output(10.0)] * 4), 26)
+        self.assertEqual(parser._num_missing([output(10.0)] * 5), 0)
+
+    def test_failed_trials_are_not_in_ci(self):
+        parser = self.parser(ci_target=0.05)
+        outputs = [output(10.0), output(0.1, success=False)]
+        self.assertEqual(parser._num_missing(outputs), 28)
+
+    def test_median_ci(self):
+        self.assertEqual(median_ci([]), (None, float('inf')))
+        self.assertEqual(median_ci([5.0]), (5.0, float('inf')))
+        median, halfwidth = median_ci([10.0, 12.0, 11.0])
+        self.assertEqual(median, 11.0)
+        self.assertAlmostEqual(halfwidth, 4.303 * 1.2533 * 1.0 / 3 ** 0.5,
+                               places=3)
+
+    def test_median_ci_is_the_emulation_rule(self):
+        # An even number of values, whose median is between two of them
+        from emulation.stats import median_ci as emulation_median_ci
+        values = [10.0, 13.0, 11.5, 12.0]
+        self.assertEqual(median_ci(values), emulation_median_ci(values))
+        self.assertEqual(median_ci(values)[0], 11.75)
+
+
+class TestExecuteBatch(unittest.TestCase):
+    def setUp(self):
+        self._data_home = tempfile.TemporaryDirectory()
+        setting = NetworkSetting(delay1=5)
+        self.files = [
+            RawDataFile(LinuxTCPTreatment(cca='cubic', label='tcp_cubic'),
+                        setting, self._data_home.name),
+            RawDataFile(LinuxTCPTreatment(cca='bbr', label='tcp_bbr1'),
+                        setting, self._data_home.name),
+        ]
+
+    def tearDown(self):
+        self._data_home.cleanup()
+
+    def test_results_go_to_their_treatment(self):
+        executor = RawDataExecutor(timeout=None, batch=True)
+
+        def execute_cmd(cmd, stdout_filename, stderr_filename,
+                        fulllog_filename):
+            # The jobs emulation/main.py would run, with their results in
+            # the reverse order and other output in between
+            self.assertIn(' jobs ', cmd)
+            with open(cmd.split()[-1]) as f:
+                jobs = [json.loads(line) for line in f]
+            self.assertEqual([job['label'] for job in jobs],
+                             ['tcp_cubic', 'tcp_bbr1'])
+            lines = ['Downloaded 1000 bytes\n']
+            lines += [json.dumps({'inputs': {'label': job['label']},
+                                  'outputs': []}) + '\n'
+                      for job in reversed(jobs)]
+            for line in lines:
+                filename = stdout_filename(line)
+                if filename is not None:
+                    with open(filename, 'a') as f:
+                        f.write(line)
+        executor._execute_cmd = execute_cmd
+
+        executor._execute_batch([(file, 1000, 2) for file in self.files])
+        for file in self.files:
+            with open(file.stdout_filename()) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual(lines, [{'inputs': {'label': file.treatment()},
+                                      'outputs': []}])
@@ -0,0 +1,118 @@
+"""
+Test pcap_analysis.py.
+"""
+import os
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from pcap_analysis import *
+from pcap_analysis import _record_offsets, _record_offsets_loop
+
+
+def tcp_frame(seq, payload_len, tsval=None, vlan=False):
+    """An Ethernet frame with the IPv4 and TCP headers of a segment from
+    172.16.2.10:8443 to 172.16.1.10:40000, and optionally the timestamp
+    option, followed by the payload.
+    """
+    opts = b''
+    if tsval is not None:
+        opts = bytes([TCPOPT_NOP, TCPOPT_NOP, TCPOPT_TIMESTAMP, 10]) + \
+            struct.pack('!II', tsval, tsval - 1)
+    ip = struct.pack('!BBHHHBBHII', 0x45, 0, 40 + len(opts) + payload_len,
+                     seq & 0xffff, 0x4000, 64, IPPROTO_TCP, 0, 0xac10020a,
+                     0xac10010a)
+    tcp = struct.pack('!HHIIBBHHH', 8443, 40000, seq, 1,
+                      (5 + len(opts) // 4) << 4, 0x10, 65535, 0, 0)
+    eth = bytes(12)
+    if vlan:
+        eth += struct.pack('!HH', ETHERTYPE_VLAN, 5)
+    eth += struct.pack('!H', ETHERTYPE_IPV4)
+    return eth + ip + tcp + opts + bytes(payload_len)
+
+def udp_frame(payload_len):
+    ip = struct.pack('!BBHHHBBHII', 0x45, 0, 28 + payload_len, 0, 0, 64,
+                     IPPROTO_UDP, 0, 0xac10010a, 0xac10020a)
+    udp = struct.pack('!HHHH', 5000, 4433, 8 + payload_len, 0)
+    return bytes(12) + struct.pack('!H', ETHERTYPE_IPV4) + ip + udp + \
+        bytes(payload_len)
+
+def pcap_bytes(records, snaplen=128):
+    data = [struct.pack('<IHHiIII', PCAP_MAGIC_US, 2, 4, 0, 0, snaplen,
+                        LINKTYPE_ETHERNET)]
+    for ts, frame in records:
+        captured = frame[:snaplen]
+        data.append(struct.pack('<IIII', int(ts), round(ts % 1 * 1000000),
+                                len(captured), len(frame)))
+        data.append(captured)
+    return b''.join(data)
+
+
+class TestReadPcap(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'h1-eth0.pcap')
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def test_read_pcap(self):
+        self.write(pcap_bytes([
+            (100.5, tcp_frame(1000, 1448, tsval=7)),
+            (100.75, udp_frame(1200)),
+            (101.0, tcp_frame(2448, 0, vlan=True)),
+            (101.25, bytes(12) + b'\x08\x06' + bytes(28)),
+        ]))
+        packets = read_pcap(self.path)
+        self.assertEqual(list(packets['time']), [100.5, 100.75, 101.0])
+        self.assertEqual(list(packets['proto']),
+                         [IPPROTO_TCP, IPPROTO_UDP, IPPROTO_TCP])
+        self.assertEqual(list(packets['length']), [1448, 1200, 0])
+        self.assertEqual(list(packets['seq']), [1000, 0, 2448])
+        self.assertEqual(list(packets['has_ts']), [True, False, False])
+        self.assertEqual(packets['tsval'][0], 7)
+        self.assertEqual(flow_str(packets[0]),
+                         'tcp 172.16.2.10:8443 > 172.16.1.10:40000')
+
+    def test_record_offsets(self):
+        # Large enough to walk the records of many blocks at once, with
+        # records of different lengths and a partial trailing record
+        rng = np.random.default_rng(0)
+        records = []
+        for i in range(20000):
+            if rng.random() < 0.1:
+                frame = udp_frame(int(rng.integers(0, 100)))
+            else:
+                frame = tcp_frame(i, int(rng.choice([0, 100, 1448])),
+                                  tsval=i + 1)
+            records.append((100 + i / 1000, frame))
+        data = pcap_bytes(records)
+        self.write(data + data[24:40])
+        buf = np.memmap(self.path, dtype=np.uint8, mode='r')
+        self.assertGreaterEqual(len(buf) // PCAP_MIN_BLOCK, PCAP_MIN_WALKERS)
+        offsets = _record_offsets(buf, True, 1e6, 128)
+        self.assertEqual(len(offsets), len(records))
+        self.assertTrue(np.array_equal(offsets,
+                                       _record_offsets_loop(buf, True)))
+        self.assertEqual(len(read_pcap(self.path)), len(records))
+
+    def test_record_offsets_with_fake_records(self):
+        # Payloads that look like record headers mislead the guesses of
+        # where the records of each block start
+        fake = struct.pack('<IIII', 100, 5, 60, 60) * 100
+        records = [(100 + i / 1000, tcp_frame(i, 0)[:54] + fake[:i % 1400])
+                   for i in range(5000)]
+        self.write(pcap_bytes(records, snaplen=1514))
+        buf = np.memmap(self.path, dtype=np.uint8, mode='r')
+        self.assertTrue(np.array_equal(_record_offsets(buf, True, 1e6, 1514),
+                                       _record_offsets_loop(buf, True)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import argparse
+import random
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+DATAGRAM_SIZE = 1200
+CHUNK_SIZE = 65536
+
+class SinkHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while self.request.recv(CHUNK_SIZE):
+            pass
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+def sink(port):
+    """Discard the TCP streams and UDP datagrams received on the port."""
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(('0.0.0.0', port))
+    def discard_datagrams():
+        while True:
+            udp.recv(CHUNK_SIZE)
+    threading.Thread(target=discard_datagrams, daemon=True).start()
+    server = SinkServer(('0.0.0.0', port), SinkHandler)
+    print(f'[CROSS_TRAFFIC] sink port={port}', file=sys.stderr, flush=True)
+    server.serve_forever()
+
+def cbr(dst, port, mbps):
+    """Send UDP datagrams at a constant bitrate of <mbps>."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    payload = bytes(DATAGRAM_SIZE)
+    interval = DATAGRAM_SIZE * 8 / (mbps * 1000000)
+    next_time = time.monotonic()
+    while True:
+        try:
+            sock.sendto(payload, (dst, port))
+        except OSError:
+            # e.g., ENOBUFS when the local queue is full
+            pass
+        next_time += interval
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+def send_flow(dst, port, num_bytes):
+    """Send <num_bytes> over a new TCP connection, or forever if None."""
+    chunk = memoryview(bytes(CHUNK_SIZE))
+    try:
+        with socket.create_connection((dst, port)) as sock:
+            while num_bytes is None or num_bytes > 0:
+                n = CHUNK_SIZE if num_bytes is None else \
+                    min(CHUNK_SIZE, num_bytes)
+                sock.sendall(chunk[:n])
+                if num_bytes is not None:
+                    num_bytes -= n
+    except OSError as e:
+        print(f'[CROSS_TRAFFIC] flow error {e}', file=sys.stderr, flush=True)
+
+def web(dst, port, mbps, mean_bytes, shape):
+    """Start TCP flows with Poisson arrivals and Pareto-distributed sizes
+    with a mean of <mean_bytes>, for an average offered load of <mbps>.
+    """
+    arrival_rate = mbps * 1000000 / 8 / mean_bytes
+    scale = mean_bytes * (shape - 1) / shape
+    while True:
+        time.sleep(random.expovariate(arrival_rate))
+        num_bytes = int(scale * random.paretovariate(shape))
+        threading.Thread(target=send_flow, args=(dst, port, num_bytes),
+                         daemon=True).start()
+
+def bulk(dst, port, flows):
+    """Send on <flows> long-lived TCP connections."""
+    threads = [threading.Thread(target=send_flow, args=(dst, port, None),
+                                daemon=True) for _ in range(flows)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Background cross-traffic generator',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('mode', choices=['sink', 'cbr', 'web', 'tcp'],
+        help='Receive cross traffic, or send constant bitrate UDP, web-like '
+             'TCP flows with Poisson arrivals, or long-lived TCP flows')
+    parser.add_argument('--dst', type=str, default='127.0.0.1',
+        help='IP address of the sink')
+    parser.add_argument('--port', type=int, default=5201)
+    parser.add_argument('--mbps', type=float, default=5,
+        help='Bitrate of cbr, or average offered load of web')
+    parser.add_argument('--flows', type=int, default=1,
+        help='Number of long-lived TCP flows')
+    parser.add_argument('--mean-bytes', type=int, default=100000,
+        help='Mean size of the web flows')
+    parser.add_argument('--shape', type=float, default=1.5,
+        help='Pareto shape of the web flow sizes')
+    args = parser.parse_args()
+
+    if args.mode == 'sink':
+        sink(args.port)
+    elif args.mode == 'cbr':
+        cbr(args.dst, args.port, args.mbps)
+    elif args.mode == 'web':
+        web(args.dst, args.port, args.mbps, args.mean_bytes, args.shape)
+    else:
+        bulk(args.dst, args.port, args.flows)
@@ -4,37 +4,117 @@ import ssl
 import sys
 import time
 
-def run(server_ip, server_port, n, verbose):
+from ktls import enable_ktls, ktls_state
+
+CHUNK_SIZE = 65536
+
+def ssl_context(ktls=False):
     # Set up an SSL context to ignore self-signed certificate warnings
     # For testing purposes, disable certificate verification
     ctx = ssl.create_default_context()
     ctx.check_hostname = False
     ctx.verify_mode = ssl.CERT_NONE
+    if ktls:
+        enable_ktls(ctx)
+    return ctx
 
-    # Send a GET request to the server
+def run(server_ip, server_port, n, verbose, progress_interval=None, tls=True,
+        ktls=False, cca=None, ctx=None, buf=None):
+    if tls and ctx is None:
+        ctx = ssl_context(ktls)
+    if buf is None:
+        buf = bytearray(CHUNK_SIZE)
+
+    # Connect and complete the TLS handshake separately from the request, to
+    # time each phase
     start = time.monotonic()
-    conn = http.client.HTTPSConnection(server_ip, server_port, context=ctx)
-    conn.request('GET', f'/?n={n}')
+    start_wall = time.time()
+    conn = http.client.HTTPConnection(server_ip, server_port)
+    conn.connect()
+    connect_s = time.monotonic() - start
+    if tls:
+        conn.sock = ctx.wrap_socket(conn.sock, server_hostname=server_ip)
+    handshake_s = time.monotonic() - start
 
-    # Get the response from the server
+    # Send a GET request to the server
+    path = f'/?n={n}' if cca is None else f'/?n={n}&cca={cca}'
+    conn.request('GET', path)
+    if tls and ktls:
+        print(ktls_state(conn.sock), file=sys.stderr, flush=True)
+
+    # Get the response from the server, draining the body into the same
+    # buffer so that memory stays flat regardless of its size, and reporting
+    # the number of bytes received so far at every progress interval, if
+    # provided, on a fixed schedule from the start
     response = conn.getresponse()
-    raw_bytes = response.read()
+    first_byte_s = time.monotonic() - start
+    view = memoryview(buf)
+    head = b''
+    num_bytes = 0
+    next_progress = start
+    while True:
+        size = response.readinto(view)
+        if not size:
+            break
+        if verbose and len(head) < 1024:
+            head += bytes(view[:min(size, 1024 - len(head))])
+        num_bytes += size
+        if progress_interval is None:
+            continue
+        now = time.monotonic()
+        if now >= next_progress:
+            print(f'[PROGRESS] bytes={num_bytes} time_s={now - start}',
+                  file=sys.stderr, flush=True)
+            interval = progress_interval / 1000
+            next_progress += interval * ((now - next_progress) // interval + 1)
     end = time.monotonic()
     if verbose:
         print('Status:', response.status)
         print('Headers:')
         for k, v in response.getheaders():
             print(f'\t{k}: {v}')
-        print('Body:', raw_bytes[:min(len(raw_bytes), 1024)])
-    print(f'Downloaded {len(raw_bytes)} bytes')
+        print('Body:', head)
+    print(f'Downloaded {num_bytes} bytes')
+    print(
+        f'[TCP_CLIENT] status_code={response.status} time_s={end - start} '
+        f'start_s={start_wall} end_s={start_wall + end - start}',
+        file=sys.stderr, flush=True,
+    )
     print(
-        f'[TCP_CLIENT] status_code={response.status} time_s={end - start}',
-        file=sys.stderr,
+        f'[TIMING] connect_s={connect_s} handshake_s={handshake_s} '
+        f'first_byte_s={first_byte_s} last_byte_s={end - start}',
+        file=sys.stderr, flush=True,
     )
 
     # Close the connection
     conn.close()
 
+def agent(parser):
+    """Serve requests from stdin until EOF, one line of the same arguments as
+    the command line per request, e.g., "-n 1000000 --progress-interval 100",
+    without the interpreter startup, imports, and TLS context creation of a
+    new process per request, and reusing one receive buffer. Prints
+    [AGENT] ready once it accepts requests, and [AGENT] done after each
+    request.
+    """
+    # Keep the output of each request in order on one stream
+    sys.stdout = sys.stderr
+    contexts = {}
+    buf = bytearray(CHUNK_SIZE)
+    print('[AGENT] ready', file=sys.stderr, flush=True)
+    for line in sys.stdin:
+        try:
+            args = parser.parse_args(line.split())
+            tls = not args.no_tls
+            if tls and args.ktls not in contexts:
+                contexts[args.ktls] = ssl_context(args.ktls)
+            run(args.server_ip, args.server_port, args.n, args.verbose,
+                args.progress_interval, tls=tls, ktls=args.ktls, cca=args.cca,
+                ctx=contexts.get(args.ktls), buf=buf)
+        except (Exception, SystemExit) as e:
+            print(f'[AGENT] error {e!r}', file=sys.stderr, flush=True)
+        print('[AGENT] done', file=sys.stderr, flush=True)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='HTTPS TCP client',
@@ -45,5 +125,22 @@ if __name__ == '__main__':
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-n', type=int, default=1000000,
         help='Number of bytes to request, 1e6 is 1 MB')
+    parser.add_argument('--progress-interval', type=float, metavar='MS',
+        help='If provided, print the number of bytes received so far to '
+             'stderr at this interval')
+    parser.add_argument('--no-tls', action='store_true',
+        help='Request over plain HTTP')
+    parser.add_argument('--ktls', action='store_true',
+        help='Offload TLS record decryption to the kernel if supported')
+    parser.add_argument('--cca', type=str,
+        help='Congestion control algorithm for the server to send with, '
+             'instead of its default')
+    parser.add_argument('--agent', action='store_true',
+        help='Read the arguments of each request from a line of stdin')
     args = parser.parse_args()
-    run(args.server_ip, args.server_port, args.n, args.verbose)
+    if args.agent:
+        agent(parser)
+        sys.exit(0)
+    run(args.server_ip, args.server_port, args.n, args.verbose,
+        args.progress_interval, tls=not args.no_tls, ktls=args.ktls,
+        cca=args.cca)
@@ -1,16 +1,40 @@
 import argparse
 import http.server
+import mmap
+import socket
 import ssl
 import sys
 import os
+import tempfile
+import time
 from urllib.parse import urlparse, parse_qs
 
+from ktls import TLS_TX, enable_ktls, ktls_active, ktls_state
+
 DEFAULT_CERTFILE = f'{os.environ["HOME"]}/connection-splitting/deps/certs/out/leaf_cert.pem'
 DEFAULT_KEYFILE  = f'{os.environ["HOME"]}/connection-splitting/deps/certs/out/leaf_cert.key'
-CACHE = b''
+DEFAULT_CHUNK_SIZE = 262144
+
+# The response data is a memory-mapped payload file, so that the server
+# memory stays constant regardless of the number of bytes requested, and
+# responses are written in chunks of memoryview slices without copying
+PAYLOAD = None
+CACHE = memoryview(b'')
+CHUNK_SIZE = DEFAULT_CHUNK_SIZE
+TLS = True
+KTLS = False
 
 # Set up a basic request handler
 class SimpleHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    def setup(self):
+        # Do the TLS handshake in the thread handling the connection, instead
+        # of in accept(), so that concurrent handshakes do not block each other
+        self.accept_time = time.time()
+        if TLS:
+            self.request.do_handshake()
+        self.handshake_time = time.time()
+        super().setup()
+
     def do_GET(self):
         global CACHE
         # Parse query param to determine number of bytes to send
@@ -19,13 +43,20 @@ class SimpleHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             params = parse_qs(path.query)
             n = int(params['n'][0])
             assert n > 0
+
+            # Use the requested congestion control algorithm for this
+            # connection instead of the system default, if provided
+            if 'cca' in params:
+                self.connection.setsockopt(socket.IPPROTO_TCP,
+                    socket.TCP_CONGESTION, params['cca'][0].encode())
         except Exception as e:
             print(e, file=sys.stderr)
             # Send a 400 Bad Request response
             self.send_response(400)
             self.send_header('Content-Type', 'text/plain')
             self.end_headers()
-            self.wfile.write(b'Invalid request. Use GET /?n=<positive int>')
+            self.wfile.write(b'Invalid request. Use GET /?n=<positive int>'
+                             b'[&cca=<available CCA>]')
             return
 
         if n > len(CACHE):
@@ -40,24 +71,80 @@ class SimpleHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Content-Type', 'application/octet-stream')
             self.send_header('Content-Length', str(n))
             self.end_headers()
-            self.wfile.write(CACHE[:n])
+            start_time = time.time()
+            self.send_payload(n)
+            end_time = time.time()
+
+            # Log the send timestamps of the connection, in seconds since the
+            # epoch, and when the last byte was written to the socket
+            client_ip, client_port = self.client_address[:2]
+            cca = self.connection.getsockopt(socket.IPPROTO_TCP,
+                socket.TCP_CONGESTION, 16).rstrip(b'\0').decode()
+            print(f'[CONNECTION] client={client_ip}:{client_port} bytes={n} '
+                  f'cca={cca} '
+                  f'accept_s={self.accept_time:.6f} '
+                  f'handshake_s={self.handshake_time:.6f} '
+                  f'start_s={start_time:.6f} end_s={end_time:.6f}',
+                  file=sys.stderr, flush=True)
+
+    def send_payload(self, n):
+        if not TLS:
+            # Send from the page cache without copying to user space
+            self.connection.sendfile(PAYLOAD, offset=0, count=n)
+            return
+        if KTLS:
+            print(ktls_state(self.connection), file=sys.stderr, flush=True)
+            if ktls_active(self.connection, TLS_TX):
+                # The kernel encrypts the records, so also send from the
+                # page cache, bypassing OpenSSL
+                self.sendfile_ktls(n)
+                return
+        for i in range(0, n, CHUNK_SIZE):
+            self.wfile.write(CACHE[i:min(i + CHUNK_SIZE, n)])
+
+    def sendfile_ktls(self, n):
+        offset = 0
+        while offset < n:
+            sent = os.sendfile(self.connection.fileno(), PAYLOAD.fileno(),
+                               offset, n - offset)
+            if sent == 0:
+                break
+            offset += sent
 
 # Initialize the response data cache
 def init_cache(n):
-    global CACHE
-    CACHE = os.urandom(n)
+    global PAYLOAD, CACHE
+    PAYLOAD = tempfile.TemporaryFile()
+    for i in range(0, n, DEFAULT_CHUNK_SIZE):
+        PAYLOAD.write(os.urandom(min(DEFAULT_CHUNK_SIZE, n - i)))
+    PAYLOAD.flush()
+    CACHE = memoryview(mmap.mmap(PAYLOAD.fileno(), n, access=mmap.ACCESS_READ))
+
+# Serves each connection in its own thread, sharing the payload
+class ConcurrentHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
 
-# Set up the HTTPS server
-def run(server_ip, server_port, certfile, keyfile):
+# Set up the HTTPS server, or HTTP server if TLS is disabled
+def run(server_ip, server_port, certfile, keyfile, concurrent=False):
     server_address = (server_ip, server_port)
-    httpd = http.server.HTTPServer(server_address, SimpleHTTPRequestHandler)
+    if concurrent:
+        httpd = ConcurrentHTTPServer(server_address, SimpleHTTPRequestHandler)
+    else:
+        httpd = http.server.HTTPServer(server_address, SimpleHTTPRequestHandler)
 
-    # Wrap the socket with SSL
-    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    ctx.load_cert_chain(certfile=certfile, keyfile=keyfile)
-    httpd.socket = ctx.wrap_socket(httpd.socket, server_side=True)
+    # Wrap the socket with SSL, if enabled
+    scheme = 'http'
+    if TLS:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(certfile=certfile, keyfile=keyfile)
+        if KTLS:
+            enable_ktls(ctx)
+        httpd.socket = ctx.wrap_socket(httpd.socket, server_side=True,
+                                       do_handshake_on_connect=False)
+        scheme = 'https'
 
-    print(f'Serving on https://{server_ip}:{server_port}', file=sys.stderr)
+    print(f'Serving on {scheme}://{server_ip}:{server_port}', file=sys.stderr)
     httpd.serve_forever()
 
 if __name__ == '__main__':
@@ -71,8 +158,21 @@ if __name__ == '__main__':
     parser.add_argument('--keyfile', type=str, default=DEFAULT_KEYFILE)
     parser.add_argument('-n', type=int, default=1000000,
         help='Number of random bytes to initialize in the cache, 1e6 is 1 MB')
-    parser.add_argument('--chunk-size', type=int, required=False)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+        help='Number of bytes to write to the socket at a time')
+    parser.add_argument('--no-tls', action='store_true',
+        help='Serve plain HTTP, sending the response with sendfile()')
+    parser.add_argument('--ktls', action='store_true',
+        help='Offload TLS record encryption to the kernel if supported, '
+             'sending the response with sendfile()')
+    parser.add_argument('--concurrent', action='store_true',
+        help='Serve each connection in its own thread, e.g., for multiple '
+             'competing flows')
     args = parser.parse_args()
 
+    CHUNK_SIZE = args.chunk_size
+    TLS = not args.no_tls
+    KTLS = args.ktls
     init_cache(args.n)
-    run(args.server_ip, args.server_port, args.certfile, args.keyfile)
+    run(args.server_ip, args.server_port, args.certfile, args.keyfile,
+        concurrent=args.concurrent)
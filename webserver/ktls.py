@@ -0,0 +1,31 @@
+"""
+Kernel TLS (kTLS) offload for the Python HTTPS server and client. With
+OpenSSL 3 built with kTLS support and the Linux `tls` module loaded, OpenSSL
+hands the record encryption of a connection to the kernel after the
+handshake, and the server can sendfile() the response on the TLS socket.
+"""
+import socket
+import ssl
+
+# SSL_OP_ENABLE_KTLS, exported by the ssl module since Python 3.12
+OP_ENABLE_KTLS = getattr(ssl, 'OP_ENABLE_KTLS', 1 << 3)
+SOL_TLS = getattr(socket, 'SOL_TLS', 282)
+TLS_TX = 1
+TLS_RX = 2
+
+def enable_ktls(ctx):
+    ctx.options |= OP_ENABLE_KTLS
+
+def ktls_active(sock, direction):
+    """Whether the kernel encrypts (TLS_TX) or decrypts (TLS_RX) the records
+    of the TLS connection on the socket.
+    """
+    try:
+        sock.getsockopt(SOL_TLS, direction, 4)
+        return True
+    except OSError:
+        return False
+
+def ktls_state(sock):
+    return f'[KTLS] tx={int(ktls_active(sock, TLS_TX))} '\
+           f'rx={int(ktls_active(sock, TLS_RX))}'
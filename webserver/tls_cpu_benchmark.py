@@ -0,0 +1,98 @@
+"""
+Measures the CPU cost per GB of the HTTPS server and client on the local
+host, with userspace TLS and with kTLS, and plain HTTP for reference. Each
+mode starts a server, downloads the payload a number of times over loopback,
+and reports the CPU seconds of each process per GB downloaded.
+
+    python3 webserver/tls_cpu_benchmark.py -n 1000000000 --certfile ... --keyfile ...
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+KTLS_PATTERN = r'\[KTLS\] tx=(\d) rx=(\d)'
+MODES = {
+    'tls': [],
+    'ktls': ['--ktls'],
+    'plain': ['--no-tls'],
+}
+
+def cpu_seconds(pid):
+    """The user and system CPU seconds of a running process."""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    ticks = os.sysconf('SC_CLK_TCK')
+    return (int(fields[11]) + int(fields[12])) / ticks
+
+def start_server(args, options):
+    cmd = [sys.executable, f'{os.path.dirname(__file__)}/http_server.py',
+           '--server-port', str(args.port), '--certfile', args.certfile,
+           '--keyfile', args.keyfile, '-n', str(args.n)] + options
+    server = subprocess.Popen(cmd, stderr=subprocess.PIPE, text=True)
+    for line in server.stderr:
+        if 'Serving' in line:
+            return server
+    raise RuntimeError(f'server exited with {server.wait()}')
+
+def run_client(args, options):
+    """Returns the CPU seconds, runtime, and stderr of the client."""
+    cmd = [sys.executable, f'{os.path.dirname(__file__)}/http_client.py',
+           '--server-port', str(args.port), '-n', str(args.n)] + options
+    client = subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, text=True)
+    stderr = client.stderr.read()
+    _, status, rusage = os.wait4(client.pid, 0)
+    client.returncode = os.waitstatus_to_exitcode(status)
+    if client.returncode != 0:
+        raise RuntimeError(f'client exited with {client.returncode}: {stderr}')
+    time_s = float(re.search(r'time_s=([\d.]+)', stderr).group(1))
+    return rusage.ru_utime + rusage.ru_stime, time_s, stderr
+
+def run_mode(args, mode):
+    options = MODES[mode]
+    server = start_server(args, options)
+    try:
+        server_cpu_s = cpu_seconds(server.pid)
+        client_cpu_s = 0.
+        total_time_s = 0.
+        client_state = None
+        for _ in range(args.trials):
+            cpu_s, time_s, stderr = run_client(args, options)
+            client_cpu_s += cpu_s
+            total_time_s += time_s
+            client_state = re.search(KTLS_PATTERN, stderr)
+        # Let the server finish closing the last connection
+        time.sleep(0.1)
+        server_cpu_s = cpu_seconds(server.pid) - server_cpu_s
+    finally:
+        server.terminate()
+        server.wait()
+    server_state = re.search(KTLS_PATTERN, server.stderr.read())
+
+    gb = args.n * args.trials / 1e9
+    print(f'{mode:>6}: server {server_cpu_s / gb:.3f} CPU s/GB, '
+          f'client {client_cpu_s / gb:.3f} CPU s/GB, '
+          f'{8 * gb / total_time_s:.2f} Gbit/s')
+    if server_state is not None and client_state is not None:
+        print(f'        kTLS server tx={server_state.group(1)}, '
+              f'client rx={client_state.group(2)}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='CPU cost per GB of userspace TLS vs. kTLS',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', type=str, default='deps/certs/out/leaf_cert.pem')
+    parser.add_argument('--keyfile', type=str, default='deps/certs/out/leaf_cert.key')
+    parser.add_argument('-n', type=int, default=1000000000,
+        help='Number of bytes to download per trial')
+    parser.add_argument('-t', '--trials', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', choices=MODES.keys(),
+                        default=list(MODES.keys()))
+    args = parser.parse_args()
+    for mode in args.modes:
+        run_mode(args, mode)